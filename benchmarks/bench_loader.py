@@ -0,0 +1,81 @@
+"""Compares loading the dashboard's customers and orders with sequential pd.read_sql vs common/loader.py.
+
+Generated data is loaded once into a temporary SQLite file by the benchmark suite's ETL stage (or read from
+--database-url). Each mode runs in a fresh process, so peak RSS only counts that mode's load, and both modes
+must return identical frames. Peak RSS is reported as the growth over the process's peak before loading.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from common.db import get_engine
+from common.instrumentation import peak_rss_bytes
+from generate_data import generate
+from run_benchmarks import run as run_stages
+
+RESULT_PREFIX = 'LOADER_RESULT '
+QUERIES = {'customers': "SELECT * FROM customers", 'orders': "SELECT * FROM orders ORDER BY order_id"}
+
+
+def measure(mode):
+    """Loads both tables in this process and returns (seconds, peak RSS growth, checksum)."""
+    from common.loader import read_frames
+    baseline = peak_rss_bytes()
+    start = time.perf_counter()
+    if mode == 'read_sql':
+        with get_engine().connect() as connection:
+            frames = {name: pd.read_sql(sql, connection) for name, sql in QUERIES.items()}
+    else:
+        frames = read_frames(QUERIES)
+    seconds = time.perf_counter() - start
+    checksum = {name: [len(frame), int(pd.util.hash_pandas_object(frame, index=False).sum())]
+                for name, frame in frames.items()}
+    return seconds, peak_rss_bytes() - baseline, checksum
+
+
+def run(mode, database_url):
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', mode],
+                               env=dict(os.environ, DATABASE_URL=database_url), capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr)
+        raise RuntimeError(f"Loading with {mode} failed.")
+    return next(json.loads(line[len(RESULT_PREFIX):]) for line in completed.stdout.splitlines()
+                if line.startswith(RESULT_PREFIX))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=float, default=1e6)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', default=None, help="Read an already loaded database instead.")
+    parser.add_argument('--measure', choices=['read_sql', 'loader'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(RESULT_PREFIX + json.dumps(measure(args.measure)), flush=True)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database_url = args.database_url
+        if database_url is None:
+            data_dir = os.path.join(workdir, 'data')
+            generate(data_dir, int(args.orders), seed=args.seed)
+            run_stages(data_dir, ['etl'], 100_000, workdir)
+            database_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        results = {mode: run(mode, database_url) for mode in ('read_sql', 'loader')}
+
+    print(f"{'mode':<10} {'seconds':>8} {'peak RSS growth MB':>19}")
+    for mode, (seconds, peak, _) in results.items():
+        print(f"{mode:<10} {seconds:>8.2f} {peak / 2 ** 20:>19.0f}")
+    if results['read_sql'][2] != results['loader'][2]:
+        sys.exit("The loader returned different frames than pd.read_sql.")
+    print("Both modes returned identical frames.")
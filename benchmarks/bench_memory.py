@@ -0,0 +1,97 @@
+"""Reports the in-memory bytes per order of the ETL, data_preparation and dashboard frames, default vs compact.
+
+Generated data is loaded once into a temporary SQLite file by the benchmark suite's ETL stage. The frames are then built twice, each time in
+a fresh process, with COMPACT_FRAMES off and on (see common/compact.py), and measured with
+memory_usage(deep=True), so object strings count their full size.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from generate_data import generate
+from run_benchmarks import import_from, run as run_stages
+
+RESULT_PREFIX = 'MEMORY_RESULT '
+
+
+def frame_bytes(*frames):
+    """Deep size of frames and series, including their index."""
+    return int(sum(pd.Series(frame.memory_usage(deep=True, index=True)).sum() for frame in frames
+                   if frame is not None))
+
+
+def measure(data_dir):
+    """Builds each stage's frames in this process and returns {frame: (orders, bytes)}."""
+    etl = import_from('part_1', 'data_import_preparation')
+    from schema import customers_schema, orders_schema, key_index
+    customers_df = etl.validate_and_clean(
+        etl.load_csv(os.path.join(data_dir, 'customers.csv'), etl.CUSTOMERS_COLUMNS, etl.CUSTOMERS_RENAME_MAP),
+        customers_schema)
+    orders_df = etl.validate_and_clean(
+        etl.load_csv(os.path.join(data_dir, 'order.csv'), etl.ORDERS_COLUMNS, etl.ORDERS_RENAME_MAP),
+        orders_schema, reference_keys={'customers': key_index(customers_df['customer_id'])})
+    results = {'etl': (len(orders_df), frame_bytes(customers_df, orders_df))}
+    del customers_df, orders_df
+
+    preparation = import_from('part_3', 'data_preparation')
+    customers_df, orders_df = preparation.load_customers_and_orders('database')
+    results['data_preparation'] = (len(orders_df), frame_bytes(customers_df, orders_df))
+    del customers_df, orders_df
+
+    dashboard_module = import_from('part_2', 'dashboard')
+    dashboard = dashboard_module.StreamlitDashboard()
+    dashboard.connect_to_db()
+    merged_df = dashboard.load_merged_data()
+    results['dashboard'] = (len(merged_df), frame_bytes(merged_df, dashboard.customer_names))
+    dashboard.close_connection()
+    return results
+
+
+def run(data_dir, workdir, compact):
+    env = dict(os.environ, COMPACT_FRAMES='1' if compact else '0',
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               STAGING_DIR=os.path.join(workdir, 'staging'), QUARANTINE_DIR=os.path.join(workdir, 'quarantine'))
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', '--data-dir', data_dir],
+                               env=env, cwd=workdir, capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr)
+        raise RuntimeError(f"Measuring with COMPACT_FRAMES={int(compact)} failed.")
+    return next(json.loads(line[len(RESULT_PREFIX):]) for line in completed.stdout.splitlines()
+                if line.startswith(RESULT_PREFIX))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=float, default=1e6)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=None, help="Use existing customers.csv / order.csv from here.")
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(RESULT_PREFIX + json.dumps(measure(args.data_dir)), flush=True)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = os.path.join(workdir, 'data')
+            generate(data_dir, int(args.orders), seed=args.seed)
+        data_dir = os.path.abspath(data_dir)
+        # The benchmark suite's ETL stage loads the same bench.db in workdir
+        run_stages(data_dir, ['etl'], 100_000, workdir)
+        default, compact = run(data_dir, workdir, compact=False), run(data_dir, workdir, compact=True)
+
+    print(f"{'frames':<18} {'orders':>11} {'default B/order':>16} {'compact B/order':>16} {'saved':>7}")
+    for frame, (orders, default_bytes) in default.items():
+        compact_bytes = compact[frame][1]
+        print(f"{frame:<18} {orders:>11,} {default_bytes / orders:>16.1f} {compact_bytes / orders:>16.1f} "
+              f"{1 - compact_bytes / default_bytes:>7.0%}")
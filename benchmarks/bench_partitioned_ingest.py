@@ -0,0 +1,76 @@
+"""Measures how parsing and validating order partitions scales with the number of parser processes.
+
+Generated orders are written as --partitions CSV files and parsed with parse_partitions at 1, 2, 4, ...
+workers up to the core count, including the cross-partition order_id dedupe. No database is involved,
+so the numbers isolate the work the process pool parallelises.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'part_1'))
+
+from data_import_preparation import ORDERS_COLUMNS, ORDERS_RENAME_MAP
+from generate_data import generate
+from partitioned_ingest import parse_partitions
+from schema import customers_schema, orders_schema, apply_schema, key_index
+
+
+def split_orders(data_dir, partitions):
+    orders = pd.read_csv(os.path.join(data_dir, 'order.csv'))
+    rows = len(orders)
+    paths = []
+    for index in range(partitions):
+        path = os.path.join(data_dir, 'partitions', f'orders-{index:04d}.csv')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        orders.iloc[index * rows // partitions:(index + 1) * rows // partitions].to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def worker_counts(max_workers):
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    return counts + [max_workers]
+
+
+def run(paths, reference_keys, workers):
+    start = time.perf_counter()
+    loaded = rejected = 0
+    for _, clean_df, rejected_df in parse_partitions(paths, ORDERS_COLUMNS, ORDERS_RENAME_MAP,
+                                                     orders_schema, reference_keys, workers):
+        loaded += len(clean_df)
+        rejected += len(rejected_df)
+    return loaded, rejected, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=float, default=1e6)
+    parser.add_argument('--partitions', type=int, default=24)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        generate(data_dir, int(args.orders), seed=args.seed)
+        paths = split_orders(data_dir, args.partitions)
+        customers = pd.read_csv(os.path.join(data_dir, 'customers.csv')).rename(columns={'name': 'customer_name'})
+        customers, _ = apply_schema(customers, customers_schema)
+        reference_keys = {'customers': key_index(customers['customer_id'])}
+
+        print(f"{'workers':>7} {'loaded':>11} {'rejected':>9} {'seconds':>8} {'rows/sec':>11} {'speedup':>8}")
+        baseline = None
+        for workers in worker_counts(args.max_workers):
+            loaded, rejected, seconds = run(paths, reference_keys, workers)
+            baseline = baseline or seconds
+            print(f"{workers:>7} {loaded:>11,} {rejected:>9,} {seconds:>8.2f} {(loaded + rejected) / seconds:>11,.0f} "
+                  f"{baseline / seconds:>7.2f}x")
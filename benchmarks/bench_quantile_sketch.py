@@ -0,0 +1,101 @@
+"""Checks the streaming quantile sketch's IQR bounds against exact quantiles.
+
+Each distribution is sketched chunk by chunk, and again as several worker sketches merged together.
+The observed rank error of every quartile must stay within rank_error(k); the script exits non-zero
+otherwise. The repository's order.csv is read in CSV chunks as one of the inputs.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.quantile_sketch import DEFAULT_K, QuantileSketch, rank_error
+
+ORDERS_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'order.csv')
+
+QUARTILES = [0.25, 0.75]
+
+
+def distributions(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    yield 'gamma', rng.gamma(2.0, 1500.0, rows).round(2)
+    yield 'lognormal', rng.lognormal(7.0, 1.2, rows).round(2)
+    yield 'uniform', rng.uniform(-100.0, 10_000.0, rows)
+    # Many repeated values, like prices
+    yield 'discrete', rng.choice(np.arange(5, 500, 5, dtype='float64'), rows)
+    yield 'sorted', np.sort(rng.gamma(2.0, 1500.0, rows))
+
+
+def order_csv_chunks(chunksize):
+    for chunk in pd.read_csv(ORDERS_CSV, usecols=['total_amount'], chunksize=chunksize):
+        yield pd.to_numeric(chunk['total_amount'], errors='coerce').to_numpy(dtype='float64')
+
+
+def observed_rank_error(sorted_values, estimates):
+    """Distance between each estimate's rank range in the exact data and its target quantile."""
+    errors = []
+    for q, estimate in zip(QUARTILES, estimates):
+        low = np.searchsorted(sorted_values, estimate, side='left') / len(sorted_values)
+        high = np.searchsorted(sorted_values, estimate, side='right') / len(sorted_values)
+        errors.append(0.0 if low <= q <= high else min(abs(low - q), abs(high - q)))
+    return max(errors)
+
+
+def check(name, chunks, k, workers, seed):
+    chunks = list(chunks)
+    values = np.concatenate(chunks)
+    values = values[~np.isnan(values)]
+    exact = np.sort(values)
+
+    start = time.perf_counter()
+    sketch = QuantileSketch(k=k, seed=seed)
+    for chunk in chunks:
+        sketch.update(chunk)
+    elapsed = time.perf_counter() - start
+
+    # Each worker sketches every `workers`-th chunk, as a process pool would, then the sketches are merged
+    merge_start = time.perf_counter()
+    merged = QuantileSketch(k=k, seed=seed)
+    for worker in range(workers):
+        partial = QuantileSketch(k=k, seed=seed + worker + 1)
+        for chunk in chunks[worker::workers]:
+            partial.update(chunk)
+        merged.merge(partial)
+    merge_elapsed = time.perf_counter() - merge_start
+
+    bound = rank_error(k)
+    results = []
+    for mode, result, seconds in (('chunked', sketch, elapsed), ('merged', merged, merge_elapsed)):
+        error = observed_rank_error(exact, result.quantile(QUARTILES))
+        retained = sum(len(level) for level in result.levels)
+        results.append(error <= bound)
+        print(f"{name:<10} {mode:<8} {len(values):>11,} {retained:>9,} {error:>9.4%} {bound:>8.2%} "
+              f"{len(values) / seconds:>14,.0f} {'ok' if error <= bound else 'FAIL'}")
+    return all(results)
+
+
+def run(rows, chunksize, k, workers, seed):
+    print(f"{'input':<10} {'mode':<8} {'values':>11} {'retained':>9} {'rank err':>9} {'bound':>8} "
+          f"{'values/sec':>14} status")
+    passed = True
+    for name, values in distributions(rows, seed):
+        passed &= check(name, np.array_split(values, max(1, rows // chunksize)), k, workers, seed)
+    if os.path.exists(ORDERS_CSV):
+        passed &= check('order.csv', order_csv_chunks(1000), k, workers, seed)
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--chunksize', type=int, default=50_000)
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.rows, args.chunksize, args.k, args.workers, args.seed) else 1)
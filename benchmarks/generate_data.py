@@ -0,0 +1,130 @@
+"""Generates deterministic customers.csv / order.csv files shaped like the real exports, at any scale.
+
+Orders per customer follow a Zipf-like skew (most customers order once, a few order thousands of times),
+amounts are log-normal with rare extreme outliers, and the dirty rows the ETL has to reject are mixed in:
+missing and unknown customer ids, negative amounts and re-exported duplicate orders. Files are written in
+chunks, so 1e8 orders need no more memory than one chunk. The same seed always gives the same files.
+"""
+import argparse
+import os
+import string
+import time
+
+import numpy as np
+import pandas as pd
+
+ORDERS_PER_CUSTOMER = 7
+ZIPF_EXPONENT = 1.1
+
+# Fractions of dirty order rows, roughly those of the bundled order.csv
+MISSING_CUSTOMER_RATE = 0.015
+UNKNOWN_CUSTOMER_RATE = 0.025
+NEGATIVE_AMOUNT_RATE = 0.0005
+OUTLIER_AMOUNT_RATE = 0.001
+DUPLICATE_ORDER_RATE = 0.001
+MISSING_DISPLAY_ID_RATE = 0.005
+MISSING_NAME_RATE = 0.005
+
+FIRST_ORDER_DATE = pd.Timestamp('2022-01-01')
+LAST_ORDER_DATE = pd.Timestamp('2024-10-31')
+
+ALPHABET = np.array(list(string.ascii_uppercase + string.digits))
+
+
+def chunk_rng(seed, table, chunk_index):
+    """Independent generator per chunk, so each chunk is reproducible on its own."""
+    return np.random.default_rng([seed, table, chunk_index])
+
+
+def generate_customers(n_customers, seed, chunksize):
+    for chunk_index, start in enumerate(range(0, n_customers, chunksize)):
+        rng = chunk_rng(seed, 0, chunk_index)
+        ids = np.arange(start + 1, min(start + chunksize, n_customers) + 1, dtype='int64')
+        names = pd.Series([f'customer {customer_id}' for customer_id in ids], dtype=object)
+        names[rng.random(len(ids)) < MISSING_NAME_RATE] = None
+        yield pd.DataFrame({
+            'customer_id': ids,
+            'name': names,
+            'email': [f'customer{customer_id}@example.com' for customer_id in ids],
+        })
+
+
+def customer_weights(n_customers, seed):
+    """Cumulative Zipf-like order weights, shuffled so heavy customers are spread over the id range."""
+    weights = 1.0 / np.arange(1, n_customers + 1) ** ZIPF_EXPONENT
+    np.random.default_rng([seed, 2]).shuffle(weights)
+    return np.cumsum(weights / weights.sum())
+
+
+def generate_orders(n_orders, n_customers, seed, chunksize):
+    cumulative = customer_weights(n_customers, seed)
+    span_seconds = (LAST_ORDER_DATE - FIRST_ORDER_DATE).total_seconds()
+    for chunk_index, start in enumerate(range(0, n_orders, chunksize)):
+        rng = chunk_rng(seed, 1, chunk_index)
+        rows = min(chunksize, n_orders - start)
+        # Ids and creation times grow with the row number, like a real export
+        order_ids = np.arange(start + 1, start + rows + 1, dtype='int64')
+        offsets = (order_ids / n_orders) * span_seconds + rng.uniform(0, 60, rows)
+        created_at = FIRST_ORDER_DATE + pd.to_timedelta(np.minimum(offsets, span_seconds), unit='s')
+
+        customer_ids = pd.array(np.searchsorted(cumulative, rng.random(rows)).clip(max=n_customers - 1) + 1,
+                                dtype='Int64')
+        unknown = rng.random(rows) < UNKNOWN_CUSTOMER_RATE
+        customer_ids[unknown] = n_customers + 1 + rng.integers(0, n_customers, int(unknown.sum()))
+        customer_ids[rng.random(rows) < MISSING_CUSTOMER_RATE] = pd.NA
+
+        amounts = np.round(rng.lognormal(7.7, 0.8, rows))
+        outliers = rng.random(rows) < OUTLIER_AMOUNT_RATE
+        amounts[outliers] *= rng.uniform(10, 100, int(outliers.sum()))
+        negative = rng.random(rows) < NEGATIVE_AMOUNT_RATE
+        amounts[negative] = -amounts[negative]
+
+        display_ids = pd.Series([''.join(code) for code in ALPHABET[rng.integers(0, len(ALPHABET), (rows, 4))]],
+                                dtype=object)
+        display_ids[rng.random(rows) < MISSING_DISPLAY_ID_RATE] = None
+
+        orders = pd.DataFrame({
+            'id': order_ids,
+            'display_order_id': display_ids,
+            'total_amount': amounts.astype('int64'),
+            'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'customer_id': customer_ids,
+        })
+        # Re-exported orders repeat an earlier row of the same chunk right after it
+        duplicates = orders[rng.random(rows) < DUPLICATE_ORDER_RATE]
+        yield pd.concat([orders, duplicates]).sort_index(kind='stable').reset_index(drop=True)
+
+
+def write_chunks(chunks, path):
+    rows = 0
+    for index, chunk in enumerate(chunks):
+        chunk.to_csv(path, mode='w' if index == 0 else 'a', header=index == 0, index=False, quoting=1)
+        rows += len(chunk)
+    return rows
+
+
+def generate(output_dir, n_orders, n_customers=None, seed=42, chunksize=1_000_000):
+    """Writes customers.csv and order.csv to `output_dir` and returns their row counts."""
+    n_customers = n_customers or max(n_orders // ORDERS_PER_CUSTOMER, 1)
+    os.makedirs(output_dir, exist_ok=True)
+    customers = write_chunks(generate_customers(n_customers, seed, chunksize),
+                             os.path.join(output_dir, 'customers.csv'))
+    orders = write_chunks(generate_orders(n_orders, n_customers, seed, chunksize),
+                          os.path.join(output_dir, 'order.csv'))
+    return customers, orders
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=float, default=1e5, help="Number of orders, e.g. 1e5 to 1e8.")
+    parser.add_argument('--customers', type=int, default=None,
+                        help=f"Number of customers (default: orders / {ORDERS_PER_CUSTOMER}).")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunksize', type=int, default=1_000_000)
+    parser.add_argument('--output-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    customers, orders = generate(args.output_dir, int(args.orders), args.customers, args.seed, args.chunksize)
+    print(f"Wrote {customers:,} customers and {orders:,} orders to {args.output_dir} "
+          f"in {time.perf_counter() - start:.1f}s.")
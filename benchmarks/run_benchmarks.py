@@ -0,0 +1,161 @@
+"""Runs every pipeline stage end to end on generated data and reports throughput and peak memory per stage.
+
+The stages run in order against a temporary SQLite file (or --database-url), each in its own process so
+its peak RSS is its own: the streaming ETL, customer_data (in memory and streamed), the model's
+customer_features, the dashboard's data load and filters, model training and batch scoring. Use --output to
+append the results as JSON lines, so runs at different scales or commits can be compared.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from common.instrumentation import peak_rss_bytes
+from generate_data import generate
+
+STAGES = ['etl', 'customer_data', 'customer_data_streaming', 'customer_features', 'dashboard', 'model_train',
+          'batch_score']
+
+RESULT_PREFIX = 'BENCH_RESULT '
+
+
+def count_rows(table):
+    from common.db import get_engine
+    with get_engine().connect() as connection:
+        return connection.exec_driver_sql(f"SELECT COUNT(*) FROM {table}").scalar()
+
+
+def import_from(part, module):
+    sys.path.insert(0, os.path.join(ROOT, part))
+    return __import__(module)
+
+
+def run_stage(stage, data_dir, chunksize):
+    """Runs one stage in this process and returns its (name, rows in, rows out, seconds) measurements."""
+    if stage == 'etl':
+        etl = import_from('part_1', 'data_import_preparation')
+        etl.CUSTOMERS_CSV = os.path.join(data_dir, 'customers.csv')
+        etl.ORDERS_CSV = os.path.join(data_dir, 'order.csv')
+        with open(etl.ORDERS_CSV) as orders_file:
+            rows_in = sum(1 for _ in orders_file) - 1
+        start = time.perf_counter()
+        etl.run_etl(stream=True, chunksize=chunksize, backend='executemany')
+        return [(stage, rows_in, count_rows('orders'), time.perf_counter() - start)]
+
+    if stage in ('customer_data', 'customer_data_streaming'):
+        preparation = import_from('part_3', 'data_preparation')
+        start = time.perf_counter()
+        preparation.create_customer_data_table(
+            source='database', chunksize=chunksize if stage == 'customer_data_streaming' else None)
+        return [(stage, count_rows('orders'), count_rows('customer_data'), time.perf_counter() - start)]
+
+    if stage == 'customer_features':
+        features = import_from('part_3', 'feature_materialization')
+        start = time.perf_counter()
+        features.create_customer_features()
+        return [(stage, count_rows('orders'), count_rows('customer_features'), time.perf_counter() - start)]
+
+    if stage == 'dashboard':
+        dashboard_module = import_from('part_2', 'dashboard')
+        dashboard = dashboard_module.StreamlitDashboard()
+        dashboard.connect_to_db()
+        start = time.perf_counter()
+        merged_df = dashboard.load_merged_data()
+        loaded = time.perf_counter()
+        filtered_df = dashboard.display_filters(merged_df)
+        filtered = time.perf_counter()
+        dashboard.close_connection()
+        return [('dashboard_load', count_rows('orders'), len(merged_df), loaded - start),
+                ('dashboard_filters', len(merged_df), len(filtered_df), filtered - loaded)]
+
+    if stage == 'model_train':
+        model = import_from('part_3', 'predict_repeat_customers')
+        start = time.perf_counter()
+        model.train(source='database')
+        rows = count_rows('customer_features')
+        return [(stage, rows, rows, time.perf_counter() - start)]
+
+    if stage == 'batch_score':
+        scoring = import_from('part_3', 'batch_score')
+        start = time.perf_counter()
+        scoring.batch_score(source='database', chunksize=chunksize)
+        return [(stage, count_rows('customer_scoring_features'), count_rows('customer_predictions'),
+                 time.perf_counter() - start)]
+
+    raise ValueError(f"Unknown stage '{stage}'. Choose one of {', '.join(STAGES)}.")
+
+
+def run_child(stage, data_dir, chunksize):
+    for name, rows_in, rows_out, seconds in run_stage(stage, data_dir, chunksize):
+        print(RESULT_PREFIX + json.dumps({
+            'stage': name, 'rows_in': int(rows_in), 'rows_out': int(rows_out), 'seconds': seconds,
+            'rows_per_sec': rows_in / seconds if seconds else None, 'peak_rss_bytes': peak_rss_bytes(),
+        }), flush=True)
+
+
+def run(data_dir, stages, chunksize, workdir, database_url=None, verbose=False):
+    env = dict(os.environ,
+               DATABASE_URL=database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               STAGING_DIR=os.path.join(workdir, 'staging'),
+               QUARANTINE_DIR=os.path.join(workdir, 'quarantine'),
+               MODEL_DIR=os.path.join(workdir, 'models'),
+               MPLBACKEND='Agg')
+    results = []
+    for stage in stages:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--stage', stage, '--data-dir', data_dir,
+             '--chunksize', str(chunksize)],
+            env=env, cwd=workdir, capture_output=True, text=True)
+        if verbose or completed.returncode != 0:
+            sys.stderr.write(completed.stderr)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Stage '{stage}' failed with exit code {completed.returncode}.")
+        results += [json.loads(line[len(RESULT_PREFIX):]) for line in completed.stdout.splitlines()
+                    if line.startswith(RESULT_PREFIX)]
+    return results
+
+
+def print_results(results):
+    print(f"{'stage':<24} {'rows in':>12} {'rows out':>12} {'seconds':>9} {'rows/sec':>12} {'peak RSS MB':>12}")
+    for result in results:
+        print(f"{result['stage']:<24} {result['rows_in']:>12,} {result['rows_out']:>12,} {result['seconds']:>9.2f} "
+              f"{result['rows_per_sec'] or 0:>12,.0f} {result['peak_rss_bytes'] / 2 ** 20:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=float, default=1e5,
+                        help="Generate this many orders (ignored with --data-dir).")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=None, help="Use existing customers.csv / order.csv from here.")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--database-url', default=None, help="Benchmark against this database instead of SQLite.")
+    parser.add_argument('--output', default=None, help="Append the results as JSON lines to this file.")
+    parser.add_argument('--verbose', action='store_true', help="Show the stages' log output.")
+    parser.add_argument('--stage', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        run_child(args.stage, args.data_dir, args.chunksize)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = os.path.join(workdir, 'data')
+            customers, orders = generate(data_dir, int(args.orders), seed=args.seed)
+            print(f"Generated {customers:,} customers and {orders:,} orders.")
+        results = run(os.path.abspath(data_dir), args.stages, args.chunksize, workdir, args.database_url,
+                      args.verbose)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'a') as output_file:
+            for result in results:
+                output_file.write(json.dumps({**result, 'orders': args.orders, 'seed': args.seed}) + '\n')
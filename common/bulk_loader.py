@@ -0,0 +1,138 @@
+import csv
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from common.compact import wide_frame
+from common.db import get_engine
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('to_sql', 'executemany', 'load_data', 'parallel')
+
+DEFAULT_MAX_BATCH_BYTES = 1024 * 1024
+NULL_MARKER = '\\N'
+
+
+def to_python_rows(df):
+    """Converts a frame into DB-API parameter tuples with NULLs as None."""
+    columns = []
+    for name in df.columns:
+        column = df[name]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            values = column.array.to_pydatetime()
+        else:
+            values = column.astype(object).to_numpy()
+        values[column.isna().to_numpy()] = None
+        columns.append(values.tolist())
+    return list(zip(*columns))
+
+
+def rows_per_batch(df, max_batch_bytes, sample_size=1000):
+    """Estimates how many rows fit in a batch of `max_batch_bytes` from the text size of a sample."""
+    if df.empty:
+        return 1
+    sample = df.head(sample_size)
+    bytes_per_row = max(len(sample.to_csv(index=False, header=False).encode()) / len(sample), 1)
+    return max(int(max_batch_bytes // bytes_per_row), 1)
+
+
+def create_table(connection, df, table_name, dtype_map, if_exists):
+    """Lets pandas create (or replace) the table from the frame's columns without writing any rows."""
+    df.head(0).to_sql(table_name, con=connection, if_exists=if_exists, index=False, dtype=dtype_map)
+
+
+def insert_statement(connection, table_name, columns):
+    placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+    quote = connection.dialect.identifier_preparer.quote
+    return (f"INSERT INTO {quote(table_name)} ({', '.join(quote(column) for column in columns)}) "
+            f"VALUES ({', '.join([placeholder] * len(columns))})")
+
+
+def write_executemany(connection, df, table_name, max_batch_bytes=DEFAULT_MAX_BATCH_BYTES):
+    """Writes rows with one executemany call per batch of roughly `max_batch_bytes`.
+
+    Drivers such as PyMySQL rewrite each executemany into multi-row INSERT statements.
+    """
+    statement = insert_statement(connection, table_name, list(df.columns))
+    batch_rows = rows_per_batch(df, max_batch_bytes)
+    for start in range(0, len(df), batch_rows):
+        connection.exec_driver_sql(statement, to_python_rows(df.iloc[start:start + batch_rows]))
+
+
+def write_load_data(connection, df, table_name):
+    """Spools the frame to a CSV file and loads it with MySQL's LOAD DATA LOCAL INFILE.
+
+    The engine must be created with connect_args={'local_infile': True}.
+    """
+    if connection.dialect.name != 'mysql':
+        raise ValueError("The 'load_data' backend requires a MySQL database.")
+
+    quote = connection.dialect.identifier_preparer.quote
+    spool = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, newline='')
+    try:
+        df.to_csv(spool, index=False, header=False, na_rep=NULL_MARKER, quoting=csv.QUOTE_MINIMAL,
+                  date_format='%Y-%m-%d %H:%M:%S', lineterminator='\n')
+        spool.close()
+        path = spool.name.replace('\\', '/')
+        connection.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {quote(table_name)} "
+            f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' "
+            f"({', '.join(quote(column) for column in df.columns)})"
+        )
+    finally:
+        spool.close()
+        os.remove(spool.name)
+
+
+def write_parallel(engine, df, table_name, key_column, workers=4, max_batch_bytes=DEFAULT_MAX_BATCH_BYTES):
+    """Writes disjoint key ranges over `workers` pooled connections at once.
+
+    Each range commits in its own transaction, so a failure can leave other ranges loaded.
+    """
+    ordered = df.sort_values(key_column) if key_column else df
+    ranges = [part for part in np.array_split(np.arange(len(ordered)), workers) if len(part)]
+
+    def write_range(positions):
+        with engine.begin() as connection:
+            write_executemany(connection, ordered.iloc[positions], table_name, max_batch_bytes)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(write_range, ranges):
+            pass
+
+
+def bulk_write(engine, df, table_name, dtype_map, backend='to_sql', if_exists='replace', chunksize=500,
+               max_batch_bytes=DEFAULT_MAX_BATCH_BYTES, workers=4, key_column=None):
+    """Writes a frame with the chosen backend, creating or replacing the table first when asked to."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown bulk-write backend '{backend}'. Choose one of {', '.join(BACKENDS)}.")
+    df = wide_frame(df)
+
+    if backend == 'to_sql':
+        with engine.begin() as connection:
+            df.to_sql(table_name, con=connection, if_exists=if_exists, index=False, dtype=dtype_map,
+                      chunksize=chunksize)
+        return
+
+    # Checked before the table is replaced, so an unsupported database leaves the existing rows in place
+    if backend == 'load_data':
+        if engine.dialect.name != 'mysql':
+            raise ValueError("The 'load_data' backend requires a MySQL database.")
+        infile_engine = get_engine(engine.url, connect_args={'local_infile': True})
+
+    with engine.begin() as connection:
+        create_table(connection, df, table_name, dtype_map, if_exists)
+        if backend == 'executemany':
+            write_executemany(connection, df, table_name, max_batch_bytes)
+
+    if backend == 'load_data':
+        with infile_engine.begin() as connection:
+            write_load_data(connection, df, table_name)
+    elif backend == 'parallel':
+        write_parallel(engine, df, table_name, key_column, workers, max_batch_bytes)
+    logger.debug(f"Wrote {len(df)} rows to {table_name} with the '{backend}' backend.")
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# COMPACT_FRAMES=1 keeps the ETL, data_preparation and dashboard frames in compact dtypes: the narrowest
+# integer that fits each id, float32 amounts when that is exact to the cent, and Arrow-backed or
+# categorical strings
+COMPACT_FRAMES = os.environ.get('COMPACT_FRAMES', '0').lower() in ('1', 'true', 'yes')
+
+# Text columns with at most this share of distinct values become categoricals, the rest Arrow strings
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# Amounts are kept to the cent: compact_floats only narrows columns that round-trip at this precision
+AMOUNT_DECIMALS = 2
+
+
+def compact_integers(series):
+    """Downcasts an integer column, nullable or not, to the narrowest signed type holding its values."""
+    if series.isna().any():
+        downcast = pd.to_numeric(series.dropna(), downcast='integer')
+        return series.astype(pd.api.types.pandas_dtype(downcast.dtype.name.capitalize()))
+    return pd.to_numeric(series.astype('int64'), downcast='integer')
+
+
+def compact_floats(series):
+    """Stores amounts as float32 when wide_amounts gives every value back exactly, else leaves them."""
+    narrow = series.astype('float32')
+    wide = series.to_numpy(dtype='float64', na_value=np.nan)
+    same = (np.round(narrow.to_numpy(dtype='float64'), AMOUNT_DECIMALS) == wide) | np.isnan(wide)
+    return narrow if same.all() else series
+
+
+def compact_strings(series):
+    values = series.dropna()
+    if len(values) and values.nunique() <= CATEGORY_MAX_UNIQUE_RATIO * len(values):
+        return series.astype('category')
+    return series.astype('string[pyarrow]')
+
+
+def compact_frame(df):
+    """Returns `df` with every integer, float and text column in its compact dtype."""
+    columns = {}
+    for column, values in df.items():
+        if pd.api.types.is_bool_dtype(values):
+            columns[column] = values
+        elif pd.api.types.is_integer_dtype(values):
+            columns[column] = compact_integers(values)
+        elif pd.api.types.is_float_dtype(values):
+            columns[column] = compact_floats(values)
+        elif pd.api.types.infer_dtype(values, skipna=True) == 'string':
+            columns[column] = compact_strings(values)
+        else:
+            columns[column] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+def maybe_compact(df):
+    """compact_frame when COMPACT_FRAMES is on, otherwise `df` unchanged."""
+    return compact_frame(df) if COMPACT_FRAMES and df is not None else df
+
+
+def wide_amounts(series):
+    """Amounts as float64 for summing and writing.
+
+    float32 amounts are rounded back to the cent they were narrowed from, so 1234.56 is summed, stored and
+    snapshotted as 1234.56 rather than 1234.56005859375.
+    """
+    if series.dtype == 'float32':
+        return series.astype('float64').round(AMOUNT_DECIMALS)
+    return series.astype('float64', copy=False)
+
+
+def wide_frame(df):
+    """`df` with its float32 amounts widened by wide_amounts; the form a compact frame leaves memory in."""
+    narrow = [column for column, dtype in df.dtypes.items() if dtype == 'float32']
+    if not narrow:
+        return df
+    return df.assign(**{column: wide_amounts(df[column]) for column in narrow})
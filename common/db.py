@@ -0,0 +1,101 @@
+import configparser
+import logging
+import os
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+
+logger = logging.getLogger(__name__)
+
+# Settings are read from environment variables first, then the [database] section of the config file,
+# then these defaults
+DB_CONFIG_FILE = os.environ.get(
+    'DB_CONFIG_FILE', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db.ini')
+)
+
+DEFAULT_SETTINGS = {
+    'url': None,
+    'user': 'root',
+    'password': 'Muw0okm_PL<',
+    'host': 'localhost',
+    'port': '3306',
+    'name': 'delivery',
+    'pool_size': '5',
+    'max_overflow': '10',
+    'pool_recycle': '1800',
+    'pool_timeout': '30',
+    'pool_pre_ping': 'true',
+}
+
+ENVIRONMENT_VARIABLES = {
+    'url': 'DATABASE_URL',
+    'user': 'DB_USER',
+    'password': 'DB_PASSWORD',
+    'host': 'DB_HOST',
+    'port': 'DB_PORT',
+    'name': 'DB_NAME',
+    'pool_size': 'DB_POOL_SIZE',
+    'max_overflow': 'DB_MAX_OVERFLOW',
+    'pool_recycle': 'DB_POOL_RECYCLE',
+    'pool_timeout': 'DB_POOL_TIMEOUT',
+    'pool_pre_ping': 'DB_POOL_PRE_PING',
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def load_settings():
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(DB_CONFIG_FILE):
+        parser = configparser.ConfigParser(interpolation=None)
+        parser.read(DB_CONFIG_FILE)
+        if parser.has_section('database'):
+            settings.update({key: value for key, value in parser.items('database') if key in settings})
+    for key, variable in ENVIRONMENT_VARIABLES.items():
+        if os.environ.get(variable):
+            settings[key] = os.environ[variable]
+    return settings
+
+
+def database_url(settings=None):
+    settings = settings or load_settings()
+    if settings['url']:
+        return make_url(settings['url'])
+    return URL.create('mysql+pymysql', username=settings['user'], password=settings['password'],
+                      host=settings['host'], port=int(settings['port']), database=settings['name'])
+
+
+def pool_options(url, settings):
+    options = {
+        'pool_pre_ping': str(settings['pool_pre_ping']).lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(settings['pool_recycle']),
+    }
+    # In-memory SQLite keeps one connection per thread, so the queue pool sizing does not apply
+    if not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')):
+        options.update(pool_size=int(settings['pool_size']), max_overflow=int(settings['max_overflow']),
+                       pool_timeout=int(settings['pool_timeout']))
+    return options
+
+
+def get_engine(url=None, **engine_options):
+    """Returns the process-wide pooled engine for `url` (the configured database by default).
+
+    Engines are created lazily on first use and shared by every stage in the process.
+    """
+    settings = load_settings()
+    url = make_url(url) if url is not None else database_url(settings)
+    key = (url.render_as_string(hide_password=False), repr(sorted(engine_options.items())))
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = create_engine(url, **{**pool_options(url, settings), **engine_options})
+            logger.debug(f"Created pooled engine for {url.render_as_string(hide_password=True)}.")
+        return _engines[key]
+
+
+def dispose_engines():
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
@@ -0,0 +1,183 @@
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# METRICS_FILE turns emission on; METRICS_FORMAT picks JSON lines (appended per stage run) or a
+# Prometheus text file (rewritten with the latest run of every stage, e.g. for node_exporter's textfile collector)
+METRICS_FILE = os.environ.get('METRICS_FILE')
+METRICS_FORMAT = os.environ.get('METRICS_FORMAT', 'jsonl')
+
+_lock = threading.Lock()
+_round_trips = 0
+_latest = {}
+_runs = {}
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_round_trip(conn, cursor, statement, parameters, context, executemany):
+    global _round_trips
+    with _lock:
+        _round_trips += 1
+
+
+def db_round_trips():
+    """Statements sent by every engine in this process so far (an executemany counts once)."""
+    return _round_trips
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far."""
+    try:
+        import resource
+    except ImportError:
+        return windows_peak_working_set()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def windows_peak_working_set():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters),
+                                             counters.cb)
+    return counters.PeakWorkingSetSize
+
+
+def row_count(value):
+    """Rows in a frame, series or list; tuples of frames count all their rows."""
+    if isinstance(value, tuple):
+        counts = [row_count(item) for item in value]
+        return None if None in counts else sum(counts)
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+class StageMetrics:
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        # Set by blocks that handle their own error, so the stage is still recorded as failed
+        self.failed = False
+
+    def as_record(self, seconds, round_trips, failed):
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        return {
+            'stage': self.name,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'seconds': seconds,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_sec': rows / seconds if rows is not None and seconds > 0 else None,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'db_round_trips': round_trips,
+            'failed': failed,
+        }
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """Measures a block of work as a pipeline stage; set `rows_in` / `rows_out` on the yielded object.
+
+    The stage is recorded as failed when the block raises or sets `failed` on the yielded object.
+    """
+    metrics = StageMetrics(name, rows_in)
+    round_trips = db_round_trips()
+    start = time.perf_counter()
+    failed = True
+    try:
+        yield metrics
+        failed = metrics.failed
+    finally:
+        record_stage(metrics.as_record(time.perf_counter() - start, db_round_trips() - round_trips, failed))
+
+
+def instrument(name, rows_in=None, rows_out=row_count):
+    """Decorator measuring every call of a function as stage `name`.
+
+    `name` may also be a callable of the call's arguments, e.g. to tell tables apart, and
+    `rows_in(*args, **kwargs)` and `rows_out(result)` derive the row counts from the call.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stage_name = name(*args, **kwargs) if callable(name) else name
+            with stage(stage_name, rows_in(*args, **kwargs) if rows_in else None) as metrics:
+                result = function(*args, **kwargs)
+                metrics.rows_out = rows_out(result) if rows_out else None
+                return result
+        return wrapper
+    return decorator
+
+
+def record_stage(record):
+    with _lock:
+        _latest[record['stage']] = record
+        _runs[record['stage']] = _runs.get(record['stage'], 0) + 1
+    logger.debug(f"Stage metrics: {record}")
+    if METRICS_FILE:
+        try:
+            if METRICS_FORMAT == 'prometheus':
+                write_prometheus(METRICS_FILE)
+            else:
+                with open(METRICS_FILE, 'a') as metrics_file:
+                    metrics_file.write(json.dumps(record) + '\n')
+        except OSError as e:
+            logger.warning(f"Could not write stage metrics to {METRICS_FILE}: {e}")
+
+
+PROMETHEUS_METRICS = [
+    ('seconds', 'pipeline_stage_duration_seconds', 'Wall time of the latest run of the stage.'),
+    ('rows_in', 'pipeline_stage_rows_in', 'Rows passed into the latest run of the stage.'),
+    ('rows_out', 'pipeline_stage_rows_out', 'Rows produced by the latest run of the stage.'),
+    ('rows_per_sec', 'pipeline_stage_rows_per_second', 'Throughput of the latest run of the stage.'),
+    ('peak_rss_bytes', 'pipeline_stage_peak_rss_bytes', 'Process peak RSS at the end of the latest run.'),
+    ('db_round_trips', 'pipeline_stage_db_round_trips', 'Database statements issued by the latest run.'),
+]
+
+
+def prometheus_text():
+    with _lock:
+        latest = dict(_latest)
+        runs = dict(_runs)
+    lines = []
+    for key, metric, description in PROMETHEUS_METRICS:
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} gauge']
+        lines += [f'{metric}{{stage="{name}"}} {record[key]}' for name, record in sorted(latest.items())
+                  if record[key] is not None]
+    lines += ['# HELP pipeline_stage_runs_total Runs of the stage in this process.',
+              '# TYPE pipeline_stage_runs_total counter']
+    lines += [f'pipeline_stage_runs_total{{stage="{name}"}} {count}' for name, count in sorted(runs.items())]
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    # Written to a temporary file and renamed, so a scraper never reads a half-written file
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w') as metrics_file:
+        metrics_file.write(prometheus_text())
+    os.replace(temporary_path, path)
@@ -0,0 +1,115 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from common.db import get_engine
+
+# Rows fetched per round trip from the server-side cursor; only one chunk of Python row tuples is alive at a time
+READ_CHUNKSIZE = int(os.environ.get('READ_CHUNKSIZE', 50_000))
+
+
+def null_array(dtype, length):
+    """Missing values in `dtype`'s nearest nullable form: NaN for numbers, NaT for datetimes, None otherwise."""
+    if dtype.kind in 'iuf':
+        return np.full(length, np.nan)
+    if dtype.kind in 'mM':
+        return np.full(length, 'NaT', dtype=dtype)
+    return np.full(length, None, dtype=object)
+
+
+class ColumnBuffers:
+    """One numpy array per column, filled chunk by chunk.
+
+    With a row count hint the arrays are allocated once at their final size; otherwise they grow by doubling.
+    A column is upcast (int to float, anything to object) only when a later chunk needs it, so the frame is
+    typed like pd.read_sql would have typed the whole result, including chunks where a column is all NULL.
+    """
+
+    def __init__(self, columns, capacity=None):
+        self.columns = list(columns)
+        self.capacity = capacity or 0
+        self.rows = 0
+        self.arrays = None
+        self.null_columns = set(self.columns)
+
+    def append(self, chunk):
+        end = self.rows + len(chunk)
+        if self.arrays is None:
+            self.capacity = max(self.capacity, end)
+            self.arrays = {column: np.empty(self.capacity, dtype=chunk[column].dtype) for column in self.columns}
+        elif end > self.capacity:
+            self.resize(max(end, 2 * self.capacity))
+
+        for column in self.columns:
+            all_null = bool(chunk[column].isna().all())
+            values = chunk[column].to_numpy()
+            array = self.arrays[column]
+            if all_null and values.dtype == object:
+                values = null_array(array.dtype, len(values))
+            elif self.rows and column in self.null_columns and array.dtype == object and values.dtype != object:
+                # Only NULLs so far: retype the column from its first values
+                array = self.arrays[column] = null_array(values.dtype, self.capacity)
+            if not all_null:
+                self.null_columns.discard(column)
+
+            if values.dtype != array.dtype:
+                try:
+                    dtype = np.result_type(array.dtype, values.dtype)
+                except TypeError:
+                    dtype = np.dtype(object)
+                if dtype != array.dtype:
+                    array = self.arrays[column] = array.astype(dtype)
+            array[self.rows:end] = values
+        self.rows = end
+
+    def resize(self, capacity):
+        for column, array in self.arrays.items():
+            resized = np.empty(capacity, dtype=array.dtype)
+            resized[:self.rows] = array[:self.rows]
+            self.arrays[column] = resized
+        self.capacity = capacity
+
+    def frame(self):
+        if self.arrays is None:
+            return pd.DataFrame(columns=self.columns)
+        if self.capacity > self.rows:
+            self.resize(self.rows)
+        return pd.DataFrame(self.arrays, columns=self.columns, copy=False)
+
+
+def read_frame(connection, sql, params=None, chunksize=READ_CHUNKSIZE, rows=None):
+    """Reads a query through a server-side cursor into preallocated column buffers.
+
+    Unlike pd.read_sql, the full result never exists as a list of row tuples: each fetched chunk is copied into
+    the column arrays and dropped. `rows` is a hint of the result's row count (e.g. from a COUNT(*) probe).
+    """
+    result = connection.execution_options(stream_results=True, max_row_buffer=chunksize).execute(
+        text(sql) if isinstance(sql, str) else sql, params or {})
+    buffers = ColumnBuffers(result.keys(), rows)
+    for partition in result.partitions(chunksize):
+        buffers.append(pd.DataFrame.from_records(partition, columns=buffers.columns, coerce_float=True))
+    return buffers.frame()
+
+
+def read_frames(queries, url=None, params=None, chunksize=READ_CHUNKSIZE, rows=None):
+    """Runs independent queries concurrently, each on its own pooled connection; returns {name: frame}.
+
+    `queries` maps names to SQL, `params` and `rows` optionally map the same names to bind parameters and
+    row count hints. In-memory SQLite gives every thread its own empty database, so it is read sequentially.
+    """
+    engine = get_engine(url)
+    params, rows = params or {}, rows or {}
+
+    def read(name):
+        with engine.connect() as connection:
+            return read_frame(connection, queries[name], params.get(name), chunksize, rows.get(name))
+
+    if len(queries) == 1 or (engine.url.get_backend_name() == 'sqlite'
+                             and engine.url.database in (None, '', ':memory:')):
+        return {name: read(name) for name in queries}
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        futures = {name: executor.submit(read, name) for name in queries}
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,96 @@
+import math
+
+import numpy as np
+
+DEFAULT_K = 200
+
+# Each lower level may hold 2/3 of the level above it (KLL's capacity decay)
+CAPACITY_DECAY = 2 / 3
+
+
+def rank_error(k):
+    """Normalised rank error a sketch with parameter `k` stays within across all quantiles, with high probability.
+
+    That is 1.5% at k=200; a single quantile is typically about half as far off.
+    """
+    return 3.0 / k
+
+
+def k_for_error(epsilon):
+    """Smallest `k` whose approximate rank error is at most `epsilon`."""
+    return max(8, math.ceil(3.0 / epsilon))
+
+
+class QuantileSketch:
+    """Mergeable KLL-style quantile sketch over floats, updated with whole numpy batches.
+
+    Memory stays at O(k log(n / k)) values however many are added. Level h holds values that each stand
+    for 2**h inputs; a full level is sorted and every other value (random offset) is promoted a level up.
+    Sketches built over different chunks or workers can be combined with `merge`.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(math.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def update(self, values):
+        """Adds a batch of values; NaNs are ignored like in pandas quantile."""
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+        return self
+
+    def merge(self, other):
+        """Folds another sketch into this one."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, values in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self.count += other.count
+        self.compress()
+        return self
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                values = np.sort(self.levels[level])
+                # An odd value out stays behind so the total weight is preserved exactly
+                keep = values[:1] if len(values) % 2 else values[:0]
+                paired = values[len(keep):]
+                promoted = paired[self.rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def weighted_values(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype='float64')
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        return values[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """Approximate value at quantile `q` (a float or a sequence of floats in [0, 1])."""
+        if self.count == 0:
+            return np.nan if np.isscalar(q) else np.full(len(q), np.nan)
+        values, cumulative = self.weighted_values()
+        targets = np.asarray(q, dtype='float64') * cumulative[-1]
+        positions = np.searchsorted(cumulative, targets, side='left').clip(max=len(values) - 1)
+        result = values[positions]
+        return float(result) if np.isscalar(q) else result
+
+    def __len__(self):
+        return self.count
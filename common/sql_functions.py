@@ -0,0 +1,12 @@
+def week_ending(column, dialect_name):
+    """SQL for the Sunday ending the week of `column`, the same label pandas uses for resample("W")."""
+    if dialect_name == "sqlite":
+        return f"date({column}, 'weekday 0')"
+    return f"DATE(DATE_ADD({column}, INTERVAL (6 - WEEKDAY({column})) DAY))"
+
+
+def days_between(later, earlier, dialect_name):
+    """SQL for the fractional days from `earlier` to `later`, for datetime columns or 'YYYY-MM-DD HH:MM:SS' text."""
+    if dialect_name == "sqlite":
+        return f"(julianday({later}) - julianday({earlier}))"
+    return f"(TIMESTAMPDIFF(SECOND, {earlier}, {later}) / 86400.0)"
@@ -0,0 +1,17 @@
+from sqlalchemy import bindparam, text
+
+# Ids per IN (...) list when incremental runs read or recompute rows in batches of order or customer ids
+IN_LIST_BATCH_SIZE = 1000
+
+
+def execute(connection, sql, params=None):
+    """Executes SQL text, expanding list parameters into IN (...) lists."""
+    params = params or {}
+    statement = text(sql).bindparams(*[bindparam(name, expanding=True)
+                                       for name, value in params.items() if isinstance(value, list)])
+    return connection.execute(statement, params)
+
+
+def ids_from(connection, sql, params=None):
+    """The set of integer ids in the first column of a query's result."""
+    return {int(id_) for id_ in execute(connection, sql, params).scalars()}
@@ -0,0 +1,168 @@
+import os
+import shutil
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from common.compact import wide_frame
+
+STAGING_DIR = os.environ.get(
+    'STAGING_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'staging')
+)
+
+# Downstream stages read the snapshots instead of MySQL when DATA_SOURCE=parquet
+DATA_SOURCE = os.environ.get('DATA_SOURCE', 'database')
+
+PARTITION_COLUMN = 'order_month'
+
+
+def snapshot_path(name):
+    return os.path.join(STAGING_DIR, name)
+
+
+def clear_snapshot(name):
+    shutil.rmtree(snapshot_path(name), ignore_errors=True)
+
+
+def wide_dtype(dtype):
+    if isinstance(dtype, pd.CategoricalDtype) or isinstance(dtype, pd.StringDtype):
+        return 'string'
+    if pd.api.types.is_extension_array_dtype(dtype) and pd.api.types.is_integer_dtype(dtype):
+        return 'Int64'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'int64'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'float64'
+    return dtype
+
+
+def snapshot_table(df):
+    """Arrow table of `df` in the wide column types, so snapshots written from compact frames (see
+    common/compact.py) and from default ones share one schema and stay readable together."""
+    df = wide_frame(df)
+    dtypes = {column: wide_dtype(dtype) for column, dtype in df.dtypes.items()}
+    if any(dtype != df.dtypes[column] for column, dtype in dtypes.items()):
+        df = df.astype(dtypes)
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def with_partition_column(df, date_column):
+    return df.assign(**{PARTITION_COLUMN: df[date_column].dt.strftime('%Y-%m')})
+
+
+def write_snapshot(df, name, date_column=None, replace_partitions=False):
+    """Adds a batch of rows to a Parquet snapshot, partitioned by order month when `date_column` is given.
+
+    Each call writes new files, so streaming chunks can be appended. With `replace_partitions`, the month
+    partitions present in `df` are replaced instead.
+    """
+    path = snapshot_path(name)
+    basename = f'part-{uuid.uuid4().hex}-{{i}}.parquet'
+    if date_column is None:
+        os.makedirs(path, exist_ok=True)
+        pq.write_table(snapshot_table(df), os.path.join(path, basename.format(i=0)))
+        return
+
+    ds.write_dataset(
+        snapshot_table(with_partition_column(df, date_column)),
+        path,
+        format='parquet',
+        partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor='hive'),
+        basename_template=basename,
+        existing_data_behavior='delete_matching' if replace_partitions else 'overwrite_or_ignore',
+    )
+
+
+def partition_path(name, month):
+    return os.path.join(snapshot_path(name), f'{PARTITION_COLUMN}={month}')
+
+
+def months_holding(name, key_column, keys):
+    """Month partitions of a snapshot that currently hold any of `keys`."""
+    table = pq.read_table(snapshot_path(name), columns=[PARTITION_COLUMN],
+                          filters=[(key_column, 'in', list(keys))], partitioning='hive')
+    return set(table.column(PARTITION_COLUMN).to_pylist())
+
+
+def upsert_snapshot(df, name, key_column, date_column=None):
+    """Merges changed rows into a snapshot, rewriting only the month partitions they touch.
+
+    A row whose date moved to another month is removed from its old partition as well.
+    """
+    if df.empty:
+        return
+    exists = os.path.exists(snapshot_path(name))
+    months = None
+    if date_column is not None:
+        months = set(with_partition_column(df, date_column)[PARTITION_COLUMN].unique())
+        if exists:
+            months |= months_holding(name, key_column, df[key_column].tolist())
+        months = sorted(months)
+    existing = read_snapshot(name, months=months) if exists else df.iloc[0:0]
+    merged = pd.concat([existing, df], ignore_index=True).drop_duplicates(subset=key_column, keep='last')
+    if date_column is None:
+        clear_snapshot(name)
+    else:
+        # Partitions left without rows are not rewritten by write_snapshot, so they are dropped here
+        for month in set(months) - set(with_partition_column(merged, date_column)[PARTITION_COLUMN]):
+            shutil.rmtree(partition_path(name, month), ignore_errors=True)
+    write_snapshot(merged, name, date_column, replace_partitions=True)
+
+
+def snapshot_version(name):
+    """Cheap change probe for a snapshot: its file count and latest modification time."""
+    latest, files = 0.0, 0
+    for root, _, names in os.walk(snapshot_path(name)):
+        for file_name in names:
+            latest = max(latest, os.path.getmtime(os.path.join(root, file_name)))
+            files += 1
+    return files, latest
+
+
+def read_snapshot(name, columns=None, months=None, start_month=None, end_month=None):
+    """Reads a snapshot memory-mapped, loading only `columns` and the month partitions asked for.
+
+    Months are 'YYYY-MM' strings; the partition column itself is not returned.
+    """
+    filters = []
+    if months is not None:
+        filters.append((PARTITION_COLUMN, 'in', list(months)))
+    if start_month is not None:
+        filters.append((PARTITION_COLUMN, '>=', start_month))
+    if end_month is not None:
+        filters.append((PARTITION_COLUMN, '<=', end_month))
+
+    table = pq.read_table(snapshot_path(name), columns=columns, filters=filters or None, memory_map=True,
+                          partitioning='hive')
+    if PARTITION_COLUMN in table.column_names and (columns is None or PARTITION_COLUMN not in columns):
+        table = table.drop_columns([PARTITION_COLUMN])
+    return table.to_pandas()
+
+
+def snapshot_bounds(name, column):
+    """Minimum and maximum of `column` from the Parquet footer statistics, without reading any rows.
+
+    Falls back to reading just that column when a file was written without statistics.
+    """
+    low = high = None
+    for fragment in ds.dataset(snapshot_path(name), format='parquet', partitioning='hive').get_fragments():
+        metadata = fragment.metadata
+        index = metadata.schema.names.index(column)
+        for row_group in range(metadata.num_row_groups):
+            statistics = metadata.row_group(row_group).column(index).statistics
+            if statistics is None or not statistics.has_min_max:
+                values = read_snapshot(name, columns=[column])[column]
+                return values.min(), values.max()
+            low = statistics.min if low is None else min(low, statistics.min)
+            high = statistics.max if high is None else max(high, statistics.max)
+    return low, high
+
+
+def iter_snapshot(name, columns=None, batch_size=100_000):
+    """Yields a snapshot as frames of at most `batch_size` rows without loading it whole."""
+    dataset = ds.dataset(snapshot_path(name), format='parquet', partitioning='hive')
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        yield batch.to_pandas()
@@ -16,6 +16,104 @@ PRIMARY KEY (order_id),
 FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
 );
 
+-- Dashboard filters: date range scans and per-customer order counts
+CREATE INDEX idx_orders_order_date ON orders (order_date);
+CREATE INDEX idx_orders_customer_date ON orders (customer_id, order_date);
+
+CREATE TABLE etl_watermarks (
+table_name VARCHAR(64),
+last_key BIGINT,
+last_timestamp DATETIME,
+updated_at DATETIME,
+PRIMARY KEY (table_name)
+);
+
+-- Order files already ingested, so reruns only parse new or rewritten partitions
+CREATE TABLE etl_ingest_manifest (
+file_path VARCHAR(512),
+table_name VARCHAR(64),
+file_size BIGINT,
+modified_ns BIGINT,
+rows_loaded INT,
+rows_rejected INT,
+ingested_at DATETIME,
+PRIMARY KEY (file_path)
+);
+
+-- Revenue rollups maintained by the ETL for the dashboard
+CREATE TABLE revenue_daily (
+order_day DATE,
+total_revenue FLOAT,
+order_count INT,
+PRIMARY KEY (order_day)
+);
+
+CREATE TABLE revenue_weekly (
+week_ending DATE,
+total_revenue FLOAT,
+order_count INT,
+PRIMARY KEY (week_ending)
+);
+
+CREATE TABLE customer_revenue (
+customer_id BIGINT,
+total_revenue FLOAT,
+order_count INT,
+updated_at DATETIME,
+PRIMARY KEY (customer_id)
+);
+
+-- Repeat-customer model features, materialised by part_3/feature_materialization.py
+CREATE TABLE customer_features (
+customer_id BIGINT,
+as_of_date DATETIME,
+first_order_date DATETIME,
+last_order_date DATETIME,
+recency_days FLOAT,
+frequency INT,
+monetary FLOAT,
+avg_order_value FLOAT,
+avg_gap_days FLOAT,
+max_gap_days FLOAT,
+tenure_days FLOAT,
+repeat_customer INT,
+updated_at DATETIME,
+PRIMARY KEY (customer_id)
+);
+
+-- The same features as of the latest order date, without the label; scored by part_3/batch_score.py
+CREATE TABLE customer_scoring_features (
+customer_id BIGINT,
+as_of_date DATETIME,
+first_order_date DATETIME,
+last_order_date DATETIME,
+recency_days FLOAT,
+frequency INT,
+monetary FLOAT,
+avg_order_value FLOAT,
+avg_gap_days FLOAT,
+max_gap_days FLOAT,
+tenure_days FLOAT,
+updated_at DATETIME,
+PRIMARY KEY (customer_id)
+);
+
+CREATE TABLE customer_features_state (
+name VARCHAR(64),
+last_run DATETIME,
+as_of_date DATETIME,
+PRIMARY KEY (name)
+);
+
+-- Written by part_3/batch_score.py, which replaces the table on every run
+CREATE TABLE customer_predictions (
+customer_id BIGINT,
+repeat_probability FLOAT,
+predicted_repeat INT,
+model_version VARCHAR(32),
+scored_at DATETIME
+);
+
 select * from customers;
 
 SELECT customer_id
@@ -1,119 +1,299 @@
+import argparse
+import os
+import sys
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, BigInteger, Float, String, Date
+from sqlalchemy import inspect, BigInteger, Float, String, Date
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.bulk_loader import BACKENDS, bulk_write
+from common.compact import maybe_compact
+from common.db import get_engine
+from common.instrumentation import instrument, stage
+from common.staging import clear_snapshot, write_snapshot, upsert_snapshot
+from incremental_load import (enable_sqlite_foreign_keys, ensure_schema, ensure_indexes,
+                              load_customers_incrementally, read_orders_watermark, load_orders_incrementally)
+from partitioned_ingest import (resolve_partitions, read_manifest, pending_partitions, clear_manifest,
+                                record_partition, parse_partitions)
+from rollups import rebuild_rollups
+from schema import customers_schema, orders_schema, apply_schema, key_index, KeySet, QuarantineWriter
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-DB_USER = 'root'
-DB_PASSWORD = 'Muw0okm_PL<'
-DB_HOST = 'localhost'
-DB_PORT = '3306'
-DB_NAME = 'delivery'
-
-DATABASE_URL = f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+QUARANTINE_DIR = os.environ.get('QUARANTINE_DIR', '../quarantine')
 
-customers_expected_types = {
-    'customer_id': 'Int64',
-    'customer_name': 'string'
-}
+CUSTOMERS_CSV = '../customers.csv'
+CUSTOMERS_COLUMNS = ['customer_id', 'name']
+CUSTOMERS_RENAME_MAP = {'customer_id': 'customer_id', 'name': 'customer_name'}
+CUSTOMERS_DTYPE_MAP = {'customer_id': BigInteger(), 'customer_name': String(255)}
 
-orders_expected_types = {
-    'order_id': 'Int64',
-    'customer_id': 'Int64',
-    'total_amount': 'float64',
-    'order_date': 'datetime64[ns]'
-}
+ORDERS_CSV = '../order.csv'
+ORDERS_COLUMNS = ['id', 'customer_id', 'total_amount', 'created_at']
+ORDERS_RENAME_MAP = {'id': 'order_id', 'customer_id': 'customer_id', 'total_amount': 'total_amount',
+                     'created_at': 'order_date'}
+ORDERS_DTYPE_MAP = {'order_id': BigInteger(), 'customer_id': BigInteger(), 'total_amount': Float(),
+                    'order_date': Date()}
 
 
+@instrument(lambda file_path, *args, **kwargs: f'load_csv.{os.path.basename(file_path)}')
 def load_csv(file_path, columns, rename_map):
     df = pd.read_csv(file_path, usecols=columns)
     df.rename(columns=rename_map, inplace=True)
     return df
 
 
-def validate_and_clean(df, expected_types, unique_column=None):
-    """Validates and cleans data to match expected data types."""
-    logger.info("Starting data validation and cleaning.")
-
-    for column, expected_type in expected_types.items():
-        # Check for missing values and fill if necessary
-        if df[column].isnull().any():
-            logger.warning(f"Missing values in column '{column}'. Filling with NaN.")
-            df[column] = df[column].fillna(value=pd.NA)
-
-        # Validate and convert types
-        if not pd.api.types.is_dtype_equal(df[column].dtype, expected_type):
-            logger.warning(f"Type mismatch for column '{column}'. Converting to {expected_type}.")
-            df[column] = df[column].astype(expected_type)
-
-    # Specifically for orders: Remove negative values from total_amount
-    if 'total_amount' in df.columns:
-        if (df['total_amount'] < 0).any():
-            logger.warning("Removing negative values from 'total_amount'.")
-            df = df[df['total_amount'] >= 0]
-
-    # Remove orders without a valid customer_id
-    if 'customer_id' in df.columns:
-        initial_count = df.shape[0]
-        df = df[df['customer_id'].notna() & (df['customer_id'] != '')]
-        removed_count = initial_count - df.shape[0]
-        if removed_count > 0:
-            logger.warning(f"Removed {removed_count} orders without a valid customer_id.")
-
-    # Ensure unique constraints on specified column
-    if unique_column and df[unique_column].duplicated().any():
-        logger.warning(f"Duplicate values found in '{unique_column}'. Dropping duplicates.")
-        df.drop_duplicates(subset=unique_column, inplace=True)
-
-    logger.info("Data validation and cleaning completed.")
-    return df
+def load_csv_chunks(file_path, columns, rename_map, chunksize):
+    """Yields the CSV file in renamed chunks so it is never held in memory whole."""
+    for chunk in pd.read_csv(file_path, usecols=columns, chunksize=chunksize):
+        chunk.rename(columns=rename_map, inplace=True)
+        yield chunk
 
 
-def load_to_database(df, table_name, dtype_map, chunksize=500):
-    """Loads data into MySQL database in chunks."""
-    try:
-        engine = create_engine(DATABASE_URL)
-        with engine.begin() as connection:
-            df.to_sql(table_name, con=connection, if_exists='replace', index=False, dtype=dtype_map,
-                      chunksize=chunksize)
+@instrument(lambda df, schema, *args, **kwargs: f"validate_and_clean.{schema['name']}",
+            rows_in=lambda df, *args, **kwargs: len(df))
+def validate_and_clean(df, schema, quarantine=None, reference_keys=None, seen_keys=None):
+    """Validates data against a declarative schema, quarantining rejected rows with reason codes.
+
+    seen_keys is a KeySet of the keys accepted by earlier chunks, so cross-chunk duplicate detection
+    costs 8 bytes per key instead of a copy of every row.
+    """
+    logger.info(f"Starting data validation and cleaning of {schema['name']}.")
+    clean_df, rejected_df = apply_schema(df, schema, reference_keys=reference_keys, seen_keys=seen_keys)
+    report_rejected(rejected_df, schema, quarantine)
+    logger.info(f"Data validation and cleaning completed: {len(clean_df)} valid, {len(rejected_df)} rejected.")
+    return maybe_compact(clean_df)
+
+
+def report_rejected(rejected_df, schema, quarantine=None):
+    if rejected_df.empty:
+        return
+    for reason, count in rejected_df['reject_reason'].value_counts().items():
+        logger.warning(f"Rejected {count} {schema['name']} rows: {reason}.")
+    if quarantine is not None:
+        quarantine.write(rejected_df, schema['name'])
+
+
+def open_quarantine(table_name):
+    return QuarantineWriter(os.path.join(QUARANTINE_DIR, f'{table_name}.parquet'))
+
+
+def load_to_database(df, table_name, dtype_map, chunksize=500, if_exists='replace', engine=None, backend='to_sql',
+                     **backend_options):
+    """Loads data into MySQL database in chunks with the chosen bulk-write backend."""
+    with stage(f'load_to_database.{table_name}', rows_in=len(df)) as metrics:
+        try:
+            engine = engine or get_engine()
+            bulk_write(engine, df, table_name, dtype_map, backend=backend, if_exists=if_exists, chunksize=chunksize,
+                       **backend_options)
             logger.info(f"{table_name.capitalize()} data loaded successfully.")
-    except SQLAlchemyError as e:
-        logger.error(f"Database loading error for {table_name}: {e}")
-
-
-def run_etl():
-    customers_df = load_csv(
-        '../customers.csv',
-        columns=['customer_id', 'name'],
-        rename_map={'customer_id': 'customer_id', 'name': 'customer_name'}
-    )
-    orders_df = load_csv(
-        '../order.csv',
-        columns=['id', 'customer_id', 'total_amount', 'created_at'],
-        rename_map={'id': 'order_id', 'customer_id': 'customer_id', 'total_amount': 'total_amount',
-                    'created_at': 'order_date'}
-    )
-
-    # Validate and clean customers data
-    customers_df = validate_and_clean(customers_df, customers_expected_types, unique_column='customer_id')
+            metrics.rows_out = len(df)
+            return True
+        except (SQLAlchemyError, ValueError) as e:
+            logger.error(f"Database loading error for {table_name}: {e}")
+            metrics.rows_out = 0
+            metrics.failed = True
+            return False
 
-    # Validate and clean orders data
-    orders_df = validate_and_clean(orders_df, orders_expected_types, unique_column='order_id')
+
+def stream_orders_to_database(chunksize, engine, reference_keys, quarantine, snapshot, backend='to_sql', workers=4):
+    """Reads, validates, dedupes and loads orders one chunk at a time."""
+    seen_order_ids = KeySet()
+    total_rows = 0
+    for chunk_number, chunk in enumerate(load_csv_chunks(ORDERS_CSV, ORDERS_COLUMNS, ORDERS_RENAME_MAP,
+                                                         chunksize)):
+        chunk = validate_and_clean(chunk, orders_schema, quarantine, reference_keys, seen_order_ids)
+        seen_order_ids.add(chunk['order_id'].to_numpy(dtype='int64'))
+
+        # The first chunk recreates the table, the rest append to it
+        if_exists = 'replace' if chunk_number == 0 else 'append'
+        if not load_to_database(chunk, 'orders', dtype_map=ORDERS_DTYPE_MAP, if_exists=if_exists, engine=engine,
+                                backend=backend, workers=workers, key_column='order_id'):
+            logger.error(f"Stopping streaming load at chunk {chunk_number}.")
+            return
+        if snapshot:
+            write_snapshot(chunk, 'orders', date_column='order_date')
+        total_rows += len(chunk)
+        logger.info(f"Chunk {chunk_number}: loaded {len(chunk)} orders ({total_rows} total).")
+
+
+def stream_orders_incrementally(chunksize, engine, reference_keys, quarantine, snapshot, known_customer_ids):
+    """Streams orders chunk by chunk, upserting only those past the watermark read before the first chunk."""
+    watermark = read_orders_watermark(engine)
+    seen_order_ids = KeySet()
+    for chunk in load_csv_chunks(ORDERS_CSV, ORDERS_COLUMNS, ORDERS_RENAME_MAP, chunksize):
+        chunk = validate_and_clean(chunk, orders_schema, quarantine, reference_keys, seen_order_ids)
+        seen_order_ids.add(chunk['order_id'].to_numpy(dtype='int64'))
+        new_orders = load_orders_incrementally(chunk, engine, known_customer_ids, watermark)
+        if snapshot:
+            upsert_snapshot(new_orders, 'orders', 'order_id', date_column='order_date')
+
+
+def load_order_partitions(source, engine, reference_keys, quarantine, snapshot, incremental=False,
+                          known_customer_ids=None, backend='to_sql', workers=4, ingest_workers=None):
+    """Parses the order files matching `source` in a process pool and loads them one partition at a time.
+
+    Full loads replace the orders table and record every partition in the ingest manifest afresh;
+    incremental loads skip the partitions already recorded and upsert the orders of the rest.
+    """
+    paths = resolve_partitions(source)
+    if not paths:
+        logger.error(f"No order files found for '{source}'.")
+        return
+    with engine.begin() as connection:
+        if incremental:
+            paths = pending_partitions(paths, read_manifest(connection, 'orders'))
+        else:
+            clear_manifest(connection, 'orders')
+    if not paths:
+        logger.info("Every order partition has been loaded already.")
+        return
+
+    logger.info(f"Ingesting {len(paths)} order partitions with {ingest_workers or os.cpu_count()} parser processes.")
+    total_rows = 0
+    partitions = parse_partitions(paths, ORDERS_COLUMNS, ORDERS_RENAME_MAP, orders_schema, reference_keys,
+                                  ingest_workers)
+    for partition_number, (path, orders_df, rejected_df) in enumerate(partitions):
+        report_rejected(rejected_df, orders_schema, quarantine)
+        if incremental:
+            # The manifest decides which files are new, so no order_id watermark filters their rows
+            new_orders = load_orders_incrementally(orders_df, engine, known_customer_ids, (None, None))
+            if snapshot:
+                upsert_snapshot(new_orders, 'orders', 'order_id', date_column='order_date')
+        else:
+            if_exists = 'replace' if partition_number == 0 else 'append'
+            if not load_to_database(orders_df, 'orders', dtype_map=ORDERS_DTYPE_MAP, if_exists=if_exists,
+                                    engine=engine, backend=backend, workers=workers, key_column='order_id'):
+                logger.error(f"Stopping partitioned load at {path}.")
+                return
+            if snapshot:
+                write_snapshot(orders_df, 'orders', date_column='order_date')
+        with engine.begin() as connection:
+            record_partition(connection, 'orders', path, len(orders_df), len(rejected_df))
+        total_rows += len(orders_df)
+        logger.info(f"{os.path.basename(path)}: loaded {len(orders_df)} orders, rejected {len(rejected_df)} "
+                    f"({total_rows} total).")
+
+
+def run_etl(stream=False, chunksize=100_000, incremental=False, backend='to_sql', workers=4, snapshot=True,
+            orders_source=None, ingest_workers=None, customers_csv=None):
+    """Runs the ETL, optionally streaming orders in chunks of `chunksize` rows.
+
+    With `incremental`, only new or changed rows are upserted into the keyed tables instead of replacing them.
+    Full loads write through the bulk-write `backend` (see common/bulk_loader.py). With `snapshot`, the
+    cleaned rows are also staged as Parquet (orders partitioned by month) for the dashboard and model stages.
+    `orders_source` (a directory or glob of order files) replaces ORDERS_CSV with partitions parsed by
+    `ingest_workers` processes; see load_order_partitions.
+    """
+    customers_df = load_csv(customers_csv or CUSTOMERS_CSV, columns=CUSTOMERS_COLUMNS,
+                            rename_map=CUSTOMERS_RENAME_MAP)
+
+    customers_quarantine = open_quarantine('customers')
+    orders_quarantine = open_quarantine('orders')
+    try:
+        # Validate and clean customers data
+        customers_df = validate_and_clean(customers_df, customers_schema, customers_quarantine)
+
+        # Orders must reference a valid customer, checked against a sorted index of customer ids
+        reference_keys = {'customers': key_index(customers_df['customer_id'])}
+        load_tables(customers_df, reference_keys, orders_quarantine, stream, chunksize, incremental, backend,
+                    workers, snapshot, orders_source, ingest_workers)
+    finally:
+        customers_quarantine.close()
+        orders_quarantine.close()
+    if customers_quarantine.rows or orders_quarantine.rows:
+        logger.warning(f"Quarantined {customers_quarantine.rows} customers and {orders_quarantine.rows} orders "
+                       f"in {QUARANTINE_DIR}.")
+
+
+def load_tables(customers_df, reference_keys, quarantine, stream, chunksize, incremental, backend, workers,
+                snapshot, orders_source=None, ingest_workers=None):
+    """Loads the validated customers, then reads, validates and loads orders in the requested mode."""
+    engine = get_engine()
+    load_customers_and_orders(engine, customers_df, reference_keys, quarantine, stream, chunksize, incremental,
+                              backend, workers, snapshot, orders_source, ingest_workers)
+    if inspect(engine).has_table('orders'):
+        ensure_indexes(engine)
+        if not incremental:
+            rebuild_rollups(engine)
+
+
+def load_customers_and_orders(engine, customers_df, reference_keys, quarantine, stream, chunksize, incremental,
+                              backend, workers, snapshot, orders_source=None, ingest_workers=None):
+
+    if incremental:
+        enable_sqlite_foreign_keys(engine)
+        if not ensure_schema(engine):
+            return
+        known_customer_ids = load_customers_incrementally(customers_df, engine)
+        # Orders may reference customers loaded by earlier runs that this export no longer lists
+        reference_keys = {**reference_keys,
+                          'customers': np.union1d(reference_keys['customers'], known_customer_ids)}
+        if snapshot:
+            upsert_snapshot(customers_df, 'customers', 'customer_id')
+        if orders_source:
+            load_order_partitions(orders_source, engine, reference_keys, quarantine, snapshot, incremental=True,
+                                  known_customer_ids=known_customer_ids, ingest_workers=ingest_workers)
+            return
+        if stream:
+            stream_orders_incrementally(chunksize, engine, reference_keys, quarantine, snapshot, known_customer_ids)
+            return
+        orders_df = load_csv(ORDERS_CSV, columns=ORDERS_COLUMNS, rename_map=ORDERS_RENAME_MAP)
+        orders_df = validate_and_clean(orders_df, orders_schema, quarantine, reference_keys)
+        new_orders = load_orders_incrementally(orders_df, engine, known_customer_ids, read_orders_watermark(engine))
+        if snapshot:
+            upsert_snapshot(new_orders, 'orders', 'order_id', date_column='order_date')
+        return
 
     # Import data in chunks
-    load_to_database(
-        customers_df,
-        'customers',
-        dtype_map={'customer_id': BigInteger(), 'customer_name': String(255)}
-    )
-    load_to_database(
-        orders_df,
-        'orders',
-        dtype_map={'order_id': BigInteger(), 'customer_id': BigInteger(), 'total_amount': Float(), 'order_date': Date()}
-    )
+    load_to_database(customers_df, 'customers', dtype_map=CUSTOMERS_DTYPE_MAP, engine=engine, backend=backend,
+                     workers=workers, key_column='customer_id')
+    if snapshot:
+        clear_snapshot('customers')
+        clear_snapshot('orders')
+        write_snapshot(customers_df, 'customers')
+
+    if orders_source:
+        load_order_partitions(orders_source, engine, reference_keys, quarantine, snapshot, backend=backend,
+                              workers=workers, ingest_workers=ingest_workers)
+        return
+
+    if stream:
+        stream_orders_to_database(chunksize, engine, reference_keys, quarantine, snapshot, backend=backend,
+                                  workers=workers)
+        return
+
+    orders_df = load_csv(ORDERS_CSV, columns=ORDERS_COLUMNS, rename_map=ORDERS_RENAME_MAP)
+
+    # Validate and clean orders data
+    orders_df = validate_and_clean(orders_df, orders_schema, quarantine, reference_keys)
+
+    load_to_database(orders_df, 'orders', dtype_map=ORDERS_DTYPE_MAP, engine=engine, backend=backend,
+                     workers=workers, key_column='order_id')
+    if snapshot:
+        write_snapshot(orders_df, 'orders', date_column='order_date')
 
 
 if __name__ == "__main__":
-    run_etl()
+    parser = argparse.ArgumentParser(description="Import customers and orders CSV files into the database.")
+    parser.add_argument('--stream', action='store_true', help="Load orders chunk by chunk in bounded memory.")
+    parser.add_argument('--chunksize', type=int, default=100_000, help="Rows per chunk in streaming mode.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Upsert only rows past the stored watermarks instead of replacing the tables.")
+    parser.add_argument('--backend', choices=BACKENDS, default='to_sql', help="Bulk-write backend for full loads.")
+    parser.add_argument('--workers', type=int, default=4, help="Writer connections for the 'parallel' backend.")
+    parser.add_argument('--no-snapshot', action='store_true', help="Skip writing the Parquet staging snapshots.")
+    parser.add_argument('--customers', default=None, help=f"Customers CSV file (default: {CUSTOMERS_CSV}).")
+    parser.add_argument('--orders', default=None,
+                        help="Directory or glob of order CSV partitions, e.g. '../exports/orders-*.csv', "
+                             "parsed in parallel instead of --stream (default: the single file "
+                             f"{ORDERS_CSV}). With --incremental, partitions already loaded are skipped.")
+    parser.add_argument('--ingest-workers', type=int, default=None,
+                        help="Processes parsing order partitions (default: one per core).")
+    args = parser.parse_args()
+    run_etl(stream=args.stream, chunksize=args.chunksize, incremental=args.incremental, backend=args.backend,
+            workers=args.workers, snapshot=not args.no_snapshot, orders_source=args.orders,
+            ingest_workers=args.ingest_workers, customers_csv=args.customers)
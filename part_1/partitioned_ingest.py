@@ -0,0 +1,128 @@
+import glob
+import itertools
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, BigInteger, Integer, String, DateTime, select
+
+from common.compact import maybe_compact
+from incremental_load import upsert_rows
+from schema import KeySet, apply_schema
+
+logger = logging.getLogger(__name__)
+
+# Input partitions already loaded, so incremental reruns only parse files that are new or were rewritten
+metadata = MetaData()
+
+ingest_manifest_table = Table(
+    'etl_ingest_manifest', metadata,
+    Column('file_path', String(512), primary_key=True),
+    Column('table_name', String(64)),
+    Column('file_size', BigInteger),
+    Column('modified_ns', BigInteger),
+    Column('rows_loaded', Integer),
+    Column('rows_rejected', Integer),
+    Column('ingested_at', DateTime),
+)
+
+# Set once per worker process by init_worker, so tasks only carry a file path
+_reference_keys = None
+
+
+def resolve_partitions(source):
+    """Input files for `source`: every CSV in a directory, the files matching a glob, or a single file."""
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, '*.csv'))
+    else:
+        paths = glob.glob(source)
+    # Sorted names keep hourly/daily exports in delivery order, so the earliest copy of an order wins
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_manifest(connection, table_name):
+    """Returns {file_path: (file_size, modified_ns)} of the partitions already loaded into a table."""
+    metadata.create_all(connection, checkfirst=True)
+    rows = connection.execute(
+        select(ingest_manifest_table.c.file_path, ingest_manifest_table.c.file_size,
+               ingest_manifest_table.c.modified_ns)
+        .where(ingest_manifest_table.c.table_name == table_name)
+    )
+    return {row.file_path: (row.file_size, row.modified_ns) for row in rows}
+
+
+def pending_partitions(paths, manifest):
+    """Keeps the partitions missing from the manifest or changed on disk since they were loaded."""
+    return [path for path in paths if manifest.get(path) != file_signature(path)]
+
+
+def clear_manifest(connection, table_name):
+    metadata.create_all(connection, checkfirst=True)
+    connection.execute(ingest_manifest_table.delete().where(ingest_manifest_table.c.table_name == table_name))
+
+
+def record_partition(connection, table_name, path, rows_loaded, rows_rejected):
+    file_size, modified_ns = file_signature(path)
+    upsert_rows(connection, ingest_manifest_table, pd.DataFrame([{
+        'file_path': path,
+        'table_name': table_name,
+        'file_size': file_size,
+        'modified_ns': modified_ns,
+        'rows_loaded': rows_loaded,
+        'rows_rejected': rows_rejected,
+        'ingested_at': datetime.now(),
+    }]))
+
+
+def init_worker(reference_keys):
+    global _reference_keys
+    _reference_keys = reference_keys
+
+
+def parse_partition(path, columns, rename_map, schema):
+    """Reads and validates one partition; returns its typed valid rows and raw rejected rows."""
+    df = pd.read_csv(path, usecols=columns)
+    df.rename(columns=rename_map, inplace=True)
+    clean_df, rejected_df = apply_schema(df, schema, reference_keys=_reference_keys)
+    return maybe_compact(clean_df), rejected_df
+
+
+def parse_partitions(paths, columns, rename_map, schema, reference_keys=None, workers=None):
+    """Parses and validates partitions in a process pool, yielding (path, clean_df, rejected_df) in path order.
+
+    At most two partitions per worker are in flight, so memory stays bounded by the pool size rather
+    than the number of files. Rows whose unique key appeared in an earlier partition are moved to the
+    rejected rows, so the key stays unique across every partition of the run.
+    """
+    workers = workers or os.cpu_count()
+    unique_column = schema.get('unique')
+    seen_keys = KeySet()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(reference_keys,)) as executor:
+        remaining = iter(paths)
+        in_flight = deque((path, executor.submit(parse_partition, path, columns, rename_map, schema))
+                          for path in itertools.islice(remaining, 2 * workers))
+        while in_flight:
+            path, future = in_flight.popleft()
+            clean_df, rejected_df = future.result()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                in_flight.append((next_path, executor.submit(parse_partition, next_path, columns, rename_map,
+                                                             schema)))
+
+            if unique_column:
+                keys = clean_df[unique_column].to_numpy(dtype='int64')
+                duplicate = seen_keys.contains(keys)
+                if duplicate.any():
+                    rejected_df = pd.concat([rejected_df, clean_df[duplicate].astype(object).assign(
+                        reject_reason=f'duplicate_{unique_column}')])
+                    clean_df = clean_df[~duplicate]
+                seen_keys.add(keys[~duplicate])
+            yield path, clean_df, rejected_df
@@ -0,0 +1,127 @@
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, BigInteger, Integer, Float, Date, DateTime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.sql_functions import week_ending
+from common.sql_helpers import IN_LIST_BATCH_SIZE, execute
+
+logger = logging.getLogger(__name__)
+
+# Pre-aggregated revenue for the dashboard charts and summary metrics, kept in step with orders by the ETL
+metadata = MetaData()
+
+revenue_daily_table = Table(
+    'revenue_daily', metadata,
+    Column('order_day', Date, primary_key=True),
+    Column('total_revenue', Float),
+    Column('order_count', Integer),
+)
+
+revenue_weekly_table = Table(
+    'revenue_weekly', metadata,
+    Column('week_ending', Date, primary_key=True),
+    Column('total_revenue', Float),
+    Column('order_count', Integer),
+)
+
+customer_revenue_table = Table(
+    'customer_revenue', metadata,
+    Column('customer_id', BigInteger, primary_key=True, autoincrement=False),
+    Column('total_revenue', Float),
+    Column('order_count', Integer),
+    Column('updated_at', DateTime),
+)
+
+
+def insert_daily(connection, where='', params=None):
+    execute(connection,
+            "INSERT INTO revenue_daily (order_day, total_revenue, order_count) "
+            "SELECT DATE(order_date), SUM(total_amount), COUNT(*) FROM orders "
+            f"{where} GROUP BY DATE(order_date)", params)
+
+
+def insert_weekly(connection, where='', params=None):
+    week = week_ending('order_day', connection.dialect.name)
+    execute(connection,
+            "INSERT INTO revenue_weekly (week_ending, total_revenue, order_count) "
+            f"SELECT {week}, SUM(total_revenue), SUM(order_count) FROM revenue_daily "
+            f"{where} GROUP BY {week}", params)
+
+
+def insert_customers(connection, where='', params=None):
+    execute(connection,
+            "INSERT INTO customer_revenue (customer_id, total_revenue, order_count, updated_at) "
+            "SELECT customer_id, SUM(total_amount), COUNT(*), :updated_at FROM orders "
+            f"{where} GROUP BY customer_id", {**(params or {}), 'updated_at': datetime.now()})
+
+
+def rebuild_rollups(engine):
+    """Recomputes every rollup table from orders, used after full loads."""
+    metadata.create_all(engine, checkfirst=True)
+    with engine.begin() as connection:
+        for table in (revenue_daily_table, revenue_weekly_table, customer_revenue_table):
+            connection.execute(table.delete())
+        insert_daily(connection)
+        insert_weekly(connection)
+        insert_customers(connection)
+    logger.info("Revenue rollup tables rebuilt.")
+
+
+def contiguous_ranges(values, step=timedelta(days=1)):
+    """Groups dates into [start, end) ranges of values exactly `step` apart."""
+    ranges = []
+    for value in sorted(set(values)):
+        if ranges and ranges[-1][1] == value:
+            ranges[-1][1] = value + step
+        else:
+            ranges.append([value, value + step])
+    return ranges
+
+
+def previous_order_keys(connection, order_ids):
+    """Days and customers that the orders about to be upserted counted towards before the upsert."""
+    ids = [int(order_id) for order_id in order_ids]
+    batches = [pd.DataFrame(execute(connection, "SELECT order_date, customer_id FROM orders "
+                                                "WHERE order_id IN :order_ids",
+                                    {'order_ids': ids[start:start + IN_LIST_BATCH_SIZE]}).all(),
+                            columns=['order_date', 'customer_id'])
+               for start in range(0, len(ids), IN_LIST_BATCH_SIZE)]
+    existing = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=['order_date',
+                                                                                           'customer_id'])
+    return pd.to_datetime(existing['order_date']), existing['customer_id']
+
+
+def refresh_rollups(connection, order_dates, customer_ids):
+    """Recomputes only the days, weeks and customers touched by new or changed orders.
+
+    Each contiguous run of touched days is re-aggregated with one range scan on idx_orders_order_date,
+    and each batch of customers with idx_orders_customer_date.
+    """
+    days = {timestamp.date() for timestamp in pd.to_datetime(pd.Series(order_dates)).dropna()}
+    for start, end in contiguous_ranges(days):
+        params = {'start_day': start, 'end_day': end}
+        execute(connection, "DELETE FROM revenue_daily WHERE order_day >= :start_day AND order_day < :end_day",
+                params)
+        insert_daily(connection, "WHERE order_date >= :start_day AND order_date < :end_day", params)
+
+    # Weeks end on Sunday (weekday 6), matching resample("W")
+    week_endings = {day + timedelta(days=6 - day.weekday()) for day in days}
+    for first_week, end_week in contiguous_ranges(week_endings, step=timedelta(days=7)):
+        params = {'first_week': first_week, 'end_week': end_week,
+                  'first_day': first_week - timedelta(days=6), 'end_day': end_week - timedelta(days=6)}
+        execute(connection, "DELETE FROM revenue_weekly WHERE week_ending >= :first_week AND week_ending < :end_week",
+                params)
+        insert_weekly(connection, "WHERE order_day >= :first_day AND order_day < :end_day", params)
+
+    ids = sorted({int(customer_id) for customer_id in pd.Series(customer_ids).dropna()})
+    for start in range(0, len(ids), IN_LIST_BATCH_SIZE):
+        params = {'customer_ids': ids[start:start + IN_LIST_BATCH_SIZE]}
+        execute(connection, "DELETE FROM customer_revenue WHERE customer_id IN :customer_ids", params)
+        insert_customers(connection, "WHERE customer_id IN :customer_ids", params)
+    logger.info(f"Refreshed rollups for {len(days)} days, {len(week_endings)} weeks and {len(ids)} customers.")
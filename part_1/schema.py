@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Declarative schemas: column types plus the row rules applied in validate_and_clean
+customers_schema = {
+    'name': 'customers',
+    'columns': {
+        'customer_id': 'Int64',
+        'customer_name': 'string'
+    },
+    'required': ['customer_id'],
+    'unique': 'customer_id',
+}
+
+orders_schema = {
+    'name': 'orders',
+    'columns': {
+        'order_id': 'Int64',
+        'customer_id': 'Int64',
+        'total_amount': 'float64',
+        'order_date': 'datetime64[ns]'
+    },
+    'required': ['order_id', 'customer_id'],
+    'non_negative': ['total_amount'],
+    'unique': 'order_id',
+    'references': {'customer_id': 'customers'},
+}
+
+
+def coerce_column(column, expected_type):
+    """Converts a column to the expected type, turning unparseable values into NA instead of raising."""
+    if pd.api.types.is_dtype_equal(column.dtype, expected_type):
+        return column
+    if expected_type == 'Int64':
+        numeric = pd.to_numeric(column, errors='coerce')
+        return numeric.where(numeric % 1 == 0).astype('Int64')
+    if expected_type.startswith('float'):
+        return pd.to_numeric(column, errors='coerce').astype(expected_type)
+    if expected_type.startswith('datetime64'):
+        return pd.to_datetime(column, errors='coerce')
+    return column.astype(expected_type)
+
+
+def sorted_lookup(sorted_keys, keys):
+    """Membership test of `keys` in a sorted unique int64 array via binary search."""
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    positions = np.searchsorted(sorted_keys, keys).clip(max=len(sorted_keys) - 1)
+    return sorted_keys[positions] == keys
+
+
+def key_index(series):
+    """Builds the sorted unique int64 index used by sorted_lookup."""
+    return np.unique(series.dropna().to_numpy(dtype='int64'))
+
+
+class KeySet:
+    """Unique int64 keys accepted by earlier chunks, for duplicate detection across a streamed file.
+
+    Keys are kept in sorted runs whose sizes shrink at least by half from the oldest to the newest. Adding a
+    chunk only merges it with the runs no larger than itself, like carries in a binary counter, so n keys
+    cost O(n log n) in total instead of a re-sort of every key per chunk, and a lookup is a binary search
+    in each of the at most log2(n) runs. Memory is 8 bytes per key, plus a transient copy of the runs being
+    merged.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def add(self, keys):
+        """Adds keys that are not in the set yet (the rows contains() did not flag as duplicates)."""
+        run = np.unique(np.asarray(keys, dtype='int64'))
+        while self.runs and len(self.runs[-1]) <= len(run):
+            # Both runs are sorted, which the stable sort merges in linear time
+            run = np.sort(np.concatenate([self.runs.pop(), run]), kind='stable')
+        if len(run):
+            self.runs.append(run)
+
+    def contains(self, keys):
+        keys = np.asarray(keys, dtype='int64')
+        # Searching in key order walks each run front to back instead of jumping around it
+        order = np.argsort(keys, kind='stable')
+        ordered = keys[order]
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self.runs:
+            found[order] |= sorted_lookup(run, ordered)
+        return found
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+
+def apply_schema(df, schema, reference_keys=None, seen_keys=None):
+    """Coerces types and evaluates every rule in one vectorised pass.
+
+    Returns the typed frame of valid rows and the raw rejected rows with a `reject_reason` column.
+    `reference_keys` maps a referenced table to its sorted keys (see key_index), and `seen_keys` is a KeySet
+    of the keys already accepted by earlier chunks.
+    """
+    typed = pd.DataFrame({column: coerce_column(df[column], expected_type)
+                          for column, expected_type in schema['columns'].items()}, index=df.index)
+
+    masks = {}
+    for column in schema['columns']:
+        masks[f'invalid_{column}'] = (df[column].notna() & typed[column].isna()).to_numpy()
+    for column in schema.get('required', []):
+        masks[f'missing_{column}'] = typed[column].isna().to_numpy()
+    for column in schema.get('non_negative', []):
+        masks[f'negative_{column}'] = (typed[column] < 0).fillna(False).to_numpy(dtype=bool)
+    for column, referenced_table in schema.get('references', {}).items():
+        if reference_keys is None or referenced_table not in reference_keys:
+            continue
+        values = typed[column]
+        masks[f'unknown_{column}'] = values.notna().to_numpy() & ~sorted_lookup(
+            reference_keys[referenced_table], values.fillna(0).to_numpy(dtype='int64'))
+
+    valid = ~np.logical_or.reduce(list(masks.values()))
+
+    # Duplicates only count among otherwise valid rows, keeping the first occurrence
+    unique_column = schema.get('unique')
+    if unique_column:
+        keys = typed[unique_column]
+        duplicate = valid & keys.where(valid).duplicated(keep='first').to_numpy()
+        if seen_keys is not None:
+            duplicate |= valid & seen_keys.contains(keys.fillna(0).to_numpy(dtype='int64'))
+        masks[f'duplicate_{unique_column}'] = duplicate
+        valid &= ~duplicate
+
+    rejected = df[~valid].copy()
+    reasons = np.full(len(rejected), '', dtype=object)
+    for reason, mask in masks.items():
+        hit = mask[~valid]
+        reasons[hit] = np.where(reasons[hit] == '', reason, reasons[hit] + ';' + reason)
+    rejected['reject_reason'] = reasons
+    return typed[valid], rejected
+
+
+class QuarantineWriter:
+    """Appends rejected rows of one table to a Parquet file, opened on first write."""
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+        self.rows = 0
+        # A clean run must not leave the previous run's rejects behind
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, rejected, source_table):
+        if rejected.empty:
+            return
+        # Raw values are kept as strings so every chunk shares one Parquet schema
+        table = pa.Table.from_pandas(
+            rejected.astype('string').assign(source_table=source_table), preserve_index=False
+        )
+        if self.writer is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+        self.rows += len(rejected)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
@@ -1,40 +1,181 @@
+import os
+import sys
+import numpy as np
 import pandas as pd
 import altair as alt
 import streamlit as st
-from sqlalchemy import create_engine
+from sqlalchemy import inspect
+from sqlalchemy.engine import URL
 from sqlalchemy.exc import SQLAlchemyError
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import query_builder
+from common.compact import COMPACT_FRAMES, compact_frame, wide_amounts
+from common.db import database_url, get_engine
+from common.instrumentation import instrument
+from common.loader import read_frames
+from common.staging import read_snapshot, snapshot_bounds, snapshot_version
+
+# Number of data versions kept in memory; older merged frames are evicted first
+CACHE_MAX_ENTRIES = int(os.environ.get("DASHBOARD_CACHE_MAX_ENTRIES", 2))
+
+# Rows sent to the browser per table page, and the most points a chart is drawn with
+PAGE_SIZE = int(os.environ.get("DASHBOARD_PAGE_SIZE", 100))
+MAX_CHART_POINTS = int(os.environ.get("DASHBOARD_MAX_CHART_POINTS", 500))
+
+LOAD_QUERIES = {"customers": "SELECT * FROM customers", "orders": "SELECT * FROM orders"}
+
+# The only order columns the filters, table and charts use
+ORDER_COLUMNS = ["order_id", "customer_id", "total_amount", "order_date"]
+
+
+def merge_orders_and_customers(customers_df, orders_df):
+    merged_df = pd.merge(orders_df, customers_df, on="customer_id")
+    merged_df["order_date"] = pd.to_datetime(merged_df["order_date"])
+    return merged_df
+
+
+# Compact mode keeps one name per customer in a side lookup instead of repeating it on every order row:
+# the join only drops orders of unknown customers, and names are attached to the rows being displayed
+def compact_orders_and_names(customers_df, orders_df):
+    customers_df = customers_df.drop_duplicates("customer_id")
+    customer_names = customers_df.set_index("customer_id")["customer_name"].astype("string[pyarrow]")
+    orders_df = orders_df[orders_df["customer_id"].isin(customer_names.index)].reset_index(drop=True)
+    orders_df = compact_frame(orders_df.assign(order_date=pd.to_datetime(orders_df["order_date"])))
+    return orders_df, compact_frame(customer_names.reset_index()).set_index("customer_id")["customer_name"]
+
+
+# Returns the merged frame and, in compact mode, the customer name lookup (None otherwise)
+def orders_and_names(customers_df, orders_df):
+    if COMPACT_FRAMES:
+        return compact_orders_and_names(customers_df, orders_df)
+    return merge_orders_and_customers(customers_df, orders_df), None
+
+
+# The merged frame is shared across reruns and sessions until the data version changes,
+# so callers must treat it as read-only
+@st.cache_resource(max_entries=CACHE_MAX_ENTRIES, show_spinner="Loading orders...")
+def load_merged_data(db_url, data_version):
+    # Both tables are streamed concurrently; the probed row counts size their column buffers up front
+    frames = read_frames(LOAD_QUERIES, db_url, rows={"orders": data_version[0], "customers": data_version[2]})
+    return orders_and_names(frames["customers"], frames["orders"])
+
+
+# Only the dashboard's columns and the month partitions of the selected date range are read
+@st.cache_resource(max_entries=CACHE_MAX_ENTRIES, show_spinner="Loading orders...")
+def load_merged_snapshot(data_version, start_month=None, end_month=None):
+    customers_df = read_snapshot("customers", columns=["customer_id", "customer_name"])
+    orders_df = read_snapshot("orders", columns=ORDER_COLUMNS, start_month=start_month, end_month=end_month)
+    return orders_and_names(customers_df, orders_df)
+
+
+# One page of the frame sorted like filtered_orders_page_query; only the rows up to the page end are ranked
+def frame_page(df, sort_column, descending, offset, limit):
+    end = offset + limit
+    columns = [sort_column] if sort_column == "order_id" else [sort_column, "order_id"]
+    ranked = df.nlargest(end, columns) if descending else df.nsmallest(end, columns)
+    return ranked.iloc[offset:end]
+
+
+# Averages consecutive points into at most `max_points` buckets, keeping the series' shape and scale
+def downsample(series_df, max_points=MAX_CHART_POINTS):
+    if len(series_df) <= max_points:
+        return series_df
+    buckets = np.arange(len(series_df)) * max_points // len(series_df)
+    return series_df.groupby(buckets).agg({"order_date": "first", "total_amount": "mean"})
+
+
+# Weeks without orders are missing from the SQL aggregate; resample("W") reports them as zero
+def fill_missing_weeks(revenue_over_time):
+    if revenue_over_time.empty:
+        return revenue_over_time
+    weekly = revenue_over_time.assign(order_date=pd.to_datetime(revenue_over_time["order_date"]))
+    weekly = weekly.set_index("order_date")["total_amount"].astype(float)
+    weeks = pd.date_range(weekly.index.min(), weekly.index.max(), freq="W")
+    return weekly.reindex(weeks, fill_value=0.0).rename_axis("order_date").reset_index()
+
 
 class StreamlitDashboard:
-    def __init__(self, db_user, db_password, db_host, db_port, db_name):
-        self.db_url = f"mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+    # Without explicit credentials the shared database settings (env vars or db.ini) are used
+    def __init__(self, db_user=None, db_password=None, db_host=None, db_port=None, db_name=None):
+        if db_user is None:
+            url = database_url()
+        else:
+            url = URL.create("mysql+pymysql", username=db_user, password=db_password, host=db_host,
+                             port=int(db_port), database=db_name)
+        self.db_url = url.render_as_string(hide_password=False)
         self.connection = None
+        self.date_bounds = None
+        self.rollups_available = None
+        self.customer_names = None
 
-    # database connection
+    # database connection, checked out of the shared process-wide pool
     def connect_to_db(self):
         try:
-            engine = create_engine(self.db_url)
-            self.connection = engine.connect()
+            self.connection = get_engine(self.db_url).connect()
             return self.connection
         except SQLAlchemyError as e:
             st.error(f"Database connection failed: {e}")
             return None
 
-    # Load customers and orders data from MySQL database
-    def load_data(self):
+    # Cheap change probe: the cached frame is only rebuilt when this changes
+    def probe_data_version(self):
+        orders_version = self.connection.exec_driver_sql("SELECT COUNT(*), MAX(order_id) FROM orders").one()
+        customers_version = self.connection.exec_driver_sql(
+            "SELECT COUNT(*), MAX(customer_id) FROM customers").one()
+        return tuple(orders_version) + tuple(customers_version)
 
+    # Merged, typed orders frame, served from the in-process cache while the data is unchanged
+    @instrument("dashboard_load_merged_data")
+    def load_merged_data(self, source="database", date_range=None):
+        if source == "parquet":
+            months = [date.strftime("%Y-%m") for date in date_range] if date_range else [None, None]
+            merged_df, self.customer_names = load_merged_snapshot(
+                snapshot_version("orders") + snapshot_version("customers"), *months)
+            return merged_df
         if not self.connection:
-            return None, None
+            return None
+        merged_df, self.customer_names = load_merged_data(self.db_url, self.probe_data_version())
+        return merged_df
+
+    # Compact frames keep names in the side lookup; attach them to the rows about to be shown
+    def with_customer_names(self, df):
+        if self.customer_names is None or "customer_name" in df.columns:
+            return df
+        return df.assign(customer_name=df["customer_id"].map(self.customer_names))
+
+    # Start and end date inputs defaulting to the data's bounds; None when the range is empty
+    def display_date_inputs(self, min_date, max_date):
+        st.sidebar.subheader("Date Filter")
+        start_date = st.sidebar.date_input("Start Date", value=min_date.date())
+        end_date = st.sidebar.date_input("End Date", value=max_date.date())
 
-        customers_query = "SELECT * FROM customers"
-        orders_query = "SELECT * FROM orders"
-        customers_df = pd.read_sql(customers_query, self.connection)
-        orders_df = pd.read_sql(orders_query, self.connection)
-        return customers_df, orders_df
+        if start_date > end_date:
+            st.error("Start date must be less than or equal to end date.")
+            return None
+        return start_date, end_date
 
-    # Display sidebar filters
-    def display_filters(self, merged_df):
+    # Parquet mode asks for the date range first, so only its month partitions need to be read;
+    # the bounds come from the snapshot's footer statistics
+    def display_snapshot_date_filter(self):
         st.sidebar.header("Filters")
+        try:
+            min_date, max_date = snapshot_bounds("orders", "order_date")
+            if min_date is None:
+                st.error("The orders snapshot is empty.")
+                return None
+            self.date_bounds = (pd.Timestamp(min_date), pd.Timestamp(max_date))
+            return self.display_date_inputs(*self.date_bounds)
+        except Exception as e:
+            st.error(f"Error applying date filter: {e}")
+            return None
+
+    # Display sidebar filters; `date_range` is given when the dates were already chosen before loading
+    @instrument("dashboard_display_filters", rows_in=lambda self, merged_df, *args, **kwargs: len(merged_df))
+    def display_filters(self, merged_df, date_range=None):
+        if date_range is None:
+            st.sidebar.header("Filters")
 
         # Verify if necessary columns exist in the DataFrame
         required_columns = ["order_date", "total_amount", "customer_id", "order_id"]
@@ -52,17 +193,16 @@ class StreamlitDashboard:
                 return merged_df
 
         try:
-            st.sidebar.subheader("Date Filter")
-            start_date = st.sidebar.date_input("Start Date", value=merged_df["order_date"].min().date())
-            end_date = st.sidebar.date_input("End Date", value=merged_df["order_date"].max().date())
-
-            if start_date > end_date:
-                st.error("Start date must be less than or equal to end date.")
-                return merged_df
+            if date_range is None:
+                date_range = self.display_date_inputs(merged_df["order_date"].min(), merged_df["order_date"].max())
+                if date_range is None:
+                    return merged_df
+            start_date, end_date = date_range
 
+            # Up to the end of the end date: snapshots keep the time of day of each order
             date_filtered_df = merged_df[
                 (merged_df["order_date"] >= pd.to_datetime(start_date)) &
-                (merged_df["order_date"] <= pd.to_datetime(end_date))
+                (merged_df["order_date"] < pd.to_datetime(end_date) + pd.Timedelta(days=1))
                 ]
         except Exception as e:
             st.error(f"Error applying date filter: {e}")
@@ -111,19 +251,165 @@ class StreamlitDashboard:
 
         return final_filtered_df
 
-    def display_dashboard(self, filtered_df):
+    # Display sidebar filters and return them as query parameters instead of filtering in pandas
+    def display_filters_sql(self):
+        st.sidebar.header("Filters")
+
+        try:
+            bounds = self.connection.execute(query_builder.date_bounds_query()).one()
+            if bounds.min_date is None:
+                st.error("The orders table is empty.")
+                return None
+            min_date, max_date = pd.to_datetime(bounds.min_date), pd.to_datetime(bounds.max_date)
+            self.date_bounds = (min_date, max_date)
+
+            st.sidebar.subheader("Date Filter")
+            start_date = st.sidebar.date_input("Start Date", value=min_date.date())
+            end_date = st.sidebar.date_input("End Date", value=max_date.date())
+
+            if start_date > end_date:
+                st.error("Start date must be less than or equal to end date.")
+                return None
+            params = query_builder.filter_params(start_date, end_date)
+        except Exception as e:
+            st.error(f"Error applying date filter: {e}")
+            return None
+
+        # Total Spend Filter
+        try:
+            # the slider maximum based on the filtered date range
+            max_total_amount = self.connection.execute(query_builder.max_amount_query(), params).scalar()
+
+            st.sidebar.markdown("<h5 style='font-size: 16px;'>Filter by Total Spent Amount</h5>", unsafe_allow_html=True)
+
+            params["min_amount"] = st.sidebar.slider(
+                "Min - Max",
+                min_value=0,
+                max_value=int(max_total_amount or 0),
+                value=0,
+            )
+        except Exception as e:
+            st.error(f"Error applying total spend filter: {e}")
+            return params
+
+        # Orders Count Filter (Dropdown)
+        try:
+            max_order_count = self.connection.execute(query_builder.max_order_count_query(), params).scalar()
+
+            st.sidebar.markdown("<h5 style='font-size: 16px;'>Filter by Number of Orders</h5>", unsafe_allow_html=True)
+
+            params["min_orders"] = st.sidebar.selectbox(
+                "Number of Orders",
+                options=list(range(1, int(max_order_count or 0) + 1)),
+                index=0
+            ) or 1
+        except Exception as e:
+            st.error(f"Error applying order count filter: {e}")
+
+        return params
+
+    # Paginated, sortable table: only the visible page is fetched and serialised to the browser
+    def display_table(self, total_rows, fetch_page):
         st.header("Filtered Data Table")
-        st.dataframe(filtered_df)
+        pages = max(-(-total_rows // PAGE_SIZE), 1)
+        # Narrower filters can leave the remembered page past the last one
+        if st.session_state.get("table_page", 1) > pages:
+            st.session_state["table_page"] = pages
+
+        sort_control, direction_control, page_control = st.columns(3)
+        sort_column = sort_control.selectbox("Sort by", query_builder.SORT_COLUMNS, key="table_sort")
+        descending = direction_control.checkbox("Descending", key="table_descending")
+        page = page_control.number_input("Page", min_value=1, max_value=pages, step=1, key="table_page")
+
+        offset = (page - 1) * PAGE_SIZE
+        st.dataframe(fetch_page(sort_column, descending, offset, PAGE_SIZE), hide_index=True)
+        st.caption(f"Rows {min(offset + 1, total_rows):,}-{min(offset + PAGE_SIZE, total_rows):,} "
+                   f"of {total_rows:,} (page {page} of {pages})")
+
+    def display_dashboard(self, filtered_df):
+        self.display_table(len(filtered_df), lambda sort_column, descending, offset, limit: self.with_customer_names(
+            frame_page(filtered_df, sort_column, descending, offset, limit)))
+
+        # Amounts may be stored as float32 (see common/compact.py); totals are summed in float64
+        amounts = wide_amounts(filtered_df["total_amount"])
+        self.display_summary_metrics(
+            amounts.sum(), filtered_df['customer_id'].nunique(), filtered_df['order_id'].nunique()
+        )
+
+        top_customers = amounts.groupby(filtered_df["customer_id"]).sum().nlargest(10).reset_index()
+        self.display_top_customers_chart(top_customers)
+
+        revenue_over_time = amounts.set_axis(filtered_df["order_date"]).resample("W").sum().reset_index()
+        self.display_revenue_chart(revenue_over_time)
+
+    # Same dashboard, with the table rows, metrics and chart aggregates computed by the database
+    def display_dashboard_sql(self, params):
+        total_rows = self.connection.execute(query_builder.filtered_count_query(params), params).scalar()
+        self.display_table(total_rows, lambda sort_column, descending, offset, limit: pd.read_sql(
+            query_builder.filtered_orders_page_query(params, sort_column, descending, limit, offset),
+            self.connection, params=params))
+
+        if query_builder.rollups_apply(params) and self.has_rollups():
+            self.display_rollup_aggregates(params)
+            return
+
+        metrics = self.connection.execute(query_builder.summary_metrics_query(params), params).one()
+        self.display_summary_metrics(float(metrics.total_revenue or 0), metrics.unique_customers, metrics.total_orders)
+
+        top_customers = pd.read_sql(query_builder.top_customers_query(params), self.connection, params=params)
+        self.display_top_customers_chart(top_customers)
+
+        revenue_over_time = pd.read_sql(
+            query_builder.revenue_over_time_query(params, self.connection.dialect.name), self.connection,
+            params=params
+        )
+        self.display_revenue_chart(fill_missing_weeks(revenue_over_time))
+
+    def has_rollups(self):
+        if self.rollups_available is None:
+            self.rollups_available = inspect(self.connection).has_table("revenue_daily")
+        return self.rollups_available
+
+    # Metrics and charts answered from the pre-aggregated rollup tables instead of scanning orders
+    def display_rollup_aggregates(self, params):
+        daily = pd.read_sql(query_builder.daily_rollup_query(), self.connection, params=params)
+        end_date_orders = self.connection.execute(query_builder.end_date_orders_query(), params).one()
+        daily = pd.DataFrame({
+            "order_date": pd.to_datetime(daily["order_day"]),
+            "total_amount": daily["total_revenue"].astype(float),
+            "order_count": daily["order_count"].astype(int),
+        })
+        if end_date_orders.order_count:
+            daily.loc[len(daily)] = [pd.Timestamp(params["end_date"]), float(end_date_orders.total_revenue),
+                                     end_date_orders.order_count]
+
+        # Per-customer and weekly rollups cover all orders, so they only apply when the range does too
+        min_date, max_date = self.date_bounds
+        covers_all_orders = (pd.Timestamp(params["start_date"]) <= min_date.normalize() and
+                             max_date < pd.Timestamp(params["end_before"]))
+        if covers_all_orders:
+            unique_customers = self.connection.execute(query_builder.customer_rollup_count_query()).scalar()
+            top_customers = pd.read_sql(query_builder.top_customers_rollup_query(), self.connection)
+            revenue_over_time = pd.read_sql(query_builder.weekly_rollup_query(), self.connection)
+            revenue_over_time = fill_missing_weeks(revenue_over_time)
+        else:
+            unique_customers = self.connection.execute(query_builder.unique_customers_query(params), params).scalar()
+            top_customers = pd.read_sql(query_builder.top_customers_query(params), self.connection, params=params)
+            revenue_over_time = daily.set_index("order_date").resample("W")["total_amount"].sum().reset_index()
+
+        self.display_summary_metrics(daily["total_amount"].sum(), unique_customers, int(daily["order_count"].sum()))
+        self.display_top_customers_chart(top_customers)
+        self.display_revenue_chart(revenue_over_time)
 
-        # Summary Metrics
+    def display_summary_metrics(self, total_revenue, unique_customers, total_orders):
         st.subheader("Summary Metrics")
-        st.write(f"**Total Revenue:** ${filtered_df['total_amount'].sum()}")
-        st.write(f"**Unique Customers:** {filtered_df['customer_id'].nunique()}")
-        st.write(f"**Total Orders:** {filtered_df['order_id'].nunique()}")
+        st.write(f"**Total Revenue:** ${total_revenue}")
+        st.write(f"**Unique Customers:** {unique_customers}")
+        st.write(f"**Total Orders:** {total_orders}")
 
-        # Bar Chart - Top 10 Customers by Revenue
+    # Bar Chart - Top 10 Customers by Revenue
+    def display_top_customers_chart(self, top_customers):
         st.subheader("Top 10 Customers by Revenue")
-        top_customers = filtered_df.groupby("customer_id")["total_amount"].sum().nlargest(10).reset_index()
         bar_chart = alt.Chart(top_customers).mark_bar().encode(
             x=alt.X("customer_id", sort="-y", title="Customer ID"),
             y=alt.Y("total_amount", title="Total Revenue"),
@@ -131,10 +417,10 @@ class StreamlitDashboard:
         )
         st.altair_chart(bar_chart, use_container_width=True)
 
-        # Line Chart - Revenue Over Time
+    # Line Chart - Revenue Over Time
+    def display_revenue_chart(self, revenue_over_time):
         st.subheader("Revenue Over Time")
-        revenue_over_time = filtered_df.set_index("order_date").resample("W")["total_amount"].sum().reset_index()
-        line_chart = alt.Chart(revenue_over_time).mark_line().encode(
+        line_chart = alt.Chart(downsample(revenue_over_time)).mark_line().encode(
             x=alt.X("order_date", title="Date"),
             y=alt.Y("total_amount", title="Total Revenue"),
             tooltip=["order_date", "total_amount"]
@@ -0,0 +1,126 @@
+from datetime import timedelta
+
+from sqlalchemy import text
+
+from common.sql_functions import week_ending
+
+
+# Compiles the dashboard filters into parameterised SQL so only result rows leave the database.
+# The date filters use idx_orders_order_date and the per-customer order count uses
+# idx_orders_customer_date (see database/delevery_db_query.sql).
+
+# Dates are bound as dates so they compare the same way against DATE and DATETIME order_date columns.
+# The range ends before the day after end_date, so orders placed during the end date count too.
+def filter_params(start_date, end_date, min_amount=0, min_orders=1):
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "end_before": end_date + timedelta(days=1),
+        "min_amount": min_amount,
+        "min_orders": min_orders,
+    }
+
+
+def where_clause(params, alias="o"):
+    """WHERE conditions matching display_filters: date range, minimum amount and minimum orders per customer."""
+    conditions = (f"{alias}.order_date >= :start_date AND {alias}.order_date < :end_before "
+                  f"AND {alias}.total_amount >= :min_amount")
+    if params.get("min_orders", 1) > 1:
+        conditions += (f" AND {alias}.customer_id IN ("
+                       "SELECT customer_id FROM orders "
+                       "WHERE order_date >= :start_date AND order_date < :end_before AND total_amount >= :min_amount "
+                       "GROUP BY customer_id HAVING COUNT(*) >= :min_orders)")
+    return conditions
+
+
+def date_bounds_query():
+    return text("SELECT MIN(order_date) AS min_date, MAX(order_date) AS max_date FROM orders")
+
+
+def max_amount_query():
+    return text("SELECT MAX(o.total_amount) FROM orders o "
+                "WHERE o.order_date >= :start_date AND o.order_date < :end_before")
+
+
+def max_order_count_query():
+    return text("SELECT MAX(order_count) FROM ("
+                "SELECT COUNT(*) AS order_count FROM orders o "
+                "WHERE o.order_date >= :start_date AND o.order_date < :end_before AND o.total_amount >= :min_amount "
+                "GROUP BY o.customer_id) counts")
+
+
+# Columns the table can be sorted by; order_id breaks ties so pages never overlap
+SORT_COLUMNS = ["order_id", "customer_id", "total_amount", "order_date"]
+
+
+def filtered_orders_page_query(params, sort_column="order_id", descending=False, limit=100, offset=0):
+    """One page of the filtered orders with their customer names, sorted in the database."""
+    if sort_column not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by '{sort_column}'. Choose one of {', '.join(SORT_COLUMNS)}.")
+    direction = "DESC" if descending else "ASC"
+    order_by = f"o.{sort_column} {direction}"
+    if sort_column != "order_id":
+        order_by += f", o.order_id {direction}"
+    return text("SELECT o.order_id, o.customer_id, o.total_amount, o.order_date, c.customer_name "
+                "FROM orders o JOIN customers c ON c.customer_id = o.customer_id "
+                f"WHERE {where_clause(params)} ORDER BY {order_by} LIMIT {int(limit)} OFFSET {int(offset)}")
+
+
+# Every order references a customer (foreign key), so the join can be left out of the row count
+def filtered_count_query(params):
+    return text(f"SELECT COUNT(*) FROM orders o WHERE {where_clause(params)}")
+
+
+def summary_metrics_query(params):
+    return text("SELECT SUM(o.total_amount) AS total_revenue, COUNT(DISTINCT o.customer_id) AS unique_customers, "
+                "COUNT(DISTINCT o.order_id) AS total_orders FROM orders o "
+                f"WHERE {where_clause(params)}")
+
+
+def top_customers_query(params, limit=10):
+    return text("SELECT o.customer_id, SUM(o.total_amount) AS total_amount FROM orders o "
+                f"WHERE {where_clause(params)} "
+                f"GROUP BY o.customer_id ORDER BY total_amount DESC LIMIT {int(limit)}")
+
+
+def revenue_over_time_query(params, dialect_name):
+    week = week_ending("o.order_date", dialect_name)
+    return text(f"SELECT {week} AS order_date, SUM(o.total_amount) AS total_amount FROM orders o "
+                f"WHERE {where_clause(params)} "
+                f"GROUP BY {week} ORDER BY order_date")
+
+
+# Rollup tables maintained by the ETL (part_1/rollups.py). They hold every order, so they can only
+# answer queries without an amount or order-count filter.
+
+def rollups_apply(params):
+    return params.get("min_amount", 0) <= 0 and params.get("min_orders", 1) <= 1
+
+
+def daily_rollup_query():
+    """Whole days before the end date; orders on the end date itself are added by end_date_orders_query."""
+    return text("SELECT order_day, total_revenue, order_count FROM revenue_daily "
+                "WHERE order_day >= :start_date AND order_day < :end_date ORDER BY order_day")
+
+
+def end_date_orders_query():
+    return text("SELECT SUM(o.total_amount) AS total_revenue, COUNT(*) AS order_count FROM orders o "
+                "WHERE o.order_date >= :end_date AND o.order_date < :end_before")
+
+
+def unique_customers_query(params):
+    return text(f"SELECT COUNT(DISTINCT o.customer_id) FROM orders o WHERE {where_clause(params)}")
+
+
+def customer_rollup_count_query():
+    return text("SELECT COUNT(*) FROM customer_revenue")
+
+
+def top_customers_rollup_query(limit=10):
+    return text("SELECT customer_id, total_revenue AS total_amount FROM customer_revenue "
+                f"ORDER BY total_revenue DESC LIMIT {int(limit)}")
+
+
+def weekly_rollup_query():
+    return text("SELECT week_ending AS order_date, total_revenue AS total_amount FROM revenue_weekly "
+                "ORDER BY week_ending")
@@ -1,30 +1,38 @@
-import pandas as pd
+import os
 import streamlit as st
 from dashboard import StreamlitDashboard
+from common.staging import DATA_SOURCE
 
-# Database credentials
-DB_USER = 'root'
-DB_PASSWORD = 'Muw0okm_PL<'
-DB_HOST = 'localhost'
-DB_PORT = '3306'
-DB_NAME = 'delivery'
+# "memory" filters the cached frame in pandas, "sql" pushes the filters down to the database
+QUERY_MODE = os.environ.get("DASHBOARD_QUERY_MODE", "memory")
 
-dashboard = StreamlitDashboard(DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME)
+# Database settings come from DATABASE_URL / DB_* environment variables or db.ini (see common/db.py)
+dashboard = StreamlitDashboard()
 
-connection = dashboard.connect_to_db()
+# Reruns reuse the cached merged frame; only the change probe hits the database
+connection = None if DATA_SOURCE == "parquet" else dashboard.connect_to_db()
 
-if connection:
-    customers_df, orders_df = dashboard.load_data()
-    if customers_df is not None and orders_df is not None:
-        merged_df = pd.merge(orders_df, customers_df, on="customer_id")
-        merged_df["order_date"] = pd.to_datetime(merged_df["order_date"])
+if QUERY_MODE == "sql" and connection:
+    # Filters, metrics and chart aggregates run in the database; only result rows are transferred
+    params = dashboard.display_filters_sql()
+    if params is not None:
+        dashboard.display_dashboard_sql(params)
+elif DATA_SOURCE == "parquet":
+    # Only the month partitions of the chosen date range are read from the snapshot
+    date_range = dashboard.display_snapshot_date_filter()
+    if date_range is not None:
+        merged_df = dashboard.load_merged_data(source=DATA_SOURCE, date_range=date_range)
+        dashboard.display_dashboard(dashboard.display_filters(merged_df, date_range))
+else:
+    merged_df = dashboard.load_merged_data(source=DATA_SOURCE)
 
+    if merged_df is not None:
         # Apply filters
         filtered_df = dashboard.display_filters(merged_df)
 
         # Display dashboard
         dashboard.display_dashboard(filtered_df)
+    else:
+        st.error("Unable to connect to the database.")
 
-    dashboard.close_connection()
-else:
-    st.error("Unable to connect to the database.")
+dashboard.close_connection()
@@ -0,0 +1,115 @@
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import BigInteger, DateTime, Float, Integer, String, text
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.bulk_loader import BACKENDS, bulk_write
+from common.db import get_engine
+from common.instrumentation import instrument
+from common.staging import DATA_SOURCE, iter_snapshot
+from feature_materialization import SCORING_FEATURES_TABLE, customer_scoring_features_table
+from predict_repeat_customers import load_model
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PREDICTIONS_TABLE = 'customer_predictions'
+
+PREDICTIONS_DTYPE_MAP = {
+    'customer_id': BigInteger(),
+    'repeat_probability': Float(),
+    'predicted_repeat': Integer(),
+    'model_version': String(32),
+    'scored_at': DateTime(),
+}
+
+
+def iter_customer_features(source, chunksize, features):
+    """Yields customer_id and the `features` columns of customer_scoring_features in chunks of `chunksize` rows.
+
+    Database reads page by customer_id (keyset, using the primary key), so no cursor stays
+    open while the predictions are written.
+    """
+    columns = ['customer_id'] + list(features)
+    if source == 'parquet':
+        yield from iter_snapshot(SCORING_FEATURES_TABLE, columns=columns, batch_size=chunksize)
+        return
+
+    engine = get_engine()
+    last_id = None
+    while True:
+        condition = "customer_id IS NOT NULL" if last_id is None else "customer_id > :last_id"
+        with engine.connect() as connection:
+            chunk = pd.read_sql(text(f"SELECT {', '.join(columns)} FROM {SCORING_FEATURES_TABLE} WHERE {condition} "
+                                     f"ORDER BY customer_id LIMIT {int(chunksize)}"),
+                                connection, params={'last_id': last_id})
+        if chunk.empty:
+            return
+        yield chunk
+        last_id = int(chunk['customer_id'].iloc[-1])
+
+
+def check_features(artifact):
+    """Fails clearly when the model was trained on features the scoring table does not have."""
+    missing = [feature for feature in artifact['features'] if feature not in customer_scoring_features_table.c]
+    if missing:
+        raise ValueError(f"Model version {artifact['version']} was trained on features {SCORING_FEATURES_TABLE} "
+                         f"does not have ({', '.join(missing)}); retrain it with "
+                         "'predict_repeat_customers.py train'.")
+
+
+@instrument('model_score', rows_in=lambda model, chunk, *args, **kwargs: len(chunk))
+def score_chunk(model, chunk, features, model_version, scored_at, threshold=0.5):
+    """Scores a chunk in one vectorised predict_proba call on the features the model was trained on."""
+    positive = list(model.classes_).index(1)
+    probabilities = model.predict_proba(chunk[list(features)])[:, positive]
+    return pd.DataFrame({
+        'customer_id': chunk['customer_id'].astype('int64').to_numpy(),
+        'repeat_probability': probabilities,
+        'predicted_repeat': (probabilities >= threshold).astype(int),
+        'model_version': model_version,
+        'scored_at': scored_at,
+    })
+
+
+def batch_score(source=DATA_SOURCE, chunksize=100_000, model_path=None, backend='executemany'):
+    """Scores every customer with orders with the persisted model and replaces the customer_predictions table.
+
+    Reads customer_scoring_features, which is as of the latest order date, so customers whose first order falls
+    in the training rows' label window are scored too.
+    """
+    artifact = load_model(model_path)
+    check_features(artifact)
+    model, model_version, features = artifact['model'], artifact['version'], artifact['features']
+    logger.info(f"Scoring {SCORING_FEATURES_TABLE} with model version {model_version}.")
+
+    engine = get_engine()
+    scored_at = datetime.now()
+    scored_rows = 0
+    for chunk in iter_customer_features(source, chunksize, features):
+        predictions = score_chunk(model, chunk, features, model_version, scored_at)
+        bulk_write(engine, predictions, PREDICTIONS_TABLE, PREDICTIONS_DTYPE_MAP, backend=backend,
+                   if_exists='replace' if scored_rows == 0 else 'append', key_column='customer_id')
+        scored_rows += len(predictions)
+        logger.info(f"Scored {scored_rows} customers.")
+    logger.info(f"Wrote {scored_rows} predictions to {PREDICTIONS_TABLE}.")
+    return scored_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Score customer_scoring_features with the persisted repeat-customer model.")
+    parser.add_argument('--source', choices=['database', 'parquet'], default=DATA_SOURCE,
+                        help="Read customer_scoring_features from the database or from its Parquet snapshot.")
+    parser.add_argument('--chunksize', type=int, default=100_000, help="Customers scored and written per batch.")
+    parser.add_argument('--model', default=None, help="Model artifact to use (default: the latest under models/).")
+    parser.add_argument('--backend', choices=BACKENDS, default='executemany',
+                        help="Bulk-write backend for the predictions (see common/bulk_loader.py).")
+    args = parser.parse_args()
+    batch_score(source=args.source, chunksize=args.chunksize, model_path=args.model, backend=args.backend)
@@ -1,35 +1,128 @@
+import argparse
+import os
+import sys
 import pandas as pd
-from sqlalchemy import create_engine, BigInteger, Float, Integer, String
+from sqlalchemy import BigInteger, Float, Integer, String, text
 import logging
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.compact import maybe_compact, wide_amounts
+from common.db import get_engine
+from common.instrumentation import instrument
+from common.loader import read_frames
+from common.quantile_sketch import DEFAULT_K, QuantileSketch
+from common.sql_helpers import IN_LIST_BATCH_SIZE
+from common.staging import DATA_SOURCE, read_snapshot, clear_snapshot, write_snapshot, snapshot_path
+from incremental_aggregation import (read_state, save_state, ensure_customer_data_index,
+                                     incremental_prerequisites_met, read_distinct_amounts, touched_customer_ids,
+                                     read_customers_and_orders, replace_customer_rows)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-DB_USER = 'root'
-DB_PASSWORD = 'Muw0okm_PL<'
-DB_HOST = 'localhost'
-DB_PORT = '3306'
-DB_NAME = 'delivery'
+REPEAT_THRESHOLD = 1
+
+# Deduplicated (customer_id, total_amount) pairs, in a fixed order so streamed sketches are reproducible
+DISTINCT_ORDERS_QUERY = ("SELECT DISTINCT customer_id, total_amount FROM orders "
+                         "ORDER BY customer_id, total_amount")
+
+SKETCH_SEED = 0
 
-DATABASE_URL = f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+CUSTOMER_DATA_DTYPE_MAP = {
+    'customer_id': BigInteger(),
+    'customer_name': String(255),
+    'total_orders': Integer(),
+    'total_revenue': Float(),
+    'repeat_customer': Integer()
+}
 
-engine = create_engine(DATABASE_URL)
 
+def iqr_bounds(values):
+    values = wide_amounts(values)
+    return bounds_from_quartiles(values.quantile(0.25), values.quantile(0.75))
 
-def detect_and_remove_outliers_iqr(df, column):
-    Q1 = df[column].quantile(0.25)
-    Q3 = df[column].quantile(0.75)
+
+def bounds_from_quartiles(Q1, Q3):
     IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
+    return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+
+
+def stream_query(connection, sql, chunksize):
+    """Yields the result in chunks through a server-side cursor, so only one chunk is held client-side."""
+    return pd.read_sql(text(sql), connection.execution_options(stream_results=True), chunksize=chunksize)
+
+
+def sketch_iqr_bounds(connection, chunksize, sketch_k=DEFAULT_K):
+    """IQR bounds from a quantile sketch built in one chunked pass over the distinct order amounts."""
+    sketch = QuantileSketch(k=sketch_k, seed=SKETCH_SEED)
+    for chunk in stream_query(connection, DISTINCT_ORDERS_QUERY, chunksize):
+        sketch.update(chunk['total_amount'].to_numpy(dtype='float64', na_value=float('nan')))
+    Q1, Q3 = sketch.quantile([0.25, 0.75])
+    return bounds_from_quartiles(float(Q1), float(Q3))
+
+
+def stream_order_aggregates(connection, bounds, chunksize):
+    """Per-customer order counts and revenue aggregated chunk by chunk, skipping outliers.
+
+    Memory grows with the number of customers, not orders.
+    """
+    lower_bound, upper_bound = bounds
+    partials = []
+    for chunk in stream_query(connection, DISTINCT_ORDERS_QUERY, chunksize):
+        chunk = chunk[(chunk['total_amount'] >= lower_bound) & (chunk['total_amount'] <= upper_bound)]
+        partials.append(aggregate_orders(chunk))
+    if not partials:
+        return aggregate_orders(pd.DataFrame(columns=['customer_id', 'total_amount']))
+    return pd.concat(partials, ignore_index=True).groupby('customer_id', as_index=False).sum()
+
+
+def detect_and_remove_outliers_iqr(df, column, bounds=None):
+    lower_bound, upper_bound = bounds if bounds is not None else iqr_bounds(df[column])
     logger.info(f"Outlier bounds for '{column}': {lower_bound} to {upper_bound}")
-    return df[(df[column] >= lower_bound) & (df[column] <= upper_bound)]
+    values = wide_amounts(df[column])
+    return df[(values >= lower_bound) & (values <= upper_bound)]
 
 
-def create_customer_data_table():
-    with engine.connect() as connection:
-        customers_df = pd.read_sql("SELECT customer_id, customer_name FROM customers", connection)
-        orders_df = pd.read_sql("SELECT customer_id, total_amount FROM orders", connection)
+def load_customers_and_orders(source):
+    """Reads the columns needed for customer_data from MySQL or from the ETL's Parquet snapshots."""
+    if source == 'parquet':
+        customers_df = read_snapshot('customers', columns=['customer_id', 'customer_name'])
+        orders_df = read_snapshot('orders', columns=['customer_id', 'total_amount'])
+        return maybe_compact(customers_df), maybe_compact(orders_df)
+
+    frames = read_frames({
+        'customers': "SELECT customer_id, customer_name FROM customers",
+        'orders': "SELECT customer_id, total_amount FROM orders ORDER BY order_id",
+    })
+    return maybe_compact(frames['customers']), maybe_compact(frames['orders'])
+
+
+def aggregate_orders(orders_df):
+    orders_df = orders_df.assign(total_amount=wide_amounts(orders_df['total_amount']))
+    return orders_df.groupby('customer_id').agg(
+        total_orders=('total_amount', 'size'),
+        total_revenue=('total_amount', 'sum')
+    ).reset_index()
+
+
+def aggregate_customer_data(customers_df, orders_aggregated):
+    """Per-customer order count, revenue and repeat flag from orders already cleared of outliers."""
+    # Merge aggregated orders with customers data
+    customer_data_df = pd.merge(customers_df, orders_aggregated, on='customer_id', how='left')
+
+    # Fill missing values for customers with zero orders
+    customer_data_df['total_orders'] = customer_data_df['total_orders'].fillna(0).astype(int)
+    customer_data_df['total_revenue'] = customer_data_df['total_revenue'].fillna(0)
+
+    customer_data_df['repeat_customer'] = (customer_data_df['total_orders'] > REPEAT_THRESHOLD).astype(int)
+    return customer_data_df
+
+
+def load_and_aggregate_orders(source):
+    """Reads every order into memory and aggregates it with exact IQR outlier bounds."""
+    customers_df, orders_df = load_customers_and_orders(source)
 
     # Data Cleaning
     customers_df.drop_duplicates(inplace=True)
@@ -40,32 +133,48 @@ def create_customer_data_table():
 
     # Check for and remove outliers in the orders data
     logger.info("Removing outliers from 'total_amount'...")
+    bounds = iqr_bounds(orders_df['total_amount'])
     original_order_count = orders_df.shape[0]
-    orders_df = detect_and_remove_outliers_iqr(orders_df, 'total_amount')
+    orders_df = detect_and_remove_outliers_iqr(orders_df, 'total_amount', bounds)
     removed_outliers_count = original_order_count - orders_df.shape[0]
     logger.info(f"Number of outliers removed from orders data: {removed_outliers_count}")
     logger.info(f"Orders DataFrame shape after outlier removal: {orders_df.shape}")
+    return customers_df, aggregate_orders(orders_df), bounds
 
-    # Aggregate orders data
-    orders_aggregated = orders_df.groupby('customer_id').agg(
-        total_orders=('total_amount', 'size'),
-        total_revenue=('total_amount', 'sum')
-    ).reset_index()
 
-    # Merge aggregated orders with customers data
-    customer_data_df = pd.merge(customers_df, orders_aggregated, on='customer_id', how='left')
+def stream_and_aggregate_orders(chunksize, sketch_k=DEFAULT_K):
+    """Two chunked passes over the distinct orders: sketch the IQR bounds, then aggregate within them."""
+    with get_engine().connect() as connection:
+        customers_df = maybe_compact(pd.read_sql("SELECT customer_id, customer_name FROM customers", connection))
+        bounds = sketch_iqr_bounds(connection, chunksize, sketch_k)
+        logger.info(f"Outlier bounds for 'total_amount' (sketch k={sketch_k}): {bounds[0]} to {bounds[1]}")
+        orders_aggregated = stream_order_aggregates(connection, bounds, chunksize)
+    customers_df.drop_duplicates(inplace=True)
+    logger.info(f"Aggregated {int(orders_aggregated['total_orders'].sum())} orders within the bounds "
+                f"for {len(orders_aggregated)} customers.")
+    return customers_df, orders_aggregated, bounds
 
-    # Fill missing values for customers with zero orders
-    customer_data_df['total_orders'] = customer_data_df['total_orders'].fillna(0).astype(int)
-    customer_data_df['total_revenue'] = customer_data_df['total_revenue'].fillna(0)
+
+@instrument('create_customer_data_table', rows_out=lambda rows: rows)
+def create_customer_data_table(source=DATA_SOURCE, chunksize=None, sketch_k=DEFAULT_K):
+    """Rebuilds customer_data and returns its row count.
+
+    With `chunksize`, orders are streamed in bounded memory instead of loaded whole.
+    """
+    run_started = datetime.now()
+    if chunksize is not None and source == 'parquet':
+        logger.info("Streaming reads deduplicate orders in the database; loading the snapshots in memory.")
+    if chunksize is not None and source != 'parquet':
+        customers_df, orders_aggregated, bounds = stream_and_aggregate_orders(chunksize, sketch_k)
+    else:
+        customers_df, orders_aggregated, bounds = load_and_aggregate_orders(source)
+
+    customer_data_df = aggregate_customer_data(customers_df, orders_aggregated)
 
     # Log customers with zero orders
     zero_order_count = customer_data_df[customer_data_df['total_orders'] == 0].shape[0]
     logger.info(f"Number of customers with zero orders: {zero_order_count}")
 
-    repeat_threshold = 1
-    customer_data_df['repeat_customer'] = customer_data_df['total_orders'].apply(lambda x: 1 if x > repeat_threshold else 0)
-
     logger.info(f"Final customer_data DataFrame shape: {customer_data_df.shape}")
     logger.info(f"customer_data DataFrame preview:\n{customer_data_df.head()}")
 
@@ -75,21 +184,83 @@ def create_customer_data_table():
 
     # Load data into the customer_data table
     try:
-        with engine.begin() as connection:
+        with get_engine().begin() as connection:
             customer_data_df.to_sql(
-                'customer_data', con=connection, if_exists='replace', index=False,
-                dtype={
-                    'customer_id': BigInteger(),
-                    'customer_name': String(255),
-                    'total_orders': Integer(),
-                    'total_revenue': Float(),
-                    'repeat_customer': Integer()
-                }
+                'customer_data', con=connection, if_exists='replace', index=False, dtype=CUSTOMER_DATA_DTYPE_MAP
             )
+            ensure_customer_data_index(connection)
+            # Later incremental runs start from this run's outlier bounds and start time
+            save_state(connection, run_started, *bounds)
         logger.info("customer_data table created and loaded successfully.")
     except Exception as e:
         logger.error(f"Error creating customer_data table: {e}")
 
+    # Stage the table for the model scripts as well
+    clear_snapshot('customer_data')
+    write_snapshot(customer_data_df, 'customer_data')
+    return len(customer_data_df)
+
+
+@instrument('update_customer_data_table', rows_out=lambda rows: rows)
+def update_customer_data_table(source=DATA_SOURCE, chunksize=None, sketch_k=DEFAULT_K):
+    """Recomputes customer_data only for customers touched since the previous run and returns their count.
+
+    Produces the same rows as create_customer_data_table with the same arguments; falls back to it
+    when there is no previous run.
+    """
+    if source == 'parquet':
+        logger.info("Incremental updates read the database rollups; rebuilding customer_data from the snapshots.")
+        return create_customer_data_table(source, chunksize, sketch_k)
+
+    run_started = datetime.now()
+    engine = get_engine()
+    with engine.connect() as connection:
+        state = read_state(connection) if incremental_prerequisites_met(connection) else None
+    if state is None:
+        logger.info("No previous customer_data run to update; rebuilding it.")
+        return create_customer_data_table(source, chunksize, sketch_k)
+
+    last_run, *previous_bounds = state
+    with engine.begin() as connection:
+        # The bounds depend on every order, so they are recomputed from the distinct amounts
+        if chunksize is not None:
+            bounds = sketch_iqr_bounds(connection, chunksize, sketch_k)
+        else:
+            bounds = iqr_bounds(read_distinct_amounts(connection))
+        touched_ids = touched_customer_ids(connection, last_run, previous_bounds, bounds)
+        updated = []
+        for start in range(0, len(touched_ids), IN_LIST_BATCH_SIZE):
+            batch_ids = touched_ids[start:start + IN_LIST_BATCH_SIZE]
+            customers_df, orders_df = read_customers_and_orders(connection, batch_ids)
+            orders_df = orders_df.drop_duplicates()
+            orders_df = orders_df[(orders_df['total_amount'] >= bounds[0]) & (orders_df['total_amount'] <= bounds[1])]
+            customer_data_df = aggregate_customer_data(customers_df.drop_duplicates(), aggregate_orders(orders_df))
+            replace_customer_rows(connection, batch_ids, customer_data_df, CUSTOMER_DATA_DTYPE_MAP)
+            updated.append(customer_data_df)
+        save_state(connection, run_started, *bounds)
+    logger.info(f"Outlier bounds for 'total_amount': {bounds[0]} to {bounds[1]}")
+    logger.info(f"Updated customer_data for {len(touched_ids)} touched customers.")
+
+    if touched_ids and os.path.exists(snapshot_path('customer_data')):
+        snapshot = read_snapshot('customer_data')
+        snapshot = pd.concat([snapshot[~snapshot['customer_id'].isin(touched_ids)]] + updated, ignore_index=True)
+        clear_snapshot('customer_data')
+        write_snapshot(snapshot, 'customer_data')
+    return len(touched_ids)
+
 
 if __name__ == "__main__":
-    create_customer_data_table()
+    parser = argparse.ArgumentParser(description="Build the customer_data table used by the model.")
+    parser.add_argument('--source', choices=['database', 'parquet'], default=DATA_SOURCE,
+                        help="Read customers and orders from MySQL or from the ETL's Parquet snapshots.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only recompute customers touched since the last run instead of rebuilding the table.")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="Stream orders from the database in chunks of this many rows, with sketched IQR bounds.")
+    parser.add_argument('--sketch-k', type=int, default=DEFAULT_K,
+                        help="Quantile sketch size; rank error is roughly 3/k (see common/quantile_sketch.py).")
+    args = parser.parse_args()
+    if args.incremental:
+        update_customer_data_table(source=args.source, chunksize=args.chunksize, sketch_k=args.sketch_k)
+    else:
+        create_customer_data_table(source=args.source, chunksize=args.chunksize, sketch_k=args.sketch_k)
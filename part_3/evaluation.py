@@ -0,0 +1,110 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import classification_report, confusion_matrix
+from sklearn.model_selection import StratifiedKFold
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+CV_FOLDS = 5
+LEARNING_CURVE_SIZES = np.linspace(0.1, 1.0, 5)
+
+# Set once per worker process by init_worker, so tasks only carry indices
+_X = None
+_y = None
+
+
+def init_worker(X, y):
+    global _X, _y
+    _X, _y = X, y
+
+
+def build_model(C):
+    # The RFM features range from single orders to thousands of days and currency units, so they are standardised
+    return make_pipeline(StandardScaler(), LogisticRegression(random_state=42, max_iter=1000, C=C))
+
+
+def fit_and_score(C, train_index, test_index):
+    """Fits one configuration on `train_index` and returns its train and held-out accuracy."""
+    model = build_model(C).fit(_X[train_index], _y[train_index])
+    return model.score(_X[train_index], _y[train_index]), model.score(_X[test_index], _y[test_index])
+
+
+def fit_holdout(C, train_index, validation_index, test_index):
+    """Fits one configuration on the training split and evaluates it on the validation and test splits."""
+    model = build_model(C).fit(_X[train_index], _y[train_index])
+    y_test_pred = model.predict(_X[test_index])
+    return {
+        'train_accuracy': model.score(_X[train_index], _y[train_index]),
+        'validation_accuracy': model.score(_X[validation_index], _y[validation_index]),
+        'test_accuracy': float(np.mean(y_test_pred == _y[test_index])),
+        'classification_report': classification_report(_y[test_index], y_test_pred, output_dict=True,
+                                                       zero_division=0),
+        'confusion_matrix': confusion_matrix(_y[test_index], y_test_pred).tolist(),
+        # Per standardised feature
+        'coefficients': model[-1].coef_[0].tolist(),
+        'intercept': float(model[-1].intercept_[0]),
+    }
+
+
+def learning_curve_sizes(folds):
+    """Training-set sizes as learning_curve picks them: fractions of the first fold's training set."""
+    n_max = len(folds[0][0])
+    return np.unique((LEARNING_CURVE_SIZES * n_max).astype(int))
+
+
+def evaluate_configurations(X, y, splits, C_values, workers=None):
+    """Evaluates every C on shared splits in one process pool and returns a JSON-ready report.
+
+    `splits` holds the train/validation/test positions of the holdout split. The stratified CV folds
+    are computed once; for each C the full-fold fits give the cross-validation scores and double as the
+    largest learning-curve point, so no configuration is fit twice on the same data.
+    """
+    X = np.asarray(X, dtype='float64')
+    y = np.asarray(y)
+    train_index, validation_index, test_index = splits
+    folds = list(StratifiedKFold(n_splits=CV_FOLDS).split(X, y))
+    sizes = learning_curve_sizes(folds)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(X, y)) as executor:
+        holdout = {C: executor.submit(fit_holdout, C, train_index, validation_index, test_index) for C in C_values}
+        curve = {(C, size, fold): executor.submit(
+                     fit_and_score, C, folds[fold][0] if size == sizes[-1] else folds[fold][0][:size],
+                     folds[fold][1])
+                 for C in C_values for size in sizes for fold in range(len(folds))}
+
+        configurations = {}
+        for C in C_values:
+            scores = {size: [curve[(C, size, fold)].result() for fold in range(len(folds))] for size in sizes}
+            cv_scores = [test_score for _, test_score in scores[sizes[-1]]]
+            configurations[f'C={C}'] = {
+                'C': C,
+                'holdout': holdout[C].result(),
+                'cross_validation': {'scores': cv_scores, 'mean': float(np.mean(cv_scores))},
+                'learning_curve': {
+                    'train_sizes': sizes.tolist(),
+                    'train_scores_mean': [float(np.mean([train for train, _ in scores[size]])) for size in sizes],
+                    'validation_scores_mean': [float(np.mean([test for _, test in scores[size]])) for size in sizes],
+                },
+            }
+
+    return {
+        'rows': int(len(y)),
+        'folds': CV_FOLDS,
+        'fits': len(holdout) + len(curve),
+        'configurations': configurations,
+    }
+
+
+def write_report(report, path=None):
+    """Writes the report as JSON to `path`, or returns it as a string when no path is given."""
+    text = json.dumps(report, indent=2, default=float)
+    if path is None:
+        return text
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as report_file:
+        report_file.write(text + '\n')
+    return text
@@ -0,0 +1,269 @@
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, BigInteger, Integer, Float, String, DateTime, inspect
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.db import get_engine
+from common.instrumentation import instrument
+from common.loader import read_frame
+from common.sql_functions import days_between
+from common.sql_helpers import IN_LIST_BATCH_SIZE, execute, ids_from
+from common.staging import clear_snapshot, write_snapshot
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Per-customer RFM features for the repeat-customer model, computed in the database as of a date
+metadata = MetaData()
+
+
+def feature_columns():
+    return [
+        Column('customer_id', BigInteger, primary_key=True, autoincrement=False),
+        Column('as_of_date', DateTime),
+        Column('first_order_date', DateTime),
+        Column('last_order_date', DateTime),
+        Column('recency_days', Float),
+        Column('frequency', Integer),
+        Column('monetary', Float),
+        Column('avg_order_value', Float),
+        Column('avg_gap_days', Float),
+        Column('max_gap_days', Float),
+        Column('tenure_days', Float),
+    ]
+
+
+# Training rows: features as of a date a prediction window before the latest order, labelled from that window
+customer_features_table = Table(
+    'customer_features', metadata,
+    *feature_columns(),
+    Column('repeat_customer', Integer),
+    Column('updated_at', DateTime),
+)
+
+# Scoring rows: the same features as of the latest order date, whose window has not happened yet
+customer_scoring_features_table = Table(
+    'customer_scoring_features', metadata,
+    *feature_columns(),
+    Column('updated_at', DateTime),
+)
+
+# When each table's previous run started, so the next one only recomputes customers whose orders changed since
+customer_features_state_table = Table(
+    'customer_features_state', metadata,
+    Column('name', String(64), primary_key=True),
+    Column('last_run', DateTime),
+    Column('as_of_date', DateTime),
+)
+
+FEATURES_TABLE = customer_features_table.name
+SCORING_FEATURES_TABLE = customer_scoring_features_table.name
+# repeat_customer is 1 when a customer orders again within this many days after the as-of date
+PREDICTION_WINDOW_DAYS = int(os.environ.get('PREDICTION_WINDOW_DAYS', 90))
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def feature_select(dialect_name, where='', labelled=True):
+    """One row of features per customer from their orders up to :as_of, labelled from the orders after it.
+
+    LAG pairs each order with the customer's previous one, so the inter-order gaps are computed in the same
+    single pass over the orders as the aggregates. The label only looks at orders in (:as_of, :label_end], which
+    no feature sees, so it cannot be read back from the order count the features encode. Scoring rows are not
+    `labelled`.
+    """
+    previous_order = "LAG(order_date) OVER (PARTITION BY customer_id ORDER BY order_date, order_id)"
+    gaps = (
+        "SELECT customer_id, order_date, total_amount, "
+        f"{days_between('order_date', previous_order, dialect_name)} AS gap_days FROM orders "
+        f"WHERE customer_id IS NOT NULL AND {days_between(':as_of', 'order_date', dialect_name)} >= 0 {where}"
+    )
+    features = (
+        "SELECT gaps.customer_id, :as_of, MIN(order_date), MAX(order_date), "
+        f"{days_between(':as_of', 'MAX(order_date)', dialect_name)}, COUNT(*), SUM(total_amount), "
+        "AVG(total_amount), COALESCE(AVG(gap_days), 0), COALESCE(MAX(gap_days), 0), "
+        f"{days_between(':as_of', 'MIN(order_date)', dialect_name)}, "
+    )
+    if not labelled:
+        return f"{features}:updated_at FROM ({gaps}) gaps GROUP BY gaps.customer_id"
+    return (
+        f"{features}MAX(CASE WHEN later.customer_id IS NULL THEN 0 ELSE 1 END), :updated_at "
+        f"FROM ({gaps}) gaps LEFT JOIN ("
+        "SELECT DISTINCT customer_id FROM orders "
+        f"WHERE {days_between('order_date', ':as_of', dialect_name)} > 0 "
+        f"AND {days_between(':label_end', 'order_date', dialect_name)} >= 0"
+        ") later ON later.customer_id = gaps.customer_id GROUP BY gaps.customer_id"
+    )
+
+
+def label_end(as_of):
+    return as_of + timedelta(days=PREDICTION_WINDOW_DAYS)
+
+
+def insert_features(connection, table, as_of, where='', params=None):
+    columns = ', '.join(column.name for column in table.columns)
+    labelled = 'repeat_customer' in table.c
+    return execute(connection, f"INSERT INTO {table.name} ({columns}) "
+                               f"{feature_select(connection.dialect.name, where, labelled)}",
+                   {**(params or {}), 'as_of': as_of.strftime(DATE_FORMAT),
+                    'label_end': label_end(as_of).strftime(DATE_FORMAT), 'updated_at': datetime.now()}).rowcount
+
+
+def latest_order_date(connection):
+    """The latest order date, rounded up to the second so DATE_FORMAT keeps that order before the as-of date."""
+    latest = connection.exec_driver_sql("SELECT MAX(order_date) FROM orders").scalar()
+    return pd.Timestamp(latest).ceil('s').to_pydatetime() if latest is not None else datetime.now()
+
+
+def default_as_of(connection):
+    """The latest order date less the prediction window, so every label's window is already in the data."""
+    return latest_order_date(connection) - timedelta(days=PREDICTION_WINDOW_DAYS)
+
+
+def read_state(connection, table):
+    """Returns (last_run, as_of_date) of the previous run of `table`, or None before the first one."""
+    if not inspect(connection).has_table(customer_features_state_table.name):
+        return None
+    row = connection.execute(customer_features_state_table.select()
+                             .where(customer_features_state_table.c.name == table.name)).first()
+    return (row.last_run, pd.Timestamp(row.as_of_date).to_pydatetime()) if row else None
+
+
+def save_state(connection, table, run_started, as_of):
+    connection.execute(customer_features_state_table.delete()
+                       .where(customer_features_state_table.c.name == table.name))
+    connection.execute(customer_features_state_table.insert(),
+                       {'name': table.name, 'last_run': run_started, 'as_of_date': as_of})
+
+
+def touched_customer_ids(connection, table, last_run, previous_as_of, as_of):
+    """Customers whose features may have changed since the previous run.
+
+    That is customers whose orders changed (customer_revenue.updated_at, kept by the ETL), customers that no
+    longer have orders, and customers with orders between the previous as-of date and the end of the current
+    prediction window, whose features or label the moved dates change.
+    """
+    dialect_name = connection.dialect.name
+    touched = ids_from(connection, "SELECT customer_id FROM customer_revenue WHERE updated_at >= :last_run",
+                       {'last_run': last_run})
+    touched |= ids_from(connection,
+                        f"SELECT f.customer_id FROM {table.name} f "
+                        "LEFT JOIN customer_revenue r ON r.customer_id = f.customer_id WHERE r.customer_id IS NULL")
+    if as_of > previous_as_of:
+        touched |= ids_from(connection,
+                            "SELECT DISTINCT customer_id FROM orders "
+                            f"WHERE {days_between('order_date', ':previous_as_of', dialect_name)} > 0 "
+                            f"AND {days_between(':label_end', 'order_date', dialect_name)} >= 0",
+                            {'previous_as_of': previous_as_of.strftime(DATE_FORMAT),
+                             'label_end': label_end(as_of).strftime(DATE_FORMAT)})
+    return sorted(touched)
+
+
+def refresh_as_of(connection, table, as_of):
+    """Moves customers still at an older as-of date to `as_of` without reading their orders; returns their count.
+
+    Customers in touched_customer_ids were just recomputed at `as_of`, so this only rewrites the others. They
+    have no orders in either prediction window, so a label stays 0.
+    """
+    dialect_name = connection.dialect.name
+    return execute(connection,
+                   f"UPDATE {table.name} SET as_of_date = :as_of, "
+                   f"recency_days = {days_between(':as_of', 'last_order_date', dialect_name)}, "
+                   f"tenure_days = {days_between(':as_of', 'first_order_date', dialect_name)} "
+                   "WHERE as_of_date <> :as_of",
+                   {'as_of': as_of.strftime(DATE_FORMAT)}).rowcount
+
+
+def write_features_snapshot(connection, table):
+    """Stages the whole feature table for DATA_SOURCE=parquet readers."""
+    features_df = read_frame(connection, f"SELECT * FROM {table.name} ORDER BY customer_id")
+    clear_snapshot(table.name)
+    write_snapshot(features_df, table.name)
+
+
+def rebuild_table(connection, table, as_of, run_started):
+    connection.execute(table.delete())
+    rows = insert_features(connection, table, as_of)
+    save_state(connection, table, run_started, as_of)
+    write_features_snapshot(connection, table)
+    logger.info(f"{table.name} rebuilt as of {as_of} for {rows} customers.")
+    return rows
+
+
+def update_table(connection, table, as_of, run_started):
+    """Recomputes `table` for the customers touched since its previous run, or rebuilds it when it cannot."""
+    state = read_state(connection, table) if inspect(connection).has_table('customer_revenue') else None
+    if state is None:
+        logger.info(f"No previous {table.name} run to update; rebuilding it.")
+        return rebuild_table(connection, table, as_of, run_started)
+    last_run, previous_as_of = state
+    if as_of < previous_as_of:
+        logger.info(f"The as-of date moved backwards; rebuilding {table.name}.")
+        return rebuild_table(connection, table, as_of, run_started)
+
+    touched_ids = touched_customer_ids(connection, table, last_run, previous_as_of, as_of)
+    for start in range(0, len(touched_ids), IN_LIST_BATCH_SIZE):
+        params = {'customer_ids': touched_ids[start:start + IN_LIST_BATCH_SIZE]}
+        execute(connection, f"DELETE FROM {table.name} WHERE customer_id IN :customer_ids", params)
+        insert_features(connection, table, as_of, "AND customer_id IN :customer_ids", params)
+    if as_of != previous_as_of:
+        refresh_as_of(connection, table, as_of)
+    save_state(connection, table, run_started, as_of)
+    write_features_snapshot(connection, table)
+    logger.info(f"Updated {table.name} as of {as_of} for {len(touched_ids)} touched customers.")
+    return len(touched_ids)
+
+
+@instrument('create_customer_features', rows_out=lambda rows: rows)
+def create_customer_features(as_of=None):
+    """Rebuilds customer_features and customer_scoring_features from every order and returns the training rows.
+
+    `as_of` only moves the training rows; scoring rows are always as of the latest order date.
+    """
+    run_started = datetime.now()
+    engine = get_engine()
+    metadata.create_all(engine, checkfirst=True)
+    with engine.begin() as connection:
+        rows = rebuild_table(connection, customer_features_table, as_of or default_as_of(connection), run_started)
+        rebuild_table(connection, customer_scoring_features_table, latest_order_date(connection), run_started)
+    return rows
+
+
+@instrument('update_customer_features', rows_out=lambda rows: rows)
+def update_customer_features(as_of=None):
+    """Recomputes both feature tables only for customers touched since their previous run.
+
+    Produces the same rows as create_customer_features for the same as-of date; falls back to rebuilding a
+    table when it has no previous run, there is no customer_revenue rollup, or its as-of date moves backwards.
+    Returns the number of training rows recomputed.
+    """
+    run_started = datetime.now()
+    engine = get_engine()
+    # Creates customer_scoring_features for databases materialised before it existed
+    metadata.create_all(engine, checkfirst=True)
+    with engine.begin() as connection:
+        rows = update_table(connection, customer_features_table, as_of or default_as_of(connection), run_started)
+        update_table(connection, customer_scoring_features_table, latest_order_date(connection), run_started)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Materialise the repeat-customer model's RFM features for training and scoring in the database.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only recompute customers whose orders changed since the last run.")
+    parser.add_argument('--as-of', type=pd.Timestamp, default=None,
+                        help="Compute the training features from orders up to this date and the label from the "
+                             f"{PREDICTION_WINDOW_DAYS} days after it (default: the latest order date less "
+                             f"{PREDICTION_WINDOW_DAYS} days). Scoring features always use the latest order date.")
+    args = parser.parse_args()
+    as_of = args.as_of.to_pydatetime() if args.as_of is not None else None
+    if args.incremental:
+        update_customer_features(as_of)
+    else:
+        create_customer_features(as_of)
@@ -0,0 +1,114 @@
+import logging
+
+import pandas as pd
+from sqlalchemy import (MetaData, Table, Column, Index, BigInteger, Integer, String, Float, DateTime, bindparam,
+                        inspect, text)
+
+from common.sql_helpers import execute, ids_from
+
+logger = logging.getLogger(__name__)
+
+# Bookkeeping for incremental customer_data runs: when the last run started and the outlier bounds it used
+metadata = MetaData()
+
+customer_data_state_table = Table(
+    'customer_data_state', metadata,
+    Column('name', String(64), primary_key=True),
+    Column('last_run', DateTime),
+    Column('lower_bound', Float),
+    Column('upper_bound', Float),
+)
+
+# Matches the table written by the full rebuild, which only gains this index
+customer_data_table = Table(
+    'customer_data', metadata,
+    Column('customer_id', BigInteger),
+    Column('customer_name', String(255)),
+    Column('total_orders', Integer),
+    Column('total_revenue', Float),
+    Column('repeat_customer', Integer),
+    Index('idx_customer_data_customer_id', 'customer_id'),
+)
+
+STATE_NAME = 'customer_data'
+
+
+def read_state(connection):
+    """Returns (last_run, lower_bound, upper_bound) of the previous run, or None before the first one."""
+    if not inspect(connection).has_table(customer_data_state_table.name):
+        return None
+    row = connection.execute(customer_data_state_table.select()
+                             .where(customer_data_state_table.c.name == STATE_NAME)).first()
+    return (row.last_run, row.lower_bound, row.upper_bound) if row else None
+
+
+def save_state(connection, run_started, lower_bound, upper_bound):
+    customer_data_state_table.create(connection, checkfirst=True)
+    connection.execute(customer_data_state_table.delete().where(customer_data_state_table.c.name == STATE_NAME))
+    connection.execute(customer_data_state_table.insert(), {
+        'name': STATE_NAME, 'last_run': run_started,
+        'lower_bound': float(lower_bound), 'upper_bound': float(upper_bound),
+    })
+
+
+def ensure_customer_data_index(connection):
+    """Indexes customer_data by customer_id so touched customers can be replaced cheaply."""
+    for index in customer_data_table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def incremental_prerequisites_met(connection):
+    """Incremental runs need a previous customer_data table plus the customer_revenue rollup kept by the ETL."""
+    inspector = inspect(connection)
+    return all(inspector.has_table(name) for name in ('customer_data', 'customer_revenue'))
+
+
+def read_distinct_amounts(connection):
+    """Amounts of the distinct (customer_id, total_amount) pairs, the population the outlier bounds use."""
+    return pd.read_sql("SELECT total_amount FROM (SELECT DISTINCT customer_id, total_amount FROM orders) d",
+                       connection)['total_amount']
+
+
+def touched_customer_ids(connection, last_run, previous_bounds, bounds):
+    """Customers whose customer_data row may differ from a full rebuild since the previous run.
+
+    That is customers whose orders changed (customer_revenue.updated_at), new, renamed or removed
+    customers, and customers with an order between the previous and the current outlier bound.
+    """
+    touched = ids_from(connection, "SELECT customer_id FROM customer_revenue WHERE updated_at >= :last_run",
+                       {'last_run': last_run})
+    touched |= ids_from(connection,
+                        "SELECT c.customer_id FROM customers c "
+                        "LEFT JOIN customer_data d ON d.customer_id = c.customer_id "
+                        "WHERE d.customer_id IS NULL "
+                        "OR COALESCE(c.customer_name, '') <> COALESCE(d.customer_name, '')")
+    touched |= ids_from(connection,
+                        "SELECT d.customer_id FROM customer_data d "
+                        "LEFT JOIN customers c ON c.customer_id = d.customer_id WHERE c.customer_id IS NULL")
+    # An order's inclusion only flips if its amount lies between the old and the new bound
+    for previous, current in zip(previous_bounds, bounds):
+        if previous != current:
+            touched |= ids_from(connection,
+                                "SELECT DISTINCT customer_id FROM orders "
+                                "WHERE total_amount >= :low AND total_amount <= :high",
+                                {'low': min(previous, current), 'high': max(previous, current)})
+    return sorted(touched)
+
+
+def read_customers_and_orders(connection, customer_ids):
+    """Customers and their orders for a batch of ids, in the same order as the full read."""
+    params = {'customer_ids': list(customer_ids)}
+    customers_df = pd.read_sql(
+        text("SELECT customer_id, customer_name FROM customers WHERE customer_id IN :customer_ids")
+        .bindparams(bindparam('customer_ids', expanding=True)), connection, params=params)
+    orders_df = pd.read_sql(
+        text("SELECT customer_id, total_amount FROM orders WHERE customer_id IN :customer_ids ORDER BY order_id")
+        .bindparams(bindparam('customer_ids', expanding=True)), connection, params=params)
+    return customers_df, orders_df
+
+
+def replace_customer_rows(connection, customer_ids, customer_data_df, dtype_map):
+    """Deletes the batch's customer_data rows and inserts their recomputed aggregates."""
+    execute(connection, "DELETE FROM customer_data WHERE customer_id IN :customer_ids",
+            {'customer_ids': list(customer_ids)})
+    customer_data_df.to_sql('customer_data', con=connection, if_exists='append', index=False, dtype=dtype_map)
@@ -1,101 +1,158 @@
-import pandas as pd
-from sqlalchemy import create_engine
-from sklearn.model_selection import train_test_split, cross_val_score, learning_curve
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-import matplotlib.pyplot as plt
-import warnings
-
-DB_USER = 'root'
-DB_PASSWORD = 'Muw0okm_PL<'
-DB_HOST = 'localhost'
-DB_PORT = '3306'
-DB_NAME = 'delivery'
-
-DATABASE_URL = f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-
-def load_data():
+import argparse
+import os
+import sys
+from datetime import datetime
+import joblib
+import numpy as np
+import sklearn
+from sklearn.model_selection import train_test_split
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.db import get_engine
+from common.instrumentation import instrument
+from common.loader import read_frame
+from common.staging import DATA_SOURCE, read_snapshot
+from evaluation import build_model, evaluate_configurations, write_report
+from feature_materialization import FEATURES_TABLE
+
+MODEL_DIR = os.environ.get(
+    'MODEL_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
+)
+MODEL_NAME = 'repeat_customer'
+
+# Materialised in the database by feature_materialization.py
+FEATURES = ['recency_days', 'frequency', 'monetary', 'avg_order_value', 'avg_gap_days', 'max_gap_days', 'tenure_days']
+TARGET = 'repeat_customer'
+
+MIN_TRAINING_ROWS = 100
+
+
+def load_data(source=DATA_SOURCE):
+    columns = ['customer_id'] + FEATURES + [TARGET]
     try:
-        engine = create_engine(DATABASE_URL)
-        with engine.connect() as connection:
-            query = """
-            SELECT customer_id, total_orders, total_revenue, repeat_customer
-            FROM customer_data
-            """
-            df = pd.read_sql(query, connection)
+        if source == 'parquet':
+            return read_snapshot(FEATURES_TABLE, columns=columns)
+        with get_engine().connect() as connection:
+            df = read_frame(connection, f"SELECT {', '.join(columns)} FROM {FEATURES_TABLE}")
         return df
     except Exception as e:
         print(f"Error loading data: {e}")
         return None
 
-df = load_data()
 
-if df is not None and len(df) >= 100:
-    X = df[['total_orders', 'total_revenue']]
-    y = df['repeat_customer']
+def split_positions(n_rows):
+    """Row positions of the train/validation/test splits made by split_data."""
+    train_index, temp_index = train_test_split(np.arange(n_rows), test_size=0.3, random_state=42)
+    validation_index, test_index = train_test_split(temp_index, test_size=0.5, random_state=42)
+    return train_index, validation_index, test_index
 
-    # Split data into training and temp
-    X_train, X_temp, y_train, y_temp = train_test_split(X, y, test_size=0.3, random_state=42)
 
-    # Split temp into validation and test sets
-    X_val, X_test, y_val, y_test = train_test_split(X_temp, y_temp, test_size=0.5, random_state=42)
+def split_data(df):
+    X = df[FEATURES]
+    y = df[TARGET]
+    train_index, validation_index, test_index = split_positions(len(df))
+    return (X.iloc[train_index], X.iloc[validation_index], X.iloc[test_index],
+            y.iloc[train_index], y.iloc[validation_index], y.iloc[test_index])
 
-    # the Logistic Regression model
-    model = LogisticRegression(random_state=42, max_iter=1000, C=1.0)
 
+@instrument('model_fit', rows_in=lambda df, *args, **kwargs: len(df), rows_out=None)
+def train_model(df, C=1.0):
+    """Fits the model on the training split and returns it with its train/validation/test accuracy."""
+    X_train, X_val, X_test, y_train, y_val, y_test = split_data(df)
+    model = build_model(C)
     model.fit(X_train, y_train)
+    metrics = {
+        'train_accuracy': model.score(X_train, y_train),
+        'validation_accuracy': model.score(X_val, y_val),
+        'test_accuracy': model.score(X_test, y_test),
+    }
+    return model, metrics
+
+
+def save_model(model, metrics, training_rows, model_dir=MODEL_DIR):
+    """Persists the model with its metadata as models/repeat_customer-<version>.joblib and returns the path.
+
+    Versions are timestamps to the microsecond, and the file is created exclusively, so two runs never
+    overwrite each other's artifact.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    while True:
+        version = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        path = os.path.join(model_dir, f'{MODEL_NAME}-{version}.joblib')
+        try:
+            with open(path, 'xb') as artifact_file:
+                joblib.dump({
+                    'model': model,
+                    'version': version,
+                    'features': FEATURES,
+                    'metrics': metrics,
+                    'training_rows': training_rows,
+                    'sklearn_version': sklearn.__version__,
+                }, artifact_file)
+            return path
+        except FileExistsError:
+            continue
+
+
+def latest_model_path(model_dir=MODEL_DIR):
+    names = os.listdir(model_dir) if os.path.isdir(model_dir) else []
+    # Versions are timestamps, so the newest artifact sorts last
+    artifacts = sorted(name for name in names if name.startswith(f'{MODEL_NAME}-') and name.endswith('.joblib'))
+    if not artifacts:
+        raise FileNotFoundError(f"No {MODEL_NAME} model in {model_dir}; run 'predict_repeat_customers.py train'.")
+    return os.path.join(model_dir, artifacts[-1])
+
+
+def load_model(path=None):
+    """Loads a persisted model artifact, the latest one by default."""
+    return joblib.load(path or latest_model_path())
+
+
+def train(source=DATA_SOURCE, C=1.0):
+    df = load_data(source)
+    if df is None or len(df) < MIN_TRAINING_ROWS:
+        print(f"Data loading failed or insufficient data for training (minimum {MIN_TRAINING_ROWS} rows required).")
+        return None
+    model, metrics = train_model(df, C)
+    path = save_model(model, metrics, len(df))
+    print(f"Validation Accuracy: {metrics['validation_accuracy']:.2f}")
+    print(f"Model saved to {path}")
+    return path
+
+
+def evaluate(source=DATA_SOURCE, C_values=(1.0, 0.1), workers=None, report_path=None):
+    """Evaluates every C on shared splits and folds and emits one JSON report (to stdout without a path)."""
+    df = load_data(source)
+    if df is None or len(df) < MIN_TRAINING_ROWS:
+        print(f"Data loading failed or insufficient data for training (minimum {MIN_TRAINING_ROWS} rows required).")
+        return None
 
-    # Check Training and Validation Accuracy
-    train_accuracy = model.score(X_train, y_train)
-    val_accuracy = model.score(X_val, y_val)
-    print(f"Training Accuracy: {train_accuracy:.2f}")
-    print(f"Validation Accuracy: {val_accuracy:.2f}")
-
-    if val_accuracy >= 0.7:
-        y_test_pred = model.predict(X_test)
-
-        # model’s test accuracy
-        test_accuracy = accuracy_score(y_test, y_test_pred)
-        print(f"Test Accuracy: {test_accuracy:.2f}")
-
-        # classification report for the test set
-        print("Test Classification Report:")
-        print(classification_report(y_test, y_test_pred))
-
-        # confusion matrix
-        print("Confusion Matrix:")
-        print(confusion_matrix(y_test, y_test_pred))
-
-    # Cross-validation to check model stability
-    cv_scores = cross_val_score(model, X, y, cv=5)
-    print(f"Cross-validation scores: {cv_scores}")
-    print(f"Mean cross-validation score: {cv_scores.mean():.2f}")
-
-    # Learning Curves for visualizing overfitting
-    train_sizes, train_scores, val_scores = learning_curve(model, X, y, cv=5, scoring='accuracy')
-    train_scores_mean = train_scores.mean(axis=1)
-    val_scores_mean = val_scores.mean(axis=1)
-
-    plt.plot(train_sizes, train_scores_mean, label='Training score')
-    plt.plot(train_sizes, val_scores_mean, label='Validation score')
-    plt.xlabel("Training Set Size")
-    plt.ylabel("Accuracy")
-    plt.title("Learning Curves")
-    plt.legend()
-    plt.show()
-
-    # Experiment with regularization by adjusting C value
-    print("Experimenting with stronger regularization (C=0.1):")
-    model_regularized = LogisticRegression(random_state=42, max_iter=1000, C=0.1)
-    model_regularized.fit(X_train, y_train)
-    train_accuracy_regularized = model_regularized.score(X_train, y_train)
-    val_accuracy_regularized = model_regularized.score(X_val, y_val)
-    print(f"Training Accuracy with C=0.1: {train_accuracy_regularized:.2f}")
-    print(f"Validation Accuracy with C=0.1: {val_accuracy_regularized:.2f}")
-
-    print("Model Coefficients:")
-    for feature, coef in zip(X.columns, model.coef_[0]):
-        print(f"{feature}: {coef}")
-
-else:
-    print("Data loading failed or insufficient data for training (minimum 100 rows required).")
+    report = evaluate_configurations(df[FEATURES], df[TARGET], split_positions(len(df)), C_values, workers)
+    report['features'] = FEATURES
+    text = write_report(report, report_path)
+    print(text if report_path is None else f"Evaluation report written to {report_path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or evaluate the repeat-customer model.")
+    parser.add_argument('--source', choices=['database', 'parquet'], default=DATA_SOURCE,
+                        help="Read customer_features from the database or from its Parquet snapshot.")
+    subparsers = parser.add_subparsers(dest='command')
+    train_parser = subparsers.add_parser('train', help="Fit the model and save a versioned artifact under models/.")
+    train_parser.add_argument('--C', type=float, default=1.0, help="Inverse regularisation strength.")
+    evaluate_parser = subparsers.add_parser(
+        'evaluate', help="Holdout, cross-validation and learning-curve metrics for several C values as JSON.")
+    evaluate_parser.add_argument('--C', type=float, nargs='+', default=[1.0, 0.1], dest='C_values',
+                                 help="Inverse regularisation strengths to compare.")
+    evaluate_parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores).")
+    evaluate_parser.add_argument('--report', default=None, help="Write the JSON report here instead of stdout.")
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        train(source=args.source, C=args.C)
+    elif args.command == 'evaluate':
+        evaluate(source=args.source, C_values=args.C_values, workers=args.workers, report_path=args.report)
+    else:
+        evaluate(source=args.source)
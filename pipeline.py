@@ -0,0 +1,296 @@
+"""Runs the pipeline stages as a DAG, skipping stages whose inputs have not changed since their last run.
+
+Each stage's fingerprint hashes its command, its code files, its input files, cheap watermarks of the tables it
+reads and the fingerprints of the stages it depends on. A stage is skipped when its fingerprint matches the last
+successful run recorded in the state file and its outputs still exist. Stages whose dependencies are done run
+concurrently, each as its own process, except that on SQLite, which allows one writer per database file, stages
+writing tables never overlap.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from sqlalchemy import inspect
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+
+from common.db import database_url, get_engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATE_FILE = os.environ.get('PIPELINE_STATE_FILE', os.path.join(ROOT, '.pipeline_state.json'))
+MODEL_DIR = os.environ.get('MODEL_DIR', os.path.join(ROOT, 'models'))
+REPORT_PATH = os.path.join(ROOT, 'reports', 'evaluation.json')
+
+COMMON_CODE = ['common/*.py']
+
+# Cheap change probes per table: row count plus indexed maxima, never a full aggregate over orders
+TABLE_WATERMARKS = {
+    'customers': "SELECT COUNT(*), MAX(customer_id) FROM customers",
+    'orders': "SELECT COUNT(*), MAX(order_id), MAX(order_date) FROM orders",
+    'customer_data': "SELECT COUNT(*), SUM(total_orders), SUM(total_revenue) FROM customer_data",
+    'customer_features': "SELECT COUNT(*), SUM(frequency), SUM(monetary), MAX(as_of_date) FROM customer_features",
+    'customer_scoring_features': "SELECT COUNT(*), SUM(frequency), SUM(monetary), MAX(as_of_date) "
+                                 "FROM customer_scoring_features",
+}
+
+# Paths are relative to the repository root; commands run from the stage's directory
+STAGES = {
+    'etl': {
+        'cwd': 'part_1',
+        'command': ['data_import_preparation.py'],
+        'code': ['part_1/*.py'],
+        'files': ['customers.csv', 'order.csv'],
+        'outputs': {'tables': ['customers', 'orders']},
+    },
+    'customer_data': {
+        'cwd': 'part_3',
+        'command': ['data_preparation.py'],
+        'depends': ['etl'],
+        'code': ['part_3/data_preparation.py', 'part_3/incremental_aggregation.py'],
+        'tables': ['customers', 'orders'],
+        'outputs': {'tables': ['customer_data']},
+    },
+    'customer_features': {
+        'cwd': 'part_3',
+        'command': ['feature_materialization.py'],
+        'depends': ['etl'],
+        'code': ['part_3/feature_materialization.py'],
+        'tables': ['orders'],
+        'outputs': {'tables': ['customer_features', 'customer_scoring_features']},
+    },
+    'model_train': {
+        'cwd': 'part_3',
+        'command': ['predict_repeat_customers.py', 'train'],
+        'depends': ['customer_features'],
+        'code': ['part_3/predict_repeat_customers.py', 'part_3/evaluation.py'],
+        'tables': ['customer_features'],
+        'outputs': {'files': [os.path.join(MODEL_DIR, 'repeat_customer-*.joblib')]},
+    },
+    'model_evaluate': {
+        'cwd': 'part_3',
+        'command': ['predict_repeat_customers.py', 'evaluate', '--report', REPORT_PATH],
+        'depends': ['customer_features'],
+        'code': ['part_3/predict_repeat_customers.py', 'part_3/evaluation.py'],
+        'tables': ['customer_features'],
+        'outputs': {'files': [REPORT_PATH]},
+    },
+    'batch_score': {
+        'cwd': 'part_3',
+        'command': ['batch_score.py'],
+        'depends': ['model_train'],
+        'code': ['part_3/batch_score.py', 'part_3/predict_repeat_customers.py'],
+        'files': [os.path.join(MODEL_DIR, 'repeat_customer-*.joblib')],
+        'tables': ['customer_scoring_features'],
+        'outputs': {'tables': ['customer_predictions']},
+    },
+}
+
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {'stages': {}, 'file_hashes': {}}
+    with open(path) as state_file:
+        return json.load(state_file)
+
+
+def save_state(state, path=STATE_FILE):
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w') as state_file:
+        json.dump(state, state_file, indent=2, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def expand(patterns):
+    paths = []
+    for pattern in patterns:
+        pattern = pattern if os.path.isabs(pattern) else os.path.join(ROOT, pattern)
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*.csv')
+        paths += sorted(glob.glob(pattern))
+    return paths
+
+
+def file_hash(path, cache):
+    """SHA-256 of a file, reused from `cache` while its size and mtime are unchanged."""
+    stat = os.stat(path)
+    cached = cache.get(path)
+    if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(1 << 20), b''):
+            digest.update(block)
+    cache[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return cache[path][2]
+
+
+def table_watermark(connection, table):
+    if not inspect(connection).has_table(table):
+        return None
+    return [str(value) for value in connection.exec_driver_sql(TABLE_WATERMARKS[table]).one()]
+
+
+def fingerprint(stage, upstream, state):
+    """Hash of everything the stage's result depends on; see the module docstring."""
+    inputs = {
+        'command': stage['command'],
+        'code': {os.path.relpath(path, ROOT): file_hash(path, state['file_hashes'])
+                 for path in expand(stage.get('code', []) + COMMON_CODE)},
+        'files': {path: file_hash(path, state['file_hashes']) for path in expand(stage.get('files', []))},
+        'upstream': {dependency: upstream[dependency] for dependency in stage.get('depends', [])},
+        'database': database_url().render_as_string(hide_password=True),
+    }
+    if stage.get('tables'):
+        with get_engine().connect() as connection:
+            inputs['tables'] = {table: table_watermark(connection, table) for table in stage['tables']}
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def outputs_exist(stage):
+    outputs = stage.get('outputs', {})
+    if any(not expand([pattern]) for pattern in outputs.get('files', [])):
+        return False
+    if outputs.get('tables'):
+        inspector = inspect(get_engine())
+        return all(inspector.has_table(table) for table in outputs['tables'])
+    return True
+
+
+def writes_tables(stage):
+    return bool(stage.get('outputs', {}).get('tables'))
+
+
+def run_stage(name, stage, verbose=False):
+    """Runs one stage as a subprocess and returns (succeeded, seconds)."""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable] + stage['command'], cwd=os.path.join(ROOT, stage['cwd']),
+                               capture_output=True, text=True)
+    if verbose or completed.returncode != 0:
+        sys.stderr.write(f"----- {name} -----\n{completed.stdout}{completed.stderr}")
+    return completed.returncode == 0, time.perf_counter() - start
+
+
+def with_dependencies(targets, stages):
+    selected = []
+
+    def visit(name):
+        for dependency in stages[name].get('depends', []):
+            visit(dependency)
+        if name not in selected:
+            selected.append(name)
+
+    for target in targets:
+        visit(target)
+    return selected
+
+
+def run_pipeline(stages, targets=None, force=False, jobs=None, dry_run=False, verbose=False, state_path=STATE_FILE):
+    """Runs `targets` (default: every stage) and their dependencies; returns {stage: (status, seconds)}."""
+    state = load_state(state_path)
+    selected = with_dependencies(targets or list(stages), stages)
+    fingerprints, results, running = {}, {}, {}
+    # Concurrent writers would fail with "database is locked" once SQLite's busy timeout runs out
+    serialise_writers = database_url().get_backend_name() == 'sqlite'
+
+    def dependency_statuses(name):
+        return [results[dependency][0] if dependency in results else None
+                for dependency in stages[name].get('depends', [])]
+
+    with ThreadPoolExecutor(max_workers=jobs or len(selected)) as executor:
+        while len(results) < len(selected):
+            for name in selected:
+                statuses = dependency_statuses(name)
+                if name in results or name in running or None in statuses:
+                    continue
+                if 'failed' in statuses or 'blocked' in statuses:
+                    results[name] = ('blocked', 0.0)
+                elif 'would run' in statuses:
+                    # Its inputs are only known once the upstream stage has actually run
+                    results[name] = ('would run', 0.0)
+                else:
+                    # Upstream stages have finished, so the table watermarks are those this stage will read
+                    fingerprints[name] = fingerprint(stages[name], fingerprints, state)
+                    previous = state['stages'].get(name, {})
+                    if not force and previous.get('fingerprint') == fingerprints[name] and outputs_exist(stages[name]):
+                        results[name] = ('skipped', 0.0)
+                    elif dry_run:
+                        results[name] = ('would run', 0.0)
+                    elif (serialise_writers and writes_tables(stages[name])
+                          and any(writes_tables(stages[other]) for other in running)):
+                        # Started once the running writer finishes
+                        continue
+                    else:
+                        logger.info(f"Running stage {name}.")
+                        running[name] = executor.submit(run_stage, name, stages[name], verbose)
+            if not running:
+                continue
+
+            done, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+            for name, future in list(running.items()):
+                if future not in done:
+                    continue
+                succeeded, seconds = future.result()
+                del running[name]
+                results[name] = ('ran' if succeeded else 'failed', seconds)
+                if succeeded:
+                    state['stages'][name] = {'fingerprint': fingerprints[name], 'seconds': seconds,
+                                             'finished_at': datetime.now().isoformat(timespec='seconds')}
+                else:
+                    state['stages'].pop(name, None)
+                    logger.error(f"Stage {name} failed.")
+                save_state(state, state_path)
+    if not dry_run:
+        save_state(state, state_path)
+    return {name: results[name] for name in selected}
+
+
+def configure_stages(orders=None, incremental=False):
+    """STAGES with the ETL reading `orders` (a directory or glob of order files) and incremental options."""
+    stages = json.loads(json.dumps(STAGES))
+    if orders:
+        orders = os.path.abspath(orders)
+        stages['etl']['command'] += ['--orders', orders]
+        stages['etl']['files'] = ['customers.csv', orders]
+    if incremental:
+        stages['etl']['command'] += ['--incremental']
+        stages['customer_data']['command'] += ['--incremental']
+        stages['customer_features']['command'] += ['--incremental']
+    return stages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('stages', nargs='*', default=[],
+                        help=f"Stages to bring up to date, with their dependencies: {', '.join(STAGES)} "
+                             "(default: all).")
+    parser.add_argument('--force', action='store_true', help="Run the stages even if their inputs are unchanged.")
+    parser.add_argument('--jobs', type=int, default=None, help="Stages run at the same time (default: no limit).")
+    parser.add_argument('--dry-run', action='store_true', help="Only report which stages would run.")
+    parser.add_argument('--orders', default=None, help="Directory or glob of order files for the ETL.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Run the ETL, customer_data and customer_features incrementally.")
+    parser.add_argument('--verbose', action='store_true', help="Show the stages' output.")
+    args = parser.parse_args()
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}.")
+
+    start = time.perf_counter()
+    results = run_pipeline(configure_stages(args.orders, args.incremental), args.stages, args.force, args.jobs,
+                           args.dry_run, args.verbose)
+    print(f"{'stage':<18} {'status':<10} {'seconds':>8}")
+    for name, (status, seconds) in results.items():
+        print(f"{name:<18} {status:<10} {seconds:>8.1f}")
+    print(f"Pipeline finished in {time.perf_counter() - start:.1f}s.")
+    sys.exit(1 if any(status in ('failed', 'blocked') for status, _ in results.values()) else 0)
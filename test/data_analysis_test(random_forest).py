@@ -1,28 +1,44 @@
-import pandas as pd
-from sqlalchemy import create_engine
-from sklearn.model_selection import train_test_split, GridSearchCV
+import argparse
+import itertools
+import math
+import os
+import sys
+import time
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report
 import warnings
 
-DB_USER = 'root'
-DB_PASSWORD = 'Muw0okm_PL<'
-DB_HOST = 'localhost'
-DB_PORT = '3306'
-DB_NAME = 'delivery'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.db import get_engine
+from common.loader import read_frame
+
+param_grid = {
+    'n_estimators': [50, 100, 200],
+    'max_depth': [None, 10, 20, 30],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': ['sqrt', 'log2']
+}
+
+CV_FOLDS = 5
+
+# RFM features materialised by part_3/feature_materialization.py
+FEATURES = ['recency_days', 'frequency', 'monetary', 'avg_order_value', 'avg_gap_days', 'max_gap_days', 'tenure_days']
 
-DATABASE_URL = f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
 
 def load_data():
     try:
-        engine = create_engine(DATABASE_URL)
-        connection = engine.connect()
+        connection = get_engine().connect()
 
-        query = """
-        SELECT customer_id, total_orders, total_revenue, repeat_customer
-        FROM customer_data
+        query = f"""
+        SELECT customer_id, {', '.join(FEATURES)}, repeat_customer
+        FROM customer_features
         """
-        df = pd.read_sql(query, connection)
+        df = read_frame(connection, query)
 
         connection.close()
 
@@ -32,32 +48,87 @@ def load_data():
         print(f"Error loading data: {e}")
         return None
 
-df = load_data()
-
-if df is not None and len(df) >= 100:
-    X = df[['total_orders', 'total_revenue']]
-    y = df['repeat_customer']
 
-    X_train, X_temp, y_train, y_temp = train_test_split(X, y, test_size=0.3, random_state=42)
+def make_folds(X, y):
+    """Fold splits computed once and shared by every search, so all candidates see the same folds.
 
-    X_val, X_test, y_val, y_test = train_test_split(X_temp, y_temp, test_size=0.5, random_state=42)
+    Unshuffled, these are the folds the original GridSearchCV(cv=5) used, so the grid baseline is unchanged.
+    """
+    return list(StratifiedKFold(n_splits=CV_FOLDS).split(X, y))
 
-    model = RandomForestClassifier(random_state=42)
 
-    param_grid = {
-        'n_estimators': [50, 100, 200],
-        'max_depth': [None, 10, 20, 30],
-        'min_samples_split': [2, 5, 10],
-        'min_samples_leaf': [1, 2, 4],
-        'max_features': ['sqrt', 'log2']
-    }
-
-    grid_search = GridSearchCV(estimator=model, param_grid=param_grid, cv=5, n_jobs=-1, scoring='accuracy', verbose=1)
+def grid_search_cv(X_train, y_train, folds):
+    """The exhaustive search: every configuration in param_grid, each fold fit from scratch."""
+    grid_search = GridSearchCV(estimator=RandomForestClassifier(random_state=42), param_grid=param_grid, cv=folds,
+                               n_jobs=-1, scoring='accuracy', verbose=1)
     grid_search.fit(X_train, y_train)
+    fits = len(grid_search.cv_results_['params']) * len(folds)
+    return grid_search.best_estimator_, grid_search.best_params_, grid_search.best_score_, fits
+
+
+def grow_and_score(model, X_train, y_train, fold, n_estimators, max_samples):
+    """Adds trees to a warm-started fold model up to `n_estimators` and returns its out-of-fold accuracy."""
+    train_index, test_index = fold
+    model.set_params(n_estimators=n_estimators, max_samples=max_samples)
+    model.fit(X_train.iloc[train_index], y_train.iloc[train_index])
+    return model.score(X_train.iloc[test_index], y_train.iloc[test_index])
+
+
+def successive_halving(X_train, y_train, folds, factor=3, min_estimators=8, budget_seconds=None):
+    """Successive halving over the grid with trees and bootstrap sample size as the growing resource.
+
+    Every configuration starts with `min_estimators` trees on small bootstrap samples; after each rung
+    only the best 1/`factor` go on, with `factor` times more trees. Fold models use warm_start, so a
+    promoted candidate keeps the trees it already has and only fits the new ones. With `budget_seconds`,
+    promotion stops once the budget is spent and the best candidate so far wins.
+    """
+    max_estimators = max(param_grid['n_estimators'])
+    settings = {key: values for key, values in param_grid.items() if key != 'n_estimators'}
+    candidates = [dict(zip(settings, values)) for values in itertools.product(*settings.values())]
+    models = {index: [RandomForestClassifier(random_state=42, warm_start=True, **params) for _ in folds]
+              for index, params in enumerate(candidates)}
+
+    start = time.perf_counter()
+    rungs = max(1, math.ceil(math.log(max_estimators / min_estimators, factor)) + 1)
+    fits = 0
+    scores = {}
+    for rung in range(rungs):
+        n_estimators = min(max_estimators, min_estimators * factor ** rung)
+        # Later rungs see larger bootstrap samples; the last one uses the full training fold
+        max_samples = None if n_estimators == max_estimators else max(0.1, n_estimators / max_estimators)
+        tasks = [(index, fold_index) for index in models for fold_index in range(len(folds))]
+        fold_scores = Parallel(n_jobs=-1, prefer='threads')(
+            delayed(grow_and_score)(models[index][fold_index], X_train, y_train, folds[fold_index], n_estimators,
+                                    max_samples)
+            for index, fold_index in tasks)
+        fits += len(tasks)
+        scores = {index: np.mean(fold_scores[position:position + len(folds)])
+                  for position, index in zip(range(0, len(tasks), len(folds)), models)}
+        print(f"Rung {rung}: {len(models)} candidates, {n_estimators} trees, "
+              f"best CV accuracy {max(scores.values()):.4f}")
+
+        over_budget = budget_seconds is not None and time.perf_counter() - start >= budget_seconds
+        if len(models) == 1 or n_estimators == max_estimators or over_budget:
+            break
+        keep = sorted(models, key=lambda index: scores[index], reverse=True)[:max(1, math.ceil(len(models) / factor))]
+        models = {index: models[index] for index in keep}
+
+    best_index = max(scores, key=scores.get)
+    best_params = {**candidates[best_index], 'n_estimators': max_estimators}
+    best_model = RandomForestClassifier(random_state=42, **best_params).fit(X_train, y_train)
+    return best_model, best_params, scores[best_index], fits
+
+
+def run_search(mode, X_train, y_train, folds, budget_seconds=None):
+    start = time.perf_counter()
+    if mode == 'grid':
+        result = grid_search_cv(X_train, y_train, folds)
+    else:
+        result = successive_halving(X_train, y_train, folds, budget_seconds=budget_seconds)
+    return result + (time.perf_counter() - start,)
 
-    best_model = grid_search.best_estimator_
-    print("Best Parameters:", grid_search.best_params_)
 
+def report(best_model, X_val, y_val, X_test, y_test):
     y_val_pred = best_model.predict(X_val)
     val_accuracy = accuracy_score(y_val, y_val_pred)
     print(f"Validation Accuracy: {val_accuracy:.2f}")
@@ -72,5 +143,42 @@ if df is not None and len(df) >= 100:
         print(classification_report(y_test, y_test_pred))
     else:
         warnings.warn("Validation accuracy is below the acceptable threshold. Consider revisiting the features or model.")
-else:
-    print("Data loading failed or insufficient data for training (minimum 100 rows required).")
\ No newline at end of file
+    return val_accuracy
+
+
+def main(search='grid', budget_seconds=None):
+    df = load_data()
+    if df is None or len(df) < 100:
+        print("Data loading failed or insufficient data for training (minimum 100 rows required).")
+        return
+
+    X = df[FEATURES]
+    y = df['repeat_customer']
+
+    X_train, X_temp, y_train, y_temp = train_test_split(X, y, test_size=0.3, random_state=42)
+
+    X_val, X_test, y_val, y_test = train_test_split(X_temp, y_temp, test_size=0.5, random_state=42)
+
+    folds = make_folds(X_train, y_train)
+    modes = ['grid', 'halving'] if search == 'compare' else [search]
+    results = []
+    for mode in modes:
+        best_model, best_params, best_score, fits, seconds = run_search(mode, X_train, y_train, folds,
+                                                                        budget_seconds)
+        print(f"[{mode}] Best Parameters:", best_params)
+        val_accuracy = report(best_model, X_val, y_val, X_test, y_test)
+        results.append((mode, fits, seconds, best_score, val_accuracy))
+
+    print(f"{'search':<8} {'fits':>6} {'seconds':>9} {'best CV':>8} {'val acc':>8}")
+    for mode, fits, seconds, best_score, val_accuracy in results:
+        print(f"{mode:<8} {fits:>6} {seconds:>9.1f} {best_score:>8.4f} {val_accuracy:>8.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Random forest hyperparameter search for repeat customers.")
+    parser.add_argument('--search', choices=['grid', 'halving', 'compare'], default='grid',
+                        help="Exhaustive GridSearchCV, budgeted successive halving, or both with a timing comparison.")
+    parser.add_argument('--budget-seconds', type=float, default=None,
+                        help="Stop promoting halving candidates once this much time is spent.")
+    args = parser.parse_args()
+    main(search=args.search, budget_seconds=args.budget_seconds)
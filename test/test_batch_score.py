@@ -0,0 +1,62 @@
+import os
+import sys
+
+import joblib
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'part_3'))
+
+import batch_score
+import feature_materialization
+from common import staging
+from common.db import get_engine
+from evaluation import build_model
+from predict_repeat_customers import FEATURES, save_model
+
+# Customers 1 to 3 order before the training as-of date (2024-05-03); customer 4 only on the latest date
+ORDERS = pd.DataFrame({
+    'order_id': [1, 2, 3, 4, 5, 6],
+    'customer_id': [1, 1, 2, 2, 3, 4],
+    'total_amount': [10.0, 20.0, 5.0, 7.5, 12.0, 30.0],
+    'order_date': pd.to_datetime(['2024-01-01', '2024-02-01', '2024-01-10', '2024-03-20', '2024-02-15',
+                                  '2024-08-01']),
+})
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'scoring.db'}")
+    monkeypatch.setattr(staging, 'STAGING_DIR', str(tmp_path / 'staging'))
+    engine = get_engine()
+    ORDERS.to_sql('orders', engine, index=False)
+    feature_materialization.create_customer_features()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def model_path(tmp_path, engine):
+    training = pd.read_sql("SELECT * FROM customer_features ORDER BY customer_id", engine)
+    model = build_model(1.0).fit(training[FEATURES], [0, 1, 0])
+    return save_model(model, {}, len(training), model_dir=str(tmp_path / 'models'))
+
+
+@pytest.mark.parametrize('source', ['database', 'parquet'])
+def test_customers_whose_first_order_is_recent_are_scored(engine, model_path, source):
+    assert batch_score.batch_score(source=source, chunksize=2, model_path=model_path) == 4
+    predictions = pd.read_sql("SELECT * FROM customer_predictions ORDER BY customer_id", engine)
+    assert predictions['customer_id'].tolist() == [1, 2, 3, 4]
+    assert predictions['repeat_probability'].between(0, 1).all()
+
+
+def test_model_trained_on_features_the_table_lacks_asks_for_retraining(engine, tmp_path, model_path):
+    artifact = joblib.load(model_path)
+    # Artifacts from before customer_features existed were trained on customer_data's columns
+    artifact['features'] = ['total_orders', 'total_revenue']
+    old_path = tmp_path / 'old.joblib'
+    joblib.dump(artifact, old_path)
+    with pytest.raises(ValueError, match="total_orders, total_revenue.*retrain"):
+        batch_score.batch_score(source='database', model_path=str(old_path))
@@ -0,0 +1,55 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import BigInteger, Float, create_engine
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import staging
+from common.bulk_loader import bulk_write
+from common.compact import compact_frame, wide_amounts
+
+# Cents that float32 cannot hold exactly, e.g. 1234.56 is 1234.56005859375 in float32
+AMOUNTS = [1234.56, 0.1, 99.99, 19.95, 45678.91]
+
+
+def orders():
+    return pd.DataFrame({'order_id': range(1, len(AMOUNTS) + 1), 'total_amount': AMOUNTS,
+                         'order_date': pd.to_datetime(['2024-01-05'] * len(AMOUNTS))})
+
+
+@pytest.fixture
+def compact_orders():
+    compact = compact_frame(orders())
+    assert compact['total_amount'].dtype == 'float32'
+    return compact
+
+
+def test_amounts_that_are_not_whole_cents_stay_float64():
+    assert compact_frame(pd.DataFrame({'total_amount': [0.125, 1.5]}))['total_amount'].dtype == 'float64'
+
+
+def test_wide_amounts_gives_back_the_original_cents(compact_orders):
+    amounts = wide_amounts(compact_orders['total_amount'])
+    assert amounts.dtype == 'float64'
+    assert amounts.tolist() == AMOUNTS
+    assert amounts.sum() == pd.Series(AMOUNTS).sum()
+
+
+def test_compact_amounts_are_written_to_the_database_as_cents(compact_orders, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'compact.db'}")
+    bulk_write(engine, compact_orders, 'orders', {'order_id': BigInteger(), 'total_amount': Float()})
+    loaded = pd.read_sql("SELECT total_amount FROM orders ORDER BY order_id", engine)
+    engine.dispose()
+    assert loaded['total_amount'].tolist() == AMOUNTS
+
+
+def test_compact_amounts_are_snapshotted_as_cents(compact_orders, tmp_path, monkeypatch):
+    monkeypatch.setattr(staging, 'STAGING_DIR', str(tmp_path))
+    staging.write_snapshot(compact_orders, 'orders', date_column='order_date')
+    snapshot = staging.read_snapshot('orders').sort_values('order_id')
+    assert snapshot['total_amount'].dtype == np.float64
+    assert snapshot['total_amount'].tolist() == AMOUNTS
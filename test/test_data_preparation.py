@@ -0,0 +1,81 @@
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'part_3'))
+
+import data_preparation
+from common import staging
+from common.db import get_engine
+
+CUSTOMERS = pd.DataFrame({'customer_id': [1, 2, 3, 4], 'customer_name': ['Ann', 'Bob', 'Cy', 'Di']})
+
+ORDERS = pd.DataFrame({
+    'order_id': range(1, 13),
+    'customer_id': [1, 1, 2, 2, 2, 3, 3, 1, 2, 3, 1, 2],
+    'total_amount': [10.0, 12.5, 11.0, 9.5, 13.0, 10.5, 12.0, 11.5, 10.0, 950.0, 14.0, 8.5],
+    'order_date': pd.to_datetime(['2024-01-01'] * 12),
+})
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'customer_data.db'}")
+    monkeypatch.setattr(staging, 'STAGING_DIR', str(tmp_path / 'staging'))
+    engine = get_engine()
+    CUSTOMERS.to_sql('customers', engine, index=False)
+    ORDERS.to_sql('orders', engine, index=False)
+    # Kept by the ETL's rollups; incremental runs read which customers' orders changed from it
+    pd.DataFrame({'customer_id': CUSTOMERS['customer_id'], 'updated_at': datetime(2024, 1, 1)}).to_sql(
+        'customer_revenue', engine, index=False)
+    yield engine
+    engine.dispose()
+
+
+def read_customer_data(engine):
+    return pd.read_sql("SELECT * FROM customer_data ORDER BY customer_id", engine)
+
+
+def change_orders(engine):
+    """New orders, a changed amount, a new customer and a renamed one, as an incremental ETL run leaves them."""
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO orders (order_id, customer_id, total_amount, order_date) "
+                                "VALUES (13, 4, 11.0, '2024-02-01'), (14, 4, 9.0, '2024-02-02'), "
+                                "(15, 5, 12.0, '2024-02-03'), (16, 3, 10.0, '2024-02-03')"))
+        connection.execute(text("UPDATE orders SET total_amount = 13.5 WHERE order_id = 2"))
+        connection.execute(text("INSERT INTO customers VALUES (5, 'Ed')"))
+        connection.execute(text("UPDATE customers SET customer_name = 'Bobby' WHERE customer_id = 2"))
+        connection.execute(text("INSERT INTO customer_revenue VALUES (5, :now)"), {'now': datetime.now()})
+        connection.execute(text("UPDATE customer_revenue SET updated_at = :now WHERE customer_id IN (1, 3, 4)"),
+                           {'now': datetime.now()})
+
+
+@pytest.mark.parametrize('chunksize', [None, 3])
+def test_incremental_update_matches_a_full_rebuild(engine, chunksize):
+    data_preparation.create_customer_data_table('database', chunksize)
+    change_orders(engine)
+
+    assert data_preparation.update_customer_data_table('database', chunksize) > 0
+    updated = read_customer_data(engine)
+    updated_snapshot = staging.read_snapshot('customer_data').sort_values('customer_id', ignore_index=True)
+    data_preparation.create_customer_data_table('database', chunksize)
+    rebuilt = read_customer_data(engine)
+
+    pd.testing.assert_frame_equal(updated, rebuilt)
+    assert rebuilt['customer_id'].tolist() == [1, 2, 3, 4, 5]
+    assert rebuilt.loc[rebuilt['customer_id'] == 2, 'customer_name'].item() == 'Bobby'
+    # The snapshot is patched the same way
+    pd.testing.assert_frame_equal(updated_snapshot[rebuilt.columns], rebuilt, check_dtype=False)
+
+
+def test_rerun_without_changes_touches_nobody(engine):
+    data_preparation.create_customer_data_table('database')
+    before = read_customer_data(engine)
+    assert data_preparation.update_customer_data_table('database') == 0
+    pd.testing.assert_frame_equal(read_customer_data(engine), before)
@@ -0,0 +1,104 @@
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'part_3'))
+
+import feature_materialization
+from common import staging
+from common.db import get_engine
+
+ORDERS = pd.DataFrame({
+    'order_id': [1, 2, 3, 4, 5, 6],
+    'customer_id': [1, 1, 2, 2, 3, 4],
+    'total_amount': [10.0, 20.0, 5.0, 7.5, 12.0, 30.0],
+    'order_date': pd.to_datetime(['2024-01-01', '2024-02-01', '2024-01-10', '2024-03-20', '2024-02-15',
+                                  '2024-08-01']),
+})
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'features.db'}")
+    monkeypatch.setattr(staging, 'STAGING_DIR', str(tmp_path / 'staging'))
+    engine = get_engine()
+    ORDERS.to_sql('orders', engine, index=False)
+    pd.DataFrame({'customer_id': [1, 2, 3, 4], 'updated_at': [datetime(2024, 1, 1)] * 4}).to_sql(
+        'customer_revenue', engine, index=False)
+    yield engine
+    engine.dispose()
+
+
+def read_features(engine):
+    return pd.read_sql("SELECT * FROM customer_features ORDER BY customer_id", engine).drop(columns='updated_at')
+
+
+def test_label_comes_from_the_orders_after_the_as_of_date(engine):
+    feature_materialization.create_customer_features(datetime(2024, 2, 28))
+    features = read_features(engine).set_index('customer_id')
+
+    # Customer 1 ordered twice before the as-of date but not after it; customer 2 ordered again within the window
+    assert features['frequency'].to_dict() == {1: 2, 2: 1, 3: 1}
+    assert features['repeat_customer'].to_dict() == {1: 0, 2: 1, 3: 0}
+
+
+def test_incremental_update_matches_a_rebuild_at_a_later_as_of_date(engine):
+    feature_materialization.create_customer_features(datetime(2024, 2, 28))
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO orders VALUES (7, 3, 9.0, '2024-05-01 00:00:00.000000')"))
+        connection.execute(text("UPDATE customer_revenue SET updated_at = :now WHERE customer_id = 3"),
+                           {'now': datetime.now()})
+
+    feature_materialization.update_customer_features(datetime(2024, 3, 1))
+    updated = read_features(engine)
+    feature_materialization.create_customer_features(datetime(2024, 3, 1))
+    pd.testing.assert_frame_equal(updated, read_features(engine))
+    assert read_features(engine).set_index('customer_id')['repeat_customer'].to_dict() == {1: 0, 2: 1, 3: 1}
+
+
+def test_refresh_only_rewrites_customers_left_at_the_previous_as_of_date(engine):
+    feature_materialization.create_customer_features(datetime(2024, 2, 28))
+    as_of = datetime(2024, 3, 1)
+    with engine.begin() as connection:
+        # Customer 2 recomputed at the new as-of date, as update_customer_features does for touched customers
+        feature_materialization.execute(connection, "DELETE FROM customer_features WHERE customer_id = 2")
+        feature_materialization.insert_features(connection, feature_materialization.customer_features_table, as_of,
+                                                "AND customer_id IN :customer_ids", {'customer_ids': [2]})
+        assert feature_materialization.refresh_as_of(connection, feature_materialization.customer_features_table,
+                                                     as_of) == 2
+    refreshed = read_features(engine)
+    feature_materialization.create_customer_features(as_of)
+    pd.testing.assert_frame_equal(refreshed, read_features(engine))
+
+
+def test_scoring_rows_are_as_of_the_latest_order_and_include_recent_customers(engine):
+    feature_materialization.create_customer_features()
+    training = read_features(engine)
+    scoring = pd.read_sql("SELECT * FROM customer_scoring_features ORDER BY customer_id", engine)
+
+    # Customer 4 first ordered within the training rows' label window, so only the scoring rows have them
+    assert training['customer_id'].tolist() == [1, 2, 3]
+    assert scoring['customer_id'].tolist() == [1, 2, 3, 4]
+    assert set(pd.to_datetime(scoring['as_of_date'])) == {pd.Timestamp('2024-08-01')}
+    assert scoring.set_index('customer_id')['frequency'].to_dict() == {1: 2, 2: 2, 3: 1, 4: 1}
+    assert 'repeat_customer' not in scoring
+
+
+def test_incremental_update_keeps_the_scoring_rows_at_the_latest_order(engine):
+    feature_materialization.create_customer_features()
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO orders VALUES (7, 5, 9.0, '2024-09-01 12:30:00.250000')"))
+        connection.execute(text("INSERT INTO customer_revenue VALUES (5, :now)"), {'now': datetime.now()})
+
+    feature_materialization.update_customer_features()
+    updated = pd.read_sql("SELECT * FROM customer_scoring_features ORDER BY customer_id", engine)
+    feature_materialization.create_customer_features()
+    rebuilt = pd.read_sql("SELECT * FROM customer_scoring_features ORDER BY customer_id", engine)
+    pd.testing.assert_frame_equal(updated.drop(columns='updated_at'), rebuilt.drop(columns='updated_at'))
+    assert rebuilt['customer_id'].tolist() == [1, 2, 3, 4, 5]
@@ -0,0 +1,106 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'part_1'))
+
+import data_import_preparation
+from incremental_load import (customers_table, enable_sqlite_foreign_keys, ensure_schema, get_watermark,
+                              load_customers_incrementally, load_orders_incrementally, read_orders_watermark,
+                              upsert_rows)
+from schema import key_index
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'incremental.db'}")
+    enable_sqlite_foreign_keys(engine)
+    assert ensure_schema(engine)
+    yield engine
+    engine.dispose()
+
+
+def customers():
+    return pd.DataFrame({'customer_id': [1, 2], 'customer_name': ['Ann', 'Bob']})
+
+
+def orders():
+    return pd.DataFrame({
+        'order_id': [10, 11, 12],
+        'customer_id': [1, 2, 1],
+        'total_amount': [12.5, 99.99, 0.1],
+        'order_date': pd.to_datetime(['2024-01-01 10:00', '2024-01-02 11:00', '2024-01-03 12:00']),
+    })
+
+
+def load(engine, orders_df):
+    known_customer_ids = load_customers_incrementally(customers(), engine)
+    return load_orders_incrementally(orders_df, engine, known_customer_ids, read_orders_watermark(engine))
+
+
+def read_orders(engine):
+    return pd.read_sql("SELECT order_id, customer_id, total_amount FROM orders ORDER BY order_id", engine)
+
+
+def test_first_load_inserts_every_order_and_sets_the_watermark(engine):
+    assert len(load(engine, orders())) == 3
+    assert read_orders(engine)['order_id'].tolist() == [10, 11, 12]
+    with engine.connect() as connection:
+        last_key, last_timestamp = get_watermark(connection, 'orders')
+    assert last_key == 12
+    assert pd.Timestamp(last_timestamp) == pd.Timestamp('2024-01-03 12:00')
+
+
+def test_rerun_of_the_same_export_upserts_nothing(engine):
+    load(engine, orders())
+    before = read_orders(engine)
+    assert load(engine, orders()).empty
+    pd.testing.assert_frame_equal(read_orders(engine), before)
+
+
+def test_changed_and_new_orders_are_upserted(engine):
+    load(engine, orders())
+    changed = orders()
+    # A re-exported order carries a created_at past the watermark
+    changed.loc[changed['order_id'] == 11, ['total_amount', 'order_date']] = [120.0, pd.Timestamp('2024-01-04')]
+    changed = pd.concat([changed, pd.DataFrame({'order_id': [13], 'customer_id': [2], 'total_amount': [5.25],
+                                                'order_date': [pd.Timestamp('2024-01-03 12:00')]})],
+                        ignore_index=True)
+
+    assert sorted(load(engine, changed)['order_id']) == [11, 13]
+    loaded = read_orders(engine).set_index('order_id')['total_amount']
+    assert loaded.to_dict() == {10: 12.5, 11: 120.0, 12: 0.1, 13: 5.25}
+
+
+def test_upsert_rejects_unsupported_dialects_before_touching_rows():
+    # No execute attribute: any attempt to write would fail with AttributeError instead
+    connection = SimpleNamespace(dialect=SimpleNamespace(name='postgresql'))
+    with pytest.raises(ValueError, match="postgresql"):
+        upsert_rows(connection, customers_table, customers())
+
+
+def test_orders_of_customers_missing_from_the_export_are_not_quarantined(engine, tmp_path, monkeypatch):
+    load(engine, orders())
+    # The next export only lists customer 2, but customer 1 is already in the database
+    export = pd.DataFrame({'id': [13, 14], 'customer_id': [1, 3], 'total_amount': [7.5, 8.0],
+                           'created_at': ['2024-01-05 09:00', '2024-01-05 10:00']})
+    export.to_csv(tmp_path / 'order.csv', index=False)
+    monkeypatch.setattr(data_import_preparation, 'ORDERS_CSV', str(tmp_path / 'order.csv'))
+    exported_customers = customers().iloc[[1]]
+    quarantine = data_import_preparation.QuarantineWriter(str(tmp_path / 'orders.parquet'))
+
+    data_import_preparation.load_customers_and_orders(
+        engine, exported_customers, {'customers': key_index(exported_customers['customer_id'])}, quarantine,
+        stream=False, chunksize=None, incremental=True, backend='to_sql', workers=1, snapshot=False)
+    quarantine.close()
+
+    assert read_orders(engine)['order_id'].tolist() == [10, 11, 12, 13]
+    rejected = pd.read_parquet(tmp_path / 'orders.parquet')
+    assert rejected['order_id'].astype(int).tolist() == [14]
+    assert rejected['reject_reason'].tolist() == ['unknown_customer_id']
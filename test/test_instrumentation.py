@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+from sqlalchemy import BigInteger, create_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'part_1'))
+
+from common import instrumentation
+from data_import_preparation import load_to_database
+
+
+@pytest.fixture
+def metrics_file(tmp_path, monkeypatch):
+    path = tmp_path / 'metrics.jsonl'
+    monkeypatch.setattr(instrumentation, 'METRICS_FILE', str(path))
+    monkeypatch.setattr(instrumentation, 'METRICS_FORMAT', 'jsonl')
+    return path
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'load.db'}")
+    yield engine
+    engine.dispose()
+
+
+def records(path):
+    with open(path) as metrics_file:
+        return [json.loads(line) for line in metrics_file]
+
+
+def customers():
+    return pd.DataFrame({'customer_id': [1, 2], 'customer_name': ['Ann', 'Bob']})
+
+
+def test_successful_load_is_recorded_as_succeeded(metrics_file, engine):
+    assert load_to_database(customers(), 'customers', {'customer_id': BigInteger()}, engine=engine)
+    [record] = records(metrics_file)
+    assert record['stage'] == 'load_to_database.customers'
+    assert (record['failed'], record['rows_out']) == (False, 2)
+
+
+def test_failed_load_is_recorded_as_failed(metrics_file, engine):
+    # LOAD DATA needs MySQL, so the write fails and load_to_database returns False instead of raising
+    assert not load_to_database(customers(), 'customers', {'customer_id': BigInteger()}, engine=engine,
+                                backend='load_data')
+    [record] = records(metrics_file)
+    assert (record['failed'], record['rows_out']) == (True, 0)
+
+
+def test_stage_that_raises_is_recorded_as_failed(metrics_file):
+    with pytest.raises(RuntimeError):
+        with instrumentation.stage('broken'):
+            raise RuntimeError("boom")
+    assert records(metrics_file)[0]['failed'] is True
@@ -0,0 +1,25 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'part_3'))
+
+from predict_repeat_customers import latest_model_path, load_model, save_model
+
+
+def test_models_saved_in_the_same_second_keep_separate_artifacts(tmp_path):
+    paths = [save_model(f'model {run}', {}, 100, model_dir=str(tmp_path)) for run in range(3)]
+
+    assert len(set(paths)) == 3
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths)
+    assert latest_model_path(str(tmp_path)) == paths[-1]
+    assert load_model(paths[-1])['model'] == 'model 2'
+
+
+def test_second_precision_artifacts_still_sort_before_newer_ones(tmp_path):
+    # Artifacts saved before versions had microseconds
+    old_path = tmp_path / 'repeat_customer-20240101T120000.joblib'
+    old_path.touch()
+    new_path = save_model('model', {}, 100, model_dir=str(tmp_path))
+    assert latest_model_path(str(tmp_path)) == new_path
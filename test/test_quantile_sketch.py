@@ -0,0 +1,68 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.quantile_sketch import DEFAULT_K, QuantileSketch, k_for_error, rank_error
+
+QUANTILES = np.linspace(0.01, 0.99, 99)
+
+
+@pytest.fixture
+def values():
+    # Skewed like order amounts, with ties
+    return np.round(np.random.default_rng(7).lognormal(4, 1, 200_000), 2)
+
+
+def rank_errors(values, estimates):
+    """Distance between each estimate's normalised rank in `values` and the quantile it was asked for."""
+    ordered = np.sort(values)
+    low = np.searchsorted(ordered, estimates, side='left') / len(ordered)
+    high = np.searchsorted(ordered, estimates, side='right') / len(ordered)
+    # With ties an estimate covers a range of ranks; it is exact when the quantile falls inside it
+    return np.maximum(0, np.maximum(low - QUANTILES, QUANTILES - high))
+
+
+def sketch_of(values, k=DEFAULT_K, seed=0, batch_size=10_000):
+    sketch = QuantileSketch(k=k, seed=seed)
+    for start in range(0, len(values), batch_size):
+        sketch.update(values[start:start + batch_size])
+    return sketch
+
+
+@pytest.mark.parametrize('k', [50, DEFAULT_K])
+def test_quantiles_stay_within_the_rank_error(values, k):
+    sketch = sketch_of(values, k)
+    assert len(sketch) == len(values)
+    assert rank_errors(values, sketch.quantile(QUANTILES)).max() <= rank_error(k)
+
+
+def test_merged_sketches_stay_within_the_rank_error(values):
+    halves = np.array_split(values, 2)
+    merged = sketch_of(halves[0], seed=1).merge(sketch_of(halves[1], seed=2))
+    assert len(merged) == len(values)
+    assert rank_errors(values, merged.quantile(QUANTILES)).max() <= rank_error(DEFAULT_K)
+
+
+def test_quantiles_are_close_to_numpy(values):
+    estimates = sketch_of(values).quantile(QUANTILES)
+    # Values a rank error either side of each exact quantile bound the estimate
+    lower = np.quantile(values, np.clip(QUANTILES - rank_error(DEFAULT_K), 0, 1))
+    upper = np.quantile(values, np.clip(QUANTILES + rank_error(DEFAULT_K), 0, 1))
+    assert ((estimates >= lower) & (estimates <= upper)).all()
+
+
+def test_nans_are_ignored_and_an_empty_sketch_has_no_quantiles():
+    sketch = QuantileSketch(seed=0)
+    assert np.isnan(sketch.quantile(0.5))
+    sketch.update([np.nan, 1.0, 2.0, 3.0, np.nan])
+    assert len(sketch) == 3
+    assert sketch.quantile(0.5) == 2.0
+
+
+def test_k_for_error_inverts_rank_error():
+    assert rank_error(k_for_error(0.01)) <= 0.01
+    assert k_for_error(rank_error(DEFAULT_K)) == DEFAULT_K
@@ -0,0 +1,37 @@
+import os
+import sys
+from datetime import date
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'part_2'))
+
+import query_builder
+
+
+@pytest.fixture
+def connection(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dashboard.db'}")
+    pd.DataFrame({
+        'order_id': [1, 2, 3, 4],
+        'customer_id': [1, 1, 2, 2],
+        'total_amount': [10.0, 20.0, 30.0, 40.0],
+        # Incremental loads and snapshots keep the time of day
+        'order_date': pd.to_datetime(['2024-01-01 00:00', '2024-01-31 00:00', '2024-01-31 18:30',
+                                      '2024-02-01 00:00']),
+    }).to_sql('orders', engine, index=False)
+    with engine.connect() as connection:
+        yield connection
+    engine.dispose()
+
+
+def test_orders_placed_during_the_end_date_are_included(connection):
+    params = query_builder.filter_params(date(2024, 1, 1), date(2024, 1, 31))
+    assert connection.execute(query_builder.filtered_count_query(params), params).scalar() == 3
+    assert connection.execute(query_builder.max_amount_query(), params).scalar() == 30.0
+    end_date_orders = connection.execute(query_builder.end_date_orders_query(), params).one()
+    assert (end_date_orders.order_count, end_date_orders.total_revenue) == (2, 50.0)
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'part_1'))
+
+from schema import KeySet, apply_schema, orders_schema
+
+
+def test_key_set_finds_every_key_added_in_earlier_chunks():
+    keys = np.random.default_rng(0).permutation(100_000)
+    seen = KeySet()
+    for chunk in np.array_split(keys, 37):
+        assert not seen.contains(chunk).any()
+        seen.add(chunk)
+        # Runs stay few: their sizes at least double from the newest to the oldest
+        assert len(seen.runs) <= np.log2(len(seen)) + 1
+    assert len(seen) == len(keys)
+    assert seen.contains(keys).all()
+    assert not seen.contains([-1, 100_000]).any()
+
+
+def test_key_set_answers_in_the_order_asked():
+    seen = KeySet()
+    seen.add([30, 10])
+    seen.add([20])
+    assert seen.contains([20, 40, 10, 30, 10, 0]).tolist() == [True, False, True, True, True, False]
+
+
+def test_orders_seen_in_an_earlier_chunk_are_rejected_as_duplicates():
+    def chunk(order_ids):
+        return pd.DataFrame({'order_id': order_ids, 'customer_id': [1] * len(order_ids),
+                             'total_amount': [10.0] * len(order_ids), 'order_date': ['2024-01-01'] * len(order_ids)})
+
+    seen = KeySet()
+    clean, _ = apply_schema(chunk([1, 2, 3]), orders_schema, seen_keys=seen)
+    seen.add(clean['order_id'].to_numpy(dtype='int64'))
+    clean, rejected = apply_schema(chunk([3, 4, 4]), orders_schema, seen_keys=seen)
+
+    assert clean['order_id'].tolist() == [4]
+    assert rejected['order_id'].tolist() == [3, 4]
+    assert rejected['reject_reason'].tolist() == ['duplicate_order_id'] * 2
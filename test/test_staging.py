@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import staging
+
+
+@pytest.fixture(autouse=True)
+def staging_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(staging, 'STAGING_DIR', str(tmp_path))
+
+
+def orders(order_ids, dates, amounts):
+    return pd.DataFrame({'order_id': order_ids, 'total_amount': amounts, 'order_date': pd.to_datetime(dates)})
+
+
+def read_orders():
+    return staging.read_snapshot('orders').sort_values('order_id').reset_index(drop=True)
+
+
+def test_upsert_moves_an_order_whose_date_changed_month():
+    staging.write_snapshot(orders([1, 2, 3], ['2024-01-05', '2024-01-20', '2024-02-01'], [10.0, 20.0, 30.0]),
+                           'orders', date_column='order_date')
+    staging.upsert_snapshot(orders([2], ['2024-03-02'], [25.0]), 'orders', 'order_id', date_column='order_date')
+
+    snapshot = read_orders()
+    assert snapshot['order_id'].tolist() == [1, 2, 3]
+    assert snapshot.loc[snapshot['order_id'] == 2, 'total_amount'].item() == 25.0
+    assert staging.read_snapshot('orders', months=['2024-01'])['order_id'].tolist() == [1]
+
+
+def test_upsert_drops_a_partition_left_empty():
+    staging.write_snapshot(orders([1, 2], ['2024-01-05', '2024-02-01'], [10.0, 20.0]), 'orders',
+                           date_column='order_date')
+    staging.upsert_snapshot(orders([1], ['2024-02-10'], [11.0]), 'orders', 'order_id', date_column='order_date')
+
+    assert read_orders()['order_id'].tolist() == [1, 2]
+    assert not os.path.exists(staging.partition_path('orders', '2024-01'))
+
+
+def test_snapshot_bounds_come_from_the_footer_statistics():
+    staging.write_snapshot(orders([1, 2, 3], ['2024-01-05', '2024-03-20', '2024-02-01'], [10.0, 20.0, 30.0]),
+                           'orders', date_column='order_date')
+    assert staging.snapshot_bounds('orders', 'order_date') == (pd.Timestamp('2024-01-05'),
+                                                               pd.Timestamp('2024-03-20'))